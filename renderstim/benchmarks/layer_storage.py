@@ -0,0 +1,129 @@
+"""
+Bytes per scene and fetch latency of the rendered layers, stored as raw blobs (the current
+`blob@rendered` format) and compressed with each of the available `codecs`.
+
+Every layer is packed with datajoint's blob serializer and written to its own file in a
+local directory, as a file store does. Fetch latency is the time to read the file back,
+unpack it and decode it.
+
+Usage:
+    python -m renderstim.benchmarks.layer_storage                     # synthetic scenes
+    python -m renderstim.benchmarks.layer_storage <dataset_hash> 20   # scenes of RenderedScenes
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+from typing import Dict, List
+import numpy as np
+from datajoint import blob
+
+from ..codecs import CODECS, encode_layer, decode_layer
+
+
+LAYERS = ("scene", "segmentation", "object_coordinates", "normals", "depth")
+
+
+def synthetic_frame(rng, resolution=(144, 256), num_objects=5) -> Dict[str, np.ndarray]:
+    """
+    Layers shaped and typed like the ones RenderedScenes stores: a few elliptic objects
+    on a sloped floor, with smooth normals / coordinates and sampling noise on the scene.
+    """
+    height, width = resolution
+    y, x = np.mgrid[:height, :width] / max(height, width)
+
+    segmentation = np.zeros((height, width), dtype=np.uint8)
+    depth = 0.3 + 0.7 * y
+    for i in range(1, num_objects + 1):
+        cy, cx, r = rng.uniform(0.1, 0.6), rng.uniform(0.1, 0.9), rng.uniform(0.03, 0.12)
+        inside = (y - cy) ** 2 + (x - cx) ** 2 < r ** 2
+        segmentation[inside] = i
+        depth = np.where(inside, 0.2 + 0.5 * ((y - cy) ** 2 + (x - cx) ** 2) / r, depth)
+
+    shading = np.stack([np.sin(3 * x), np.cos(2 * y), x * y], axis=-1)
+    shading = (shading - shading.min()) / (shading.max() - shading.min())
+    scene = 255 * (0.6 * shading[..., 0] + 0.4 * segmentation / num_objects)
+    scene = scene + rng.normal(0, 4, scene.shape)
+
+    return dict(
+        scene=np.clip(scene, 0, 255).astype(np.uint8),
+        segmentation=segmentation[..., None],
+        object_coordinates=(shading * 65535).astype(np.uint16),
+        normals=(shading[..., ::-1] * 65535).astype(np.uint16),
+        depth=(depth[..., None] / depth.max() * 65535).astype(np.uint16),
+    )
+
+
+def fetch_frames(dataset_hash: str, num_scenes: int) -> List[Dict[str, np.ndarray]]:
+    """
+    Layers of the first num_scenes scenes of a dataset in RenderedScenes.
+    """
+    from ..schema.scenes import RenderedScenes
+
+    keys = (RenderedScenes() & dict(dataset_hash=dataset_hash)).fetch("KEY", limit=num_scenes)
+    return [
+        dict(zip(LAYERS, (RenderedScenes() & key).fetch1(*LAYERS)))
+        for key in keys
+    ]
+
+
+def benchmark(frames: List[Dict[str, np.ndarray]], directory: str = None, repeats: int = 3) -> Dict:
+    """
+    Writes the layers of frames in the raw format and with every codec to directory,
+    and measures the stored bytes and the fetch latency.
+
+    Returns:
+        dict per format with bytes_per_scene, fetch_ms_per_scene and encode_ms_per_scene,
+        plus the ratio of the raw bytes to the format's bytes
+    """
+    formats = {"raw": (lambda array: array, lambda value: value)}
+    for codec in CODECS:
+        formats[codec] = (lambda array, codec=codec: encode_layer(array, codec), decode_layer)
+
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        results = {}
+        for name, (encode, decode) in formats.items():
+            start = time.perf_counter()
+            paths = []
+            num_bytes = 0
+            for i, frame in enumerate(frames):
+                for layer, array in frame.items():
+                    if array is None:
+                        continue
+                    path = os.path.join(tmp, f"{name}_{i}_{layer}")
+                    with open(path, "wb") as fp:
+                        num_bytes += fp.write(blob.pack(encode(array)))
+                    paths.append((path, array))
+            encode_time = time.perf_counter() - start
+
+            fetch_time = np.inf
+            for _ in range(repeats):
+                start = time.perf_counter()
+                for path, _ in paths:
+                    with open(path, "rb") as fp:
+                        decode(blob.unpack(fp.read()))
+                fetch_time = min(fetch_time, time.perf_counter() - start)
+
+            for path, array in paths:
+                with open(path, "rb") as fp:
+                    assert np.array_equal(decode(blob.unpack(fp.read())), array), path
+
+            results[name] = dict(
+                bytes_per_scene=num_bytes / len(frames),
+                encode_ms_per_scene=1000 * encode_time / len(frames),
+                fetch_ms_per_scene=1000 * fetch_time / len(frames),
+            )
+
+    for result in results.values():
+        result["compression_ratio"] = results["raw"]["bytes_per_scene"] / result["bytes_per_scene"]
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        frames = fetch_frames(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 20)
+    else:
+        rng = np.random.default_rng(0)
+        frames = [synthetic_frame(rng) for _ in range(20)]
+    print(json.dumps(benchmark(frames), indent=2))
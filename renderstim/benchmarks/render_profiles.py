@@ -0,0 +1,89 @@
+"""
+Time per frame of each render profile (see `latents.dataset.RENDER_PROFILES`), rendered with
+blender through a `RenderWorker`.
+
+Every profile renders the same scenes, as the profile does not change the latents, so the
+grayscale frames are also compared with those of the "quality" profile (kubric's defaults).
+This benchmark needs kubric and blender, the stub backend of `throughput` cannot render.
+
+Usage:
+    python -m renderstim.benchmarks.render_profiles --output profiles.json
+    python -m renderstim.benchmarks.render_profiles --profiles fast balanced --scenes 20 --threads 4
+"""
+import json
+import argparse
+from typing import Dict, List
+import numpy as np
+
+from ..latents.dataset import RENDER_PROFILES, latent_dataset
+from .throughput import STUBBED, environment
+
+
+def bench_profiles(
+    profiles: List[str] = tuple(RENDER_PROFILES),
+    num_scenes: int = 10,
+    threads: int = None,
+    **dataset_kwargs
+) -> List[Dict]:
+    """
+    Renders num_scenes scenes with every profile and reports the mean seconds per frame, of
+    the blender render alone and of the whole scene, and the mean absolute difference of the
+    grayscale frames to the "quality" ones (if "quality" is among the profiles).
+    """
+    if STUBBED:
+        raise ImportError("rendering the profiles needs kubric and blender")
+    from ..generators.worker import RenderWorker
+
+    # the reference is rendered first, so the other profiles can be compared with it
+    profiles = sorted(profiles, key=lambda name: name != "quality")
+    reference = None
+    results = []
+    with RenderWorker(threads=threads) as worker:
+        # untimed warm up, the first render of a session also loads the Cycles kernels
+        worker(latent_dataset(num_scenes=1, root_seed=1, output_layers=["rgba"], **dataset_kwargs)[0])
+        for name in profiles:
+            configs = latent_dataset(
+                num_scenes=num_scenes, root_seed=0, render_profile=name,
+                output_layers=["rgba"], **dataset_kwargs
+            )
+            render, total, frames = [], [], []
+            for config in configs:
+                frame, config = worker(config)
+                render.append(config["timings"]["render"])
+                total.append(sum(seconds for span, seconds in config["timings"].items() if "/" not in span))
+                frames.append(frame["grayscale"].astype(np.float64))
+
+            if name == "quality":
+                reference = frames
+            results.append(dict(
+                benchmark="render_profiles",
+                profile=name,
+                settings=RENDER_PROFILES[name],
+                num_scenes=num_scenes,
+                threads=worker.threads,
+                render_s=float(np.mean(render)),
+                frame_s=float(np.mean(total)),
+                gray_mae=None if reference is None else float(np.mean(
+                    [np.abs(f - r).mean() for f, r in zip(frames, reference)]
+                )),
+            ))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--output", help="json file to write, defaults to stdout")
+    parser.add_argument("--profiles", nargs="+", choices=list(RENDER_PROFILES), default=list(RENDER_PROFILES))
+    parser.add_argument("--scenes", type=int, default=10)
+    parser.add_argument("--threads", type=int, help="blender threads, defaults to the cpu allocation")
+    args = parser.parse_args()
+
+    report = dict(
+        environment=environment(),
+        results=bench_profiles(args.profiles, args.scenes, args.threads)
+    )
+    if args.output is None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=2)
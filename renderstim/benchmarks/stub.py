@@ -0,0 +1,420 @@
+"""
+A stub kubric / blender backend, so that the python side of renderstim can be imported and
+benchmarked on a machine without either.
+
+`install` registers minimal `kubric` and `bpy` modules: textures evaluate a cheap function of
+the texel coordinates, `Blender.render_still` returns synthetic layers with the dtypes and
+shapes of kubric's, and asset sources read bounds from their manifest (`STUB_BOUNDS` for
+manifests that are not local files). Scenes register their objects with `bpy.data`, so
+`render_scene` and `RenderWorker` run end to end. Timings taken with the stub measure
+renderstim's own overhead, not the cost of blender.
+"""
+import os
+import sys
+import json
+import types
+import functools
+import importlib.util
+from typing import Dict, List
+import numpy as np
+
+
+# unit scale bounds the stub asset source reports for the KuBasic shapes
+STUB_BOUNDS = {
+    "cube": [[-1, -1, -1], [1, 1, 1]],
+    "cylinder": [[-1, -1, -1], [1, 1, 1]],
+    "sphere": [[-1, -1, -1], [1, 1, 1]],
+    "cone": [[-1, -1, -1], [1, 1, 1]],
+    "torus": [[-1, -1, -0.3], [1, 1, 0.3]],
+    "gear": [[-1, -1, -0.2], [1, 1, 0.2]],
+    "torus_knot": [[-1, -1, -0.5], [1, 1, 0.5]],
+    "sponge": [[-1, -1, -1], [1, 1, 1]],
+    "spot": [[-0.7, -1, -0.9], [0.7, 1, 0.9]],
+    "suzanne": [[-1, -0.9, -0.7], [1, 0.9, 0.7]],
+}
+
+
+class Color(tuple):
+    def __new__(cls, r, g, b, a=1.0):
+        return tuple.__new__(cls, (r, g, b, a))
+
+    @classmethod
+    def from_name(cls, name):
+        return cls(1.0, 1.0, 1.0) if name == "white" else cls(0.5, 0.5, 0.5)
+
+
+class StubTexture:
+    """
+    bpy texture whose intensity is a cheap function of the coordinates, with the default
+    color ramp, so `evaluate` returns the intensity in all four channels.
+    """
+
+    def __init__(self, name, type):
+        self.name = name
+        self.type = type
+        self.users = 0
+
+    @staticmethod
+    def intensity(x, y):
+        return ((x * 31 + y * 17) % 256) / 255
+
+    def evaluate(self, value):
+        x, y, _ = value
+        v = self.intensity(x, y)
+        return (v, v, v, v)
+
+
+class StubImage:
+    def __init__(self, name, width, height, alpha=True):
+        self.name = name
+        self.size = (width, height)
+        self.pixels = types.SimpleNamespace(foreach_set=lambda values: None)
+        self.users = 0
+        self.type = "IMAGE"
+
+
+class StubCollection(dict):
+    """
+    bpy.data collection, `new` creates an item with the given factory.
+    """
+
+    def __init__(self, factory=None):
+        super().__init__()
+        self.factory = factory or (lambda name, *args, **kwargs: types.SimpleNamespace(name=name, users=0))
+
+    def new(self, name, *args, **kwargs):
+        item = self.factory(name, *args, **kwargs)
+        self[name] = item
+        return item
+
+    def remove(self, item):
+        self.pop(item.name, None)
+
+    def link(self, item):
+        self[item.name] = item
+
+    def unlink(self, item):
+        self.remove(item)
+
+    def __iter__(self):
+        return iter(list(self.values()))
+
+
+class StubVertices:
+    def __init__(self):
+        self.co = np.zeros((0, 3))
+
+    def __len__(self):
+        return len(self.co)
+
+    def add(self, count):
+        self.co = np.concatenate([self.co, np.zeros((count, 3))])
+
+    def foreach_set(self, attribute, values):
+        self.co = np.asarray(values, dtype=np.float64).reshape(-1, 3)
+
+    def foreach_get(self, attribute, values):
+        values[:] = self.co.ravel()
+
+
+class StubMesh:
+    def __init__(self, name):
+        self.name = name
+        self.users = 0
+        self.vertices = StubVertices()
+        self.materials = []
+
+    def clear_geometry(self):
+        self.vertices = StubVertices()
+
+    def update(self):
+        pass
+
+
+class StubMeshObject:
+    """
+    bpy object whose evaluated mesh applies its displace modifiers (along z, at the local
+    coordinates), vectorized over the vertices.
+    """
+
+    def __init__(self, name, data=None):
+        self.name = name
+        self.data = data
+        self.users = 0
+        self.modifiers = StubCollection(lambda name, type: types.SimpleNamespace(
+            name=name, type=type, texture=None, texture_coords="LOCAL", direction="NORMAL",
+            mid_level=0.5, strength=1.0
+        ))
+
+    def evaluated_get(self, depsgraph):
+        return self
+
+    def to_mesh(self):
+        mesh = StubMesh(self.data.name)
+        mesh.vertices.co = self.data.vertices.co.copy()
+        for modifier in self.modifiers.values():
+            if modifier.type == "DISPLACE" and modifier.texture is not None:
+                co = mesh.vertices.co
+                co[:, 2] += modifier.strength * (
+                    modifier.texture.intensity(co[:, 0], co[:, 1]) - modifier.mid_level
+                )
+        return mesh
+
+    def to_mesh_clear(self):
+        pass
+
+
+class StubSockets(dict):
+    def __missing__(self, name):
+        return self.setdefault(name, types.SimpleNamespace(name=name))
+
+
+class StubNodes(list):
+    def new(self, type):
+        node = types.SimpleNamespace(type=type, image=None, inputs=StubSockets(), outputs=StubSockets())
+        self.append(node)
+        return node
+
+
+class StubMaterial:
+    def __init__(self, name):
+        self.name = name
+        self.users = 0
+        self.use_nodes = False
+        self.node_tree = types.SimpleNamespace(
+            nodes=StubNodes(),
+            links=types.SimpleNamespace(new=lambda output, input: (output, input)),
+        )
+
+
+def stub_bpy():
+    return types.SimpleNamespace(
+        data=types.SimpleNamespace(
+            textures=StubCollection(lambda name, type: StubTexture(name, type)),
+            images=StubCollection(StubImage),
+            materials=StubCollection(StubMaterial),
+            meshes=StubCollection(StubMesh),
+            objects=StubCollection(StubMeshObject),
+        ),
+        context=types.SimpleNamespace(
+            scene=types.SimpleNamespace(collection=types.SimpleNamespace(objects=StubCollection())),
+            evaluated_depsgraph_get=lambda: None,
+        ),
+    )
+
+
+class StubObject:
+    """
+    Object with kubric's position / quaternion / aabbox, for placement.
+    """
+
+    def __init__(self, asset_id="cube", scale=1.0, name=None, **kwargs):
+        self.asset_id = asset_id
+        self.name = name
+        self.scale = scale
+        self.position = (0.0, 0.0, 0.0)
+        self.quaternion = (1.0, 0.0, 0.0, 0.0)
+        self.bounds = np.asarray(STUB_BOUNDS.get(asset_id, STUB_BOUNDS["cube"]), dtype=np.float64)
+
+    @property
+    def aabbox(self):
+        from ..latents.placement import object_aabbs
+        aabb = object_aabbs(self.bounds[None], [self.scale], [self.quaternion])[0]
+        return aabb + np.asarray(self.position, dtype=np.float64)
+
+
+class StubScene:
+    """
+    kubric Scene that registers its named assets as objects of bpy.data, as kubric's blender
+    observer does, so that textures can be applied to them.
+    """
+
+    def __init__(self, resolution=(256, 144), bpy=None):
+        self.resolution = resolution
+        self.bpy = bpy
+        self.assets = []
+        self.camera = None
+        self.ambient_illumination = None
+        self.frame_start = 1
+        self.frame_end = 24
+
+    def add(self, assets):
+        for asset in assets if isinstance(assets, (list, tuple)) else [assets]:
+            self.assets.append(asset)
+            name = getattr(asset, "name", None)
+            if name is not None and self.bpy is not None:
+                self.bpy.data.objects.new(name, self.bpy.data.meshes.new(name))
+
+    def __iadd__(self, assets):
+        self.add(assets)
+        return self
+
+    def remove(self, asset):
+        self.assets.remove(asset)
+        name = getattr(asset, "name", None)
+        if self.bpy is not None and name in self.bpy.data.objects:
+            self.bpy.data.objects.remove(self.bpy.data.objects[name])
+
+
+class StubSimulator:
+    """
+    PyBullet without physics, nothing ever overlaps.
+    """
+
+    def __init__(self, scene=None, scratch_dir=None):
+        self.scene = scene
+
+    def check_overlap(self, obj):
+        return False
+
+    def run(self, frame_start=None, frame_end=None):
+        pass
+
+
+def stub_frame(rng, resolution=(144, 256), layers=("rgba", "segmentation", "object_coordinates", "normal", "depth")) -> Dict[str, np.ndarray]:
+    """
+    Layers shaped and typed like the ones `Blender.render_still` returns.
+    """
+    height, width = resolution
+    frame = dict(
+        rgba=rng.integers(0, 256, size=(height, width, 4), dtype=np.uint8),
+        segmentation=rng.integers(0, 7, size=(height, width, 1)).astype(np.uint32),
+        object_coordinates=rng.integers(0, 65536, size=(height, width, 3), dtype=np.uint16),
+        normal=rng.integers(0, 65536, size=(height, width, 3), dtype=np.uint16),
+        depth=rng.uniform(5, 20, size=(height, width, 1)).astype(np.float32),
+    )
+    return {layer: frame[layer] for layer in layers}
+
+
+class StubBlender:
+    """
+    kubric's Blender renderer, with its default Cycles settings.
+    """
+
+    def __init__(self, scene=None, scratch_dir=None):
+        self.scene = scene
+        self.rng = np.random.default_rng(0)
+        view_layer = types.SimpleNamespace(cycles=types.SimpleNamespace())
+        self.blender_scene = types.SimpleNamespace(
+            view_layers={0: view_layer, "AuxOutputs": view_layer},
+            render=types.SimpleNamespace(),
+            cycles=types.SimpleNamespace(adaptive_threshold=0.01),
+        )
+        self.samples_per_pixel = 128
+        self.adaptive_sampling = True
+        self.use_denoising = True
+
+    def render_still(self, return_layers: List[str] = None):
+        # kubric's scene resolution is (width, height)
+        width, height = getattr(self.scene, "resolution", (256, 144))
+        if return_layers is None:
+            return stub_frame(self.rng, (height, width))
+        return stub_frame(self.rng, (height, width), return_layers)
+
+
+def read_json(path):
+    """
+    Contents of a local json file, or a manifest of the KuBasic shapes with `STUB_BOUNDS`.
+    """
+    if os.path.isfile(str(path)):
+        with open(path) as fp:
+            return json.load(fp)
+    return dict(assets={
+        asset_id: dict(kwargs=dict(bounds=bounds)) for asset_id, bounds in STUB_BOUNDS.items()
+    })
+
+
+class StubAssetSource:
+    """
+    Asset source whose objects have the bounds of its manifest. Like kubric's, every source
+    is closed by `done`, and a closed source cannot create objects anymore.
+    """
+
+    instances = []
+
+    def __init__(self, manifest=None):
+        self.manifest = manifest
+        self.assets = read_json(manifest)["assets"]
+        self.is_closed = False
+        StubAssetSource.instances.append(self)
+
+    @classmethod
+    def from_manifest(cls, manifest):
+        return cls(manifest)
+
+    def create(self, asset_id, **kwargs):
+        if self.is_closed:
+            raise RuntimeError(f"The asset source of {self.manifest} is closed")
+        obj = StubObject(asset_id, **kwargs)
+        obj.bounds = np.asarray(self.assets[asset_id]["kwargs"]["bounds"], dtype=np.float64)
+        return obj
+
+    def close(self):
+        self.is_closed = True
+
+    @classmethod
+    def close_all(cls):
+        for source in cls.instances:
+            source.close()
+        cls.instances = []
+
+
+def _module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    return module
+
+
+def install(force: bool = False) -> bool:
+    """
+    Registers the stub `kubric` modules, unless kubric is importable and force is False.
+
+    Returns:
+        True if the stub is installed
+    """
+    if not force and importlib.util.find_spec("kubric") is not None:
+        return False
+
+    bpy = stub_bpy()
+    file_io = _module(
+        "kubric.file_io",
+        read_json=read_json,
+        write_json=lambda data, path: open(path, "w").write(json.dumps(data)),
+    )
+    objects = _module("kubric.core.objects", PhysicalObject=StubObject)
+    core = _module(
+        "kubric.core",
+        objects=objects,
+        scene=types.SimpleNamespace(Scene=functools.partial(StubScene, bpy=bpy)),
+        color=types.SimpleNamespace(Color=Color),
+        DirectionalLight=lambda **kwargs: types.SimpleNamespace(look_at=lambda target: None, **kwargs),
+    )
+    kubric = _module(
+        "kubric",
+        __path__=[],
+        core=core,
+        file_io=file_io,
+        Color=Color,
+        randomness=types.SimpleNamespace(sample_color=lambda strategy, rng: (strategy, Color(0.5, 0.5, 0.5))),
+        as_path=lambda path: path,
+        AssetSource=StubAssetSource,
+        PrincipledBSDFMaterial=lambda **kwargs: types.SimpleNamespace(**kwargs),
+        PerspectiveCamera=lambda **kwargs: types.SimpleNamespace(look_at=lambda target: None, **kwargs),
+        Cube=lambda **kwargs: types.SimpleNamespace(**kwargs),
+        done=StubAssetSource.close_all,
+    )
+    modules = {
+        "kubric": kubric,
+        "kubric.core": core,
+        "kubric.core.objects": objects,
+        "kubric.file_io": file_io,
+        "kubric.simulator": _module("kubric.simulator", PyBullet=StubSimulator),
+        "kubric.renderer": _module("kubric.renderer", Blender=StubBlender),
+        "kubric.safeimport": _module("kubric.safeimport", __path__=[]),
+        "kubric.safeimport.bpy": _module("kubric.safeimport.bpy", bpy=bpy),
+    }
+    sys.modules.update(modules)
+    kubric.simulator = modules["kubric.simulator"]
+    kubric.renderer = modules["kubric.renderer"]
+    kubric.safeimport = modules["kubric.safeimport"]
+    return True
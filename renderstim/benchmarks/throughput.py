@@ -0,0 +1,285 @@
+"""
+Throughput of renderstim's python hot paths, apart from blender: scene config generation,
+hashing and blob packing, texture baking, object placement, the post-processing of
+rendered frames and whole scenes through `render_scene` and `RenderWorker`.
+
+Without kubric installed the stub backend (see `stub`) is used, so the suite runs on any
+linux box. Results are written as json, with the environment they were measured in, so that
+runs can be compared over time.
+
+Usage:
+    python -m renderstim.benchmarks.throughput --output results.json
+    python -m renderstim.benchmarks.throughput --scales 1000 10000 --only latents textures
+"""
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+from typing import Dict, List
+import numpy as np
+
+from . import stub
+
+STUBBED = stub.install()
+
+BENCHMARKS = ("latents", "batch", "textures", "placement", "postprocess", "render")
+
+
+def bench_latents(scales: List[int], **dataset_kwargs) -> List[Dict]:
+    """
+    Time per scene config to generate it with `latent_dataset`, to hash it and to pack it
+    as a DataJoint blob (if datajoint is installed), streaming num_scenes configs.
+    """
+    from ..latents.dataset import latent_dataset
+    from ..latents.hashing import scene_hash
+    try:
+        from datajoint.blob import pack
+    except ImportError:
+        pack = None
+
+    results = []
+    for num_scenes in scales:
+        scenes = latent_dataset(num_scenes=num_scenes, root_seed=0, stream=True, **dataset_kwargs)
+        generate = hashing = packing = 0.0
+        for i in range(num_scenes):
+            start = time.perf_counter()
+            config = scenes[i]
+            generated = time.perf_counter()
+            scene_hash(config)
+            hashed = time.perf_counter()
+            if pack is not None:
+                pack(config)
+            generate += generated - start
+            hashing += hashed - generated
+            packing += time.perf_counter() - hashed
+
+        results.append(dict(
+            benchmark="latents",
+            num_scenes=num_scenes,
+            seconds=generate + hashing + packing,
+            generate_us=1e6 * generate / num_scenes,
+            hash_us=1e6 * hashing / num_scenes,
+            pack_us=1e6 * packing / num_scenes if pack is not None else None,
+        ))
+    return results
+
+
+def bench_batch(scales: List[int], **dataset_kwargs) -> List[Dict]:
+    """
+    Time per scene to draw the latents with the vectorized `sample_batch`.
+    """
+    from ..latents.batch import sample_batch
+
+    results = []
+    for num_scenes in scales:
+        start = time.perf_counter()
+        sample_batch(num_scenes, seed=0, **dataset_kwargs)
+        seconds = time.perf_counter() - start
+        results.append(dict(
+            benchmark="batch",
+            num_scenes=num_scenes,
+            seconds=seconds,
+            sample_us=1e6 * seconds / num_scenes,
+        ))
+    return results
+
+
+def bench_textures(sizes: List[int], texture_type: str = "MARBLE") -> List[Dict]:
+    """
+    Time to bake a texture of each size with `bake_texture`, i.e. the cost of the bulk
+    evaluation per texel.
+    """
+    from ..latents.textures import get_texture, new_texture, bake_texture
+
+    rng = np.random.RandomState(0)
+    results = []
+    for size in sizes:
+        texture = get_texture(texture_type, rng, size=size)
+        start = time.perf_counter()
+        bake_texture(new_texture(texture), x=size, y=size)
+        seconds = time.perf_counter() - start
+        results.append(dict(
+            benchmark="textures",
+            texture_type=texture_type,
+            size=size,
+            seconds=seconds,
+            texel_ns=1e9 * seconds / size ** 2,
+        ))
+    return results
+
+
+def bench_placement(num_scenes: int, **dataset_kwargs) -> List[Dict]:
+    """
+    Time per scene to place the objects with `place_objects` (as with precompute_positions),
+    and with `place_object` against a simulator that reports no overlaps (as with
+    analytic placement at render time), counting the candidates that needed its check.
+    """
+    from ..latents.dataset import latent_dataset, kubasic_manifest
+    from ..latents.placement import place_object, place_objects, shape_bounds
+
+    bounds = shape_bounds(kubasic_manifest())
+    configs = latent_dataset(num_scenes=num_scenes, root_seed=0, **dataset_kwargs)
+
+    start = time.perf_counter()
+    failed = 0
+    for config in configs:
+        try:
+            place_objects(config, bounds)
+        except RuntimeError:
+            failed += 1
+    precomputed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    proposals = physics_checks = analytic_failed = 0
+    for config in configs:
+        rng = np.random.RandomState(config["seed"])
+        floor_top = config["floor_position"][2] + config["floor_scale"][2]
+        placed = []
+        try:
+            for i in range(config["num_objects"]):
+                obj = stub.StubObject(config["object_shapes"][i], scale=config["object_scales"][i])
+                obj.bounds = bounds[config["object_shapes"][i]]
+                obj.quaternion = config["object_quaternions"][i]
+                trials = place_object(obj, stub.StubSimulator(), config["spawn_region"], placed, rng, floor_top)
+                proposals += trials["proposals"]
+                physics_checks += trials["physics_checks"]
+                placed.append(obj.aabbox)
+        except RuntimeError:
+            analytic_failed += 1
+    analytic = time.perf_counter() - start
+
+    return [
+        dict(benchmark="placement", method="place_objects", num_scenes=num_scenes, seconds=precomputed,
+             scene_us=1e6 * precomputed / num_scenes, failed=failed),
+        dict(benchmark="placement", method="place_object", num_scenes=num_scenes, seconds=analytic,
+             scene_us=1e6 * analytic / num_scenes, failed=analytic_failed, proposals=proposals,
+             physics_checks=physics_checks),
+    ]
+
+
+def bench_postprocess(num_frames: int, resolution=(144, 256)) -> List[Dict]:
+    """
+    Time per frame of `postprocess_frame` on synthetic `render_still` output.
+    """
+    from ..generators.render import postprocess_frame
+
+    rng = np.random.default_rng(0)
+    frames = [stub.stub_frame(rng, resolution) for _ in range(num_frames)]
+    start = time.perf_counter()
+    for frame in frames:
+        postprocess_frame(frame, {})
+    seconds = time.perf_counter() - start
+    return [dict(
+        benchmark="postprocess",
+        resolution=list(resolution),
+        num_frames=num_frames,
+        seconds=seconds,
+        frame_ms=1e3 * seconds / num_frames,
+    )]
+
+
+def bench_render(num_scenes: int, **dataset_kwargs) -> List[Dict]:
+    """
+    Time per scene of `render_scene` and of a `RenderWorker` session, with the mean 
+    milliseconds per profiling span. With the stub backend nothing is rendered, so this 
+    is the cost of building the scenes (texture baking, objects, placement) and of the 
+    post-processing; with kubric installed the scenes are really rendered.
+    """
+    from ..latents.dataset import latent_dataset
+    from ..generators.render import render_scene
+    from ..generators.worker import RenderWorker
+
+    def _bench(method, render):
+        # fresh configs, as rendering adds the object positions, which skips placement
+        configs = latent_dataset(num_scenes=num_scenes, root_seed=0, **dataset_kwargs)
+        spans = {}
+        start = time.perf_counter()
+        for config in configs:
+            _, config = render(config)
+            for span, seconds in config["timings"].items():
+                spans[span] = spans.get(span, 0.0) + seconds
+        seconds = time.perf_counter() - start
+        return dict(
+            benchmark="render",
+            method=method,
+            num_scenes=num_scenes,
+            seconds=seconds,
+            scene_ms=1e3 * seconds / num_scenes,
+            span_ms={span: 1e3 * total / num_scenes for span, total in spans.items()},
+        )
+
+    results = [_bench("render_scene", render_scene)]
+    with RenderWorker() as worker:
+        results.append(_bench("worker", worker))
+    return results
+
+
+def environment() -> Dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return dict(
+        timestamp=time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        commit=commit,
+        python=platform.python_version(),
+        numpy=np.__version__,
+        platform=platform.platform(),
+        stub_backend=STUBBED,
+    )
+
+
+def run(
+    only: List[str] = BENCHMARKS,
+    scales: List[int] = (10**3, 10**4, 10**5, 10**6),
+    texture_sizes: List[int] = (256, 512, 1024, 2048, 3192),
+    placement_scenes: int = 1000,
+    frames: int = 100,
+    render_scenes: int = 10,
+) -> Dict:
+    """
+    Runs the selected benchmarks. A benchmark that cannot be imported here is reported 
+    as skipped instead of failing the suite.
+    """
+    benchmarks = dict(
+        latents=lambda: bench_latents(scales),
+        batch=lambda: bench_batch(scales),
+        textures=lambda: bench_textures(texture_sizes),
+        placement=lambda: bench_placement(placement_scenes),
+        postprocess=lambda: bench_postprocess(frames),
+        render=lambda: bench_render(render_scenes),
+    )
+    results = []
+    for name in only:
+        print(f"... running {name} ...", file=sys.stderr)
+        try:
+            results.extend(benchmarks[name]())
+        except ImportError as error:
+            results.append(dict(benchmark=name, skipped=f"{error.__class__.__name__}: {error}"))
+    return dict(environment=environment(), results=results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--output", help="json file to write, defaults to stdout")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument("--scales", nargs="+", type=int, default=[10**3, 10**4, 10**5, 10**6])
+    parser.add_argument("--texture-sizes", nargs="+", type=int, default=[256, 512, 1024, 2048, 3192])
+    parser.add_argument("--placement-scenes", type=int, default=1000)
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--render-scenes", type=int, default=10)
+    args = parser.parse_args()
+
+    report = run(
+        args.only, args.scales, args.texture_sizes, args.placement_scenes, args.frames, 
+        args.render_scenes
+    )
+    if args.output is None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=2)
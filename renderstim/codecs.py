@@ -0,0 +1,84 @@
+import zlib
+from typing import Dict
+import numpy as np
+import datajoint as dj
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def _zstd_compress(data: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=3).compress(data)
+
+
+def _zstd_decompress(data: bytes) -> bytes:
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+CODECS = {
+    "zlib": (lambda data: zlib.compress(data, 1), zlib.decompress),
+}
+if zstandard is not None:
+    CODECS["zstd"] = (_zstd_compress, _zstd_decompress)
+
+DEFAULT_CODEC = "zstd" if "zstd" in CODECS else "zlib"
+
+
+def encode_layer(array: np.ndarray, codec: str = DEFAULT_CODEC) -> Dict:
+    """
+    Losslessly compresses a rendered layer. The bytes of multi-byte dtypes are shuffled
+    (all high bytes, then all low bytes) before compression, which makes uint16 layers
+    such as depth compress much better.
+
+    Returns:
+        dict with the codec, dtype, shape and the compressed bytes as a uint8 array
+    """
+    array = np.ascontiguousarray(array)
+    compress, _ = CODECS[codec]
+    shuffled = array.view(np.uint8).reshape(-1, array.dtype.itemsize).T
+    return dict(
+        codec=codec,
+        dtype=array.dtype.str,
+        shape=list(array.shape),
+        data=np.frombuffer(compress(shuffled.tobytes()), dtype=np.uint8)
+    )
+
+
+def decode_layer(value):
+    """
+    Inverse of `encode_layer`. Raw arrays (layers stored before compression) and None
+    (layers that were not rendered) are returned as they are.
+    """
+    if value is None or isinstance(value, np.ndarray):
+        return value
+
+    _, decompress = CODECS[value["codec"]]
+    dtype = np.dtype(value["dtype"])
+    shuffled = np.frombuffer(decompress(value["data"].tobytes()), dtype=np.uint8)
+    return shuffled.reshape(dtype.itemsize, -1).T.copy().view(dtype).reshape(value["shape"])
+
+
+class LayerAdapter(dj.AttributeAdapter):
+    """
+    Stores rendered layers compressed with `encode_layer` in the `rendered` store,
+    and decodes them on fetch.
+
+    To use it, the adapter has to be in the context of the schema that declares the table
+    (e.g. `from renderstim.codecs import rendered_layer`), and datajoint 0.12 needs
+    the environment variable DJ_SUPPORT_ADAPTED_TYPES=TRUE.
+    """
+    attribute_type = "blob@rendered"
+
+    def __init__(self, codec: str = DEFAULT_CODEC):
+        self.codec = codec
+
+    def put(self, array):
+        return None if array is None else encode_layer(array, self.codec)
+
+    def get(self, value):
+        return decode_layer(value)
+
+
+rendered_layer = LayerAdapter()
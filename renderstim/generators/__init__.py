@@ -1,6 +1,16 @@
 from .render import render_scene
+from .raster import raster_scene
+from .worker import RenderWorker
+from .assets import sync_assets, asset_source
 
-from functools import partial
-from nnfabrik.builder import resolve_fn
 
-resolve_generator = partial(resolve_fn, default_base="generators")
\ No newline at end of file
+def resolve_generator(fn_name):
+    """
+    nnfabrik's `resolve_fn` with "generators" as the default base. nnfabrik is only 
+    imported here, so that the generators can be used (and benchmarked) without it.
+    """
+    from nnfabrik.builder import resolve_fn
+    return resolve_fn(fn_name, default_base="generators")
+
+# generator functions that can be served by a long-lived worker session
+WORKERS = {render_scene: RenderWorker}
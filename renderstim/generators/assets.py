@@ -0,0 +1,70 @@
+import atexit
+import pathlib
+from functools import lru_cache
+
+import kubric as kb
+from kubric import file_io
+
+from ..latents.dataset import KUBASIC_MANIFEST, kubasic_manifest
+
+
+def sync_assets(directory: str, manifest: str = KUBASIC_MANIFEST, overwrite: bool = False):
+    """
+    Copies an asset source (by default KuBasic) to a local directory, once. Asset 
+    archives that are already present are skipped unless overwrite is True.
+
+    Args:
+        directory: local directory the assets are copied to
+        manifest: path or url of the manifest to copy
+        overwrite: copy asset archives even if they exist locally
+
+    Returns:
+        path of the local manifest, which points to the local copies
+    """
+    manifest_path = kb.as_path(manifest)
+    content = file_io.read_json(manifest_path)
+    data_dir = kb.as_path(content.get("data_dir", manifest_path.parent))
+
+    directory = pathlib.Path(directory).absolute()
+    directory.mkdir(parents=True, exist_ok=True)
+
+    for asset_id, entry in content["assets"].items():
+        # same path resolution as kubric's AssetSource
+        path = entry.get("path", "")
+        if path is None:
+            continue
+        if path == "":
+            path = f"{asset_id}.tar.gz"
+
+        local_path = directory / path
+        if local_path.exists() and not overwrite:
+            continue
+        local_path.parent.mkdir(parents=True, exist_ok=True)
+        (data_dir / path).copy(local_path, overwrite=True)
+
+    content["data_dir"] = str(directory)
+    local_manifest = directory / manifest_path.name
+    file_io.write_json(content, local_manifest)
+    return str(local_manifest)
+
+
+@lru_cache(maxsize=None)
+def _asset_source(manifest: str):
+    source = kb.AssetSource.from_manifest(manifest)
+    atexit.register(source.close)
+    return source
+
+
+def asset_source(manifest: str = None):
+    """
+    Process-wide AssetSource per manifest, so the manifest is read and every asset 
+    archive is fetched and unpacked only once per process. The sources are cached by 
+    the resolved manifest, so a default (None) manifest follows changes of 
+    RENDERSTIM_KUBASIC_MANIFEST. The unpacked assets are removed when the process 
+    exits, or earlier by `kb.done()`, after which the cache has to be cleared with 
+    `asset_source.cache_clear()` (as `RenderWorker.close` does).
+    """
+    return _asset_source(kubasic_manifest() if manifest is None else str(manifest))
+
+
+asset_source.cache_clear = _asset_source.cache_clear
@@ -0,0 +1,377 @@
+"""
+A numpy preview renderer for scene configs, without blender or pybullet.
+
+`raster_scene` casts one ray per pixel against analytic versions of the KuBasic shapes and the
+floor, and shades the hits flat (lambert under the sun plus the ambient illumination, no
+textures or shadows). It returns the same layers and metadata as `render_scene`, so it can be
+used as the generator_fn of a dataset to check thousands of configs before rendering them
+with blender. Objects are drawn where they are placed, i.e. as with physics "none".
+"""
+from functools import lru_cache
+from typing import Dict, Tuple
+import numpy as np
+
+from ..latents.placement import effective_region, place_objects, rotation_matrices
+from ..profiling import Profiler, default_sink
+from .render import RETURN_LAYERS, render_views
+
+
+# analytic primitive and its extent (in the object's unit frame) per KuBasic shape,
+# shapes without a simple analytic form are drawn as the closest primitive
+SHAPES = {
+    "cube": ("box", (1.0, 1.0, 1.0)),
+    "cylinder": ("cylinder", (1.0, 1.0, 1.0)),
+    "sphere": ("sphere", (1.0, 1.0, 1.0)),
+    "cone": ("cone", (1.0, 1.0, 1.0)),
+    "torus": ("torus", (1.0, 1.0, 1.0)),
+    "gear": ("cylinder", (1.0, 1.0, 0.25)),
+    "torus_knot": ("torus", (1.0, 1.0, 1.5)),
+    "sponge": ("box", (1.0, 1.0, 1.0)),
+    "spot": ("sphere", (0.7, 1.0, 0.9)),
+    "suzanne": ("sphere", (1.0, 0.9, 0.7)),
+}
+
+# major and minor radius of the torus primitive
+TORUS_RADII = (0.7, 0.3)
+
+SUN_INTENSITY = 0.9
+
+
+def shape_extents() -> Dict[str, np.ndarray]:
+    """
+    Bounds ([min, max] at unit scale) of the shapes as they are drawn, for `place_objects`.
+    """
+    extents = {}
+    for shape, (primitive, factors) in SHAPES.items():
+        factors = np.asarray(factors)
+        if primitive == "torus":
+            factors = factors * (1.0, 1.0, TORUS_RADII[1])
+        extents[shape] = np.stack([-factors, factors])
+    return extents
+
+
+def camera_rays(config: Dict) -> Tuple[np.ndarray, np.ndarray, Tuple[int, int]]:
+    """
+    Origin and (height * width, 3) unit directions of the camera rays, through the pixel
+    centers. The sensor width spans the image width, like blender's default sensor fit
+    for landscape images. The rays are cached per camera, since most datasets have one.
+    """
+    return _camera_rays(
+        tuple(config["resolution"]),
+        tuple(config["camera_position"]),
+        tuple(config["camera_look_at"]),
+        float(config["camera_focal_length"]),
+        float(config["camera_sensor_width"]),
+    )
+
+
+@lru_cache(maxsize=16)
+def _camera_rays(resolution, position, look_at, focal_length, sensor_width):
+    width, height = resolution
+    origin = np.asarray(position, dtype=np.float64)
+    forward = np.asarray(look_at, dtype=np.float64) - origin
+    forward /= np.linalg.norm(forward)
+    right = np.cross(forward, (0.0, 0.0, 1.0))
+    right /= np.linalg.norm(right)
+    up = np.cross(right, forward)
+
+    scale = sensor_width / focal_length
+    x = ((np.arange(width) + 0.5) / width - 0.5) * scale
+    y = (0.5 - (np.arange(height) + 0.5) / height) * scale * height / width
+    y, x = np.meshgrid(y, x, indexing="ij")
+
+    directions = forward + x.reshape(-1, 1) * right + y.reshape(-1, 1) * up
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    origin.flags.writeable = False
+    directions.flags.writeable = False
+    return origin, directions, (height, width)
+
+
+def _solve_quadratic(a, b, c):
+    """
+    Both roots of a t^2 + b t + c = 0 per ray, nan where there are none.
+    """
+    disc = b * b - 4 * a * c
+    root = np.sqrt(np.where(disc >= 0, disc, np.nan))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (-b - root) / (2 * a), (-b + root) / (2 * a)
+
+
+def _nearest(t, valid):
+    return np.where(valid & (t > 1e-6), t, np.inf)
+
+
+def intersect_box(o, d):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t1 = (-1 - o) / d
+        t2 = (1 - o) / d
+    t_near = np.nanmax(np.minimum(t1, t2), axis=1)
+    t_far = np.nanmin(np.maximum(t1, t2), axis=1)
+    t = np.where(t_near > 1e-6, t_near, t_far)
+    return _nearest(t, t_near <= t_far)
+
+
+def intersect_sphere(o, d):
+    a = (d * d).sum(axis=1)
+    b = 2 * (o * d).sum(axis=1)
+    c = (o * o).sum(axis=1) - 1
+    t1, t2 = _solve_quadratic(a, b, c)
+    return np.minimum(_nearest(t1, np.isfinite(t1)), _nearest(t2, np.isfinite(t2)))
+
+
+def intersect_cylinder(o, d):
+    a = d[:, 0] ** 2 + d[:, 1] ** 2
+    b = 2 * (o[:, 0] * d[:, 0] + o[:, 1] * d[:, 1])
+    c = o[:, 0] ** 2 + o[:, 1] ** 2 - 1
+    t = np.full(len(o), np.inf)
+    for root in _solve_quadratic(a, b, c):
+        z = o[:, 2] + root * d[:, 2]
+        t = np.minimum(t, _nearest(root, np.abs(z) <= 1))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for cap in (-1, 1):
+            root = (cap - o[:, 2]) / d[:, 2]
+            p = o[:, :2] + root[:, None] * d[:, :2]
+            t = np.minimum(t, _nearest(root, (p ** 2).sum(axis=1) <= 1))
+    return t
+
+
+def intersect_cone(o, d):
+    # x^2 + y^2 = ((1 - z) / 2)^2 for z in [-1, 1], apex at z = 1
+    k = o[:, 2] - 1
+    a = d[:, 0] ** 2 + d[:, 1] ** 2 - d[:, 2] ** 2 / 4
+    b = 2 * (o[:, 0] * d[:, 0] + o[:, 1] * d[:, 1]) - k * d[:, 2] / 2
+    c = o[:, 0] ** 2 + o[:, 1] ** 2 - k ** 2 / 4
+    t = np.full(len(o), np.inf)
+    for root in _solve_quadratic(a, b, c):
+        z = o[:, 2] + root * d[:, 2]
+        t = np.minimum(t, _nearest(root, np.abs(z) <= 1))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        root = (-1 - o[:, 2]) / d[:, 2]
+    p = o[:, :2] + root[:, None] * d[:, :2]
+    return np.minimum(t, _nearest(root, (p ** 2).sum(axis=1) <= 1))
+
+
+def torus_distance(p):
+    major, minor = TORUS_RADII
+    ring = np.sqrt(p[:, 0] ** 2 + p[:, 1] ** 2) - major
+    return np.sqrt(ring ** 2 + p[:, 2] ** 2) - minor
+
+
+def intersect_torus(o, d, steps: int = 48):
+    """
+    Sphere tracing of the torus, only for the rays that hit its bounding box.
+    """
+    extent = np.array([1.0, 1.0, TORUS_RADII[1]])
+    start = intersect_box(o / extent, d / extent)
+    inside = np.all(np.abs(o) <= extent, axis=1)
+    start = np.where(inside, 0.0, start)
+
+    t = np.full(len(o), np.inf)
+    rays = np.flatnonzero(np.isfinite(start))
+    if len(rays) == 0:
+        return t
+    o, d, march = o[rays], d[rays], start[rays]
+    length = np.linalg.norm(d, axis=1)
+    hit = np.zeros(len(rays), dtype=bool)
+    for _ in range(steps):
+        distance = torus_distance(o + march[:, None] * d)
+        hit |= distance < 1e-3
+        march = np.where(hit, march, march + distance / length)
+    t[rays] = _nearest(march, hit)
+    return t
+
+
+def primitive_normals(primitive: str, p: np.ndarray) -> np.ndarray:
+    """
+    Normals of the primitive at the points p on its surface, in its frame.
+    """
+    if primitive == "box":
+        normals = np.zeros_like(p)
+        axis = np.argmax(np.abs(p), axis=1)
+        normals[np.arange(len(p)), axis] = np.sign(p[np.arange(len(p)), axis])
+    elif primitive == "sphere":
+        normals = p.copy()
+    elif primitive == "cylinder":
+        normals = np.concatenate([p[:, :2], np.zeros_like(p[:, :1])], axis=1)
+        cap = np.abs(p[:, 2]) > 1 - 1e-4
+        normals[cap] = (0.0, 0.0, 1.0)
+        normals[cap, 2] = np.sign(p[cap, 2])
+    elif primitive == "cone":
+        radius = np.sqrt(p[:, 0] ** 2 + p[:, 1] ** 2)
+        normals = np.stack([2 * p[:, 0], 2 * p[:, 1], radius], axis=1)
+        normals[p[:, 2] < -1 + 1e-4] = (0.0, 0.0, -1.0)
+    elif primitive == "torus":
+        ring = np.sqrt(p[:, 0] ** 2 + p[:, 1] ** 2)
+        center = p.copy()
+        center[:, :2] *= (TORUS_RADII[0] / np.maximum(ring, 1e-9))[:, None]
+        center[:, 2] = 0
+        normals = p - center
+    else:
+        raise ValueError(f"Unknown primitive {primitive}")
+    return normals / np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-9)
+
+
+INTERSECT = dict(
+    box=intersect_box,
+    sphere=intersect_sphere,
+    cylinder=intersect_cylinder,
+    cone=intersect_cone,
+    torus=intersect_torus,
+)
+
+
+def preview_positions(config: Dict) -> list:
+    """
+    Object positions of config: the precomputed ones if it has them, else the ones of
+    `place_objects` with the drawn shapes. Scenes whose objects do not fit get positions
+    drawn without the overlap check, since a preview should still show them.
+    """
+    if config.get("object_positions") is not None:
+        return [list(p) for p in config["object_positions"]]
+    try:
+        return place_objects(config, shape_extents())
+    except RuntimeError:
+        rng = np.random.RandomState(config["seed"])
+        extents = shape_extents()
+        positions = []
+        for shape, scale in zip(config["object_shapes"], config["object_scales"]):
+            low, high = effective_region(config["spawn_region"], *(extents[shape] * scale))
+            positions.append(rng.uniform(low, high).tolist())
+        return positions
+
+
+def floor_hits(config: Dict) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Distance (inf for a miss) and floor coordinates of the camera rays on the floor, 
+    cached per camera and floor.
+    """
+    return _floor_hits(
+        tuple(config["resolution"]),
+        tuple(config["camera_position"]),
+        tuple(config["camera_look_at"]),
+        float(config["camera_focal_length"]),
+        float(config["camera_sensor_width"]),
+        tuple(config["floor_position"]),
+        tuple(config["floor_scale"]),
+    )
+
+
+@lru_cache(maxsize=16)
+def _floor_hits(*camera_floor):
+    origin, directions, _ = _camera_rays(*camera_floor[:5])
+    floor_position = np.asarray(camera_floor[5], dtype=np.float64)
+    floor_scale = np.asarray(camera_floor[6], dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = (floor_position[2] + floor_scale[2] - origin[2]) / directions[:, 2]
+    p = origin + t[:, None] * directions
+    t = _nearest(t, np.all(np.abs(p[:, :2] - floor_position[:2]) <= floor_scale[:2], axis=1))
+    coordinates = np.where(np.isfinite(t)[:, None], (p - floor_position) / floor_scale / 2 + 0.5, 0.0)
+    t.flags.writeable = False
+    coordinates.flags.writeable = False
+    return t, coordinates
+
+
+def raster_frame(config: Dict, positions, layers=RETURN_LAYERS) -> Dict[str, np.ndarray]:
+    """
+    Casts the camera rays of config against the floor and the objects at positions.
+
+    Returns:
+        the given layers, as `Blender.render_still` returns them, before `postprocess_frame`
+    """
+    origin, directions, (height, width) = camera_rays(config)
+    num_rays = len(directions)
+
+    # floor, the top face of a cube of half-size floor_scale
+    depth, coordinates = floor_hits(config)
+    depth, coordinates = depth.copy(), coordinates.copy()
+    hit = np.isfinite(depth)[:, None]
+    segmentation = np.zeros(num_rays, dtype=np.uint32)
+    normals = np.where(hit, (0.0, 0.0, 1.0), 0.0)
+    albedo = np.where(hit, config["bg_material"]["color"][:3], 0.0)
+
+    rotations = rotation_matrices(config["object_quaternions"])
+    for i in range(config["num_objects"]):
+        primitive, factors = SHAPES[str(config["object_shapes"][i])]
+        factors = np.asarray(factors) * config["object_scales"][i]
+
+        # only the rays that pass the object's bounding sphere can hit it
+        center = positions[i] - origin
+        along = directions @ center
+        radius = np.linalg.norm(factors)
+        rays = np.flatnonzero(center @ center - along ** 2 <= radius ** 2)
+        if len(rays) == 0:
+            continue
+
+        # rays in the unit frame of the primitive
+        o = ((origin - positions[i]) @ rotations[i]) / factors
+        d = (directions[rays] @ rotations[i]) / factors
+        t = INTERSECT[primitive](np.broadcast_to(o, d.shape), d)
+
+        closer = t < depth[rays]
+        if not closer.any():
+            continue
+        local = o + t[closer, None] * d[closer]
+        rays = rays[closer]
+        depth[rays] = t[closer]
+        segmentation[rays] = i + 1
+        local_normals = primitive_normals(primitive, local) / factors
+        world_normals = local_normals @ rotations[i].T
+        normals[rays] = world_normals / np.linalg.norm(world_normals, axis=1, keepdims=True)
+        coordinates[rays] = np.clip(local / 2 + 0.5, 0, 1)
+        albedo[rays] = config["object_materials"][i]["color"][:3]
+
+    hit = np.isfinite(depth)
+    shape = (height, width)
+    frame = {}
+    if "rgba" in layers:
+        sun = np.asarray(config["sun_position"], dtype=np.float64)
+        sun /= np.linalg.norm(sun)
+        light = config["ambient_illumination"] + SUN_INTENSITY * np.clip(normals @ sun, 0, None)
+        rgba = np.empty((num_rays, 4), dtype=np.float32)
+        np.clip(albedo * light[:, None], 0, 1, out=rgba[:, :3])
+        rgba[:, 3] = hit
+        frame["rgba"] = (rgba * 255 + 0.5).astype(np.uint8).reshape(*shape, 4)
+    if "segmentation" in layers:
+        frame["segmentation"] = segmentation.reshape(*shape, 1)
+    if "object_coordinates" in layers:
+        frame["object_coordinates"] = _uint16(coordinates).reshape(*shape, 3)
+    if "normal" in layers:
+        frame["normal"] = _uint16((normals + 1) / 2).reshape(*shape, 3)
+    if "depth" in layers:
+        # rays that miss everything get the farthest depth in view
+        depth[~hit] = depth[hit].max() if hit.any() else 1.0
+        frame["depth"] = depth.astype(np.float32).reshape(*shape, 1)
+    return frame
+
+
+def _uint16(values: np.ndarray) -> np.ndarray:
+    return (values.astype(np.float32) * 65535 + 0.5).astype(np.uint16)
+
+
+def raster_scene(config: Dict, profiler: Profiler = None):
+    """
+    Renders a scene config with the numpy ray caster instead of blender, as a fast preview.
+    Takes and returns the same as `render_scene`, with config["renderer"] set to "raster".
+    """
+    if profiler is None:
+        profiler = Profiler(sink=default_sink())
+
+    with profiler.span("setup"):
+        positions = preview_positions(config)
+        config["object_positions"] = positions
+
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+    layers = config.get("output_layers", RETURN_LAYERS)
+
+    def render_view(view: Dict = None) -> Dict:
+        if view is None:
+            return raster_frame(config, positions, layers)
+        camera = dict(config, camera_position=view["position"], camera_look_at=view["look_at"])
+        return raster_frame(camera, positions, layers)
+
+    frame = render_views(render_view, config, profiler)
+
+    config["renderer"] = "raster"
+    config.update(profiler.summary())
+    profiler.emit(seed=config["seed"], scene_hash=config.get("scene_hash"))
+    return frame, config
@@ -1,10 +1,13 @@
 import os
-from typing import Dict
+from typing import Callable, Dict
 import numpy as np
 
-from ..latents.utils import figure_out_overlap, rgb2gray, get_array_from_png
+from ..latents.utils import figure_out_overlap, rgb2gray, array_from_png_data
 from ..latents.textures import apply_texture
+from ..latents.placement import place_object
 from ..latents.lights import get_scene_lights
+from .assets import asset_source
+from ..profiling import NULL_PROFILER, Profiler, default_sink
 
 import kubric as kb
 from kubric import core
@@ -15,52 +18,97 @@ import shutil
 import gc
 
 
-def render_scene(config: Dict):
-    """
-    This function takes a config of a single image and creates the scene. Config is a Dict
-    with the following keys:
+RETURN_LAYERS = [
+    "rgba", 
+    "segmentation", 
+    "object_coordinates", 
+    "normal", 
+    "depth"
+]
 
-    Keys:
-        seed: seed for the random number generator
-        resolution: [height, width]
-        spawn_region: [[x_min, y_min, z_min], [x_max, y_max, z_max]]
-        sun_position: [x, y, z]
-        camera_position: [x, y, z]
-        camera_look_at: [x, y, z]
-        camera_focal_length: focal length of the camera
-        camera_sensor_width: sensor width of the camera
-        floor_scale: [x, y, z]
-        floor_position: [x, y, z]
-        bg_texture: dictionary with the background texture
-        bg_material: dictionary with the background material
-        ambient_illumination: ambient illumination of the scene
-        num_objects: number of objects in the scene
-        object_shapes: array of strings for KuBasic object shapes in the scene
-        object_scales: array of scales for the objects in the scene
-        object_angles_of_rotation: array of angles of rotation for the objects in the scene
-        object_axes_of_rotation: array of axes of rotation for the objects in the scene
-        object_quaternions: array of quaternions for the objects in the scene
-        object_textures: array of dictionaries with the textures for the objects in the scene
-        object_materials: array of dictionaries with the materials for the objects in the scene
-        scene_hash: hash of the scene
-        
-    Returns:
-        image: A numpy array representing the image, in 8bit space: [0, 255] as np.unit8
-        config: The config of the scene, same as config input but with the object positions added
+# layers rendered by kubric's "AuxOutputs" view layer
+AUX_LAYERS = ("segmentation", "object_coordinates", "normal")
+
+
+def set_render_passes(blender_scene, layers):
     """
+    Enables only the blender passes that the given return layers are computed from. 
+    The aux view layer is not rendered at all if none of its layers is needed, and the 
+    optical flow and uv passes, which kubric enables by default, are always disabled.
+    """
+    aux_view_layer = blender_scene.view_layers["AuxOutputs"]
+    aux_view_layer.use = any(layer in layers for layer in AUX_LAYERS)
+    aux_view_layer.use_pass_vector = False
+    aux_view_layer.use_pass_uv = False
+    aux_view_layer.use_pass_normal = "normal" in layers
+    if hasattr(aux_view_layer, "use_pass_cryptomatte_object"):
+        aux_view_layer.use_pass_cryptomatte_object = "segmentation" in layers
+    else:
+        aux_view_layer.cycles.use_pass_crypto_object = "segmentation" in layers
+    blender_scene.view_layers[0].use_pass_z = "depth" in layers
 
-    rng = np.random.RandomState(seed=config["seed"])
-    scene = core.scene.Scene(resolution=config["resolution"])
 
-    scratch_dir = f"./scratch_dir/{config['seed']}"
-    os.makedirs(scratch_dir, exist_ok=True)
+def cpu_allocation() -> int:
+    """
+    Number of cpus this process may use: its cpu affinity, capped by the cgroup cpu quota 
+    (e.g. the cpu limit of a kubernetes pod), which `os.cpu_count` does not see.
+    """
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as fp:
+            quota, period = fp.read().split()
+    except (OSError, ValueError):
+        quota = "max"
+    if quota != "max":
+        cpus = min(cpus, max(int(quota) // int(period), 1))
+    return cpus
+
 
-    sim = PyBullet(scene, scratch_dir)
-    renderer = Blender(scene, scratch_dir)
-    kubasic = kb.AssetSource.from_manifest(
-        "gs://kubric-public/assets/KuBasic/KuBasic.json"
+def render_settings(renderer) -> Dict:
+    """
+    The Cycles samples, adaptive sampling and denoiser of a kubric Blender renderer,
+    as a render profile (see `latents.dataset.RENDER_PROFILES`).
+    """
+    return dict(
+        samples=renderer.samples_per_pixel,
+        adaptive_threshold=(
+            renderer.blender_scene.cycles.adaptive_threshold if renderer.adaptive_sampling else None
+        ),
+        denoising=renderer.use_denoising,
     )
 
+
+def apply_render_profile(renderer, profile: Dict = None, threads: int = None):
+    """
+    Sets the Cycles samples, adaptive sampling and denoiser of a kubric Blender renderer 
+    to those of a config's "render_profile", and makes blender render with a fixed number 
+    of threads. If profile is None (legacy configs), the renderer's settings are kept.
+    """
+    if profile is not None:
+        renderer.samples_per_pixel = profile["samples"]
+        renderer.adaptive_sampling = profile["adaptive_threshold"] is not None
+        if profile["adaptive_threshold"] is not None:
+            renderer.blender_scene.cycles.adaptive_threshold = profile["adaptive_threshold"]
+        renderer.use_denoising = profile["denoising"]
+
+    if threads is not None:
+        renderer.blender_scene.render.threads_mode = "FIXED"
+        renderer.blender_scene.render.threads = threads
+
+
+def build_scene(scene, sim, kubasic, config: Dict, profiler=NULL_PROFILER):
+    """
+    Adds the lights, camera, floor and objects described by config to an empty scene, 
+    and places the objects so that they do not overlap, by rejection sampling with 
+    PyBullet or, if config["placement"] is "analytic", with `place_object`. If the config 
+    already holds "object_positions" (see `latent_dataset(precompute_positions=True)`), the 
+    objects are put there and placement is skipped. The object positions are written to 
+    config["object_positions"] and the number of placement trials per object to 
+    config["placement_trials"]. Texture baking, object creation and placement are timed 
+    as spans of profiler, and the texels baked and placement trials counted.
+    """
+    rng = np.random.RandomState(seed=config["seed"])
+
     # Lights
     scene.add(get_scene_lights(position=config["sun_position"]))
     scene.ambient_illumination = kb.Color(
@@ -91,109 +139,280 @@ def render_scene(config: Dict):
 
     scene += floor
     
-    apply_texture(
-        obj_name=f"floor_{config['seed']}", 
-        material_name=f"floor_material_{config['seed']}", 
-        texture=config["bg_texture"]
-    )
+    with profiler.span("textures"):
+        apply_texture(
+            obj_name=f"floor_{config['seed']}", 
+            material_name=f"floor_material_{config['seed']}", 
+            texture=config["bg_texture"], 
+            profiler=profiler
+        )
 
     # Add random objects
+    precomputed = config.get("object_positions")
     positions = []
+    trials = []
+    placed = []
 
     for i in range(config["num_objects"]):
         # create the object
         obj_name = f"obj{i}_{config['seed']}"
-        obj = kubasic.create(
-            asset_id=config["object_shapes"][i], 
-            scale=config["object_scales"][i], 
-            name=obj_name
-        )
+        with profiler.span("objects"):
+            obj = kubasic.create(
+                asset_id=config["object_shapes"][i], 
+                scale=config["object_scales"][i], 
+                name=obj_name
+            )
 
-        # set the object's material
-        obj.material = kb.PrincipledBSDFMaterial(
-            **config["object_materials"][i]
-        )
+            # set the object's material
+            obj.material = kb.PrincipledBSDFMaterial(
+                **config["object_materials"][i]
+            )
 
-        # add the object to the scene
-        scene += obj
+            # add the object to the scene
+            scene += obj
         
         # add texture to the object
-        apply_texture(
-            obj_name=obj_name, 
-            material_name=f"{obj_name}_material", 
-            texture=config["object_textures"][i]
-        )
+        with profiler.span("textures"):
+            apply_texture(
+                obj_name=obj_name, 
+                material_name=f"{obj_name}_material", 
+                texture=config["object_textures"][i], 
+                profiler=profiler
+            )
 
         # apply 3D rotation
         obj.quaternion = config["object_quaternions"][i]
         
-        # figure out scene placement
-        figure_out_overlap(
-            asset=obj, 
-            simulator=sim, 
-            spawn_region=config["spawn_region"], 
-            rng=rng
-        )
+        # figure out scene placement, unless it was done with the latents
+        if precomputed is not None:
+            obj.position = precomputed[i]
+        elif config.get("placement", "rejection") == "analytic":
+            with profiler.span("placement"):
+                trials.append(place_object(
+                    asset=obj, 
+                    simulator=sim, 
+                    spawn_region=config["spawn_region"], 
+                    placed=placed, 
+                    rng=rng,
+                    floor_top=config["floor_position"][2] + config["floor_scale"][2]
+                ))
+            placed.append(obj.aabbox)
+        else:
+            with profiler.span("placement"):
+                num_trials = figure_out_overlap(
+                    asset=obj, 
+                    simulator=sim, 
+                    spawn_region=config["spawn_region"], 
+                    rng=rng
+                )
+            trials.append(dict(proposals=num_trials, physics_checks=num_trials))
+
+        if trials and precomputed is None:
+            profiler.count("placement_proposals", trials[-1]["proposals"])
+            profiler.count("physics_checks", trials[-1]["physics_checks"])
         
         # get the object's metadata
         positions.append(obj.position)
 
     config["object_positions"] = positions
-    # run the simulation
-    sim.run()
-    # renderer.save_state(scratch_dir + "/scene.blend")
+    config["placement_trials"] = trials
+    return scene
 
-    # get scene and complete metadata
-    frame = renderer.render_still(
-        return_layers=[
-            "rgba", 
-            "segmentation", 
-            "object_coordinates", 
-            "normal", 
-            "depth"
-        ]
-    )
-    
+
+def simulate(sim, scene, config: Dict):
+    """
+    Runs the physics simulation as selected by config["physics"]:
+
+    - "full" (default): the whole scene animation, as kubric does by default
+    - "settle": only up to config["physics_frames"] frames (default: the rendered frame 
+        `scene.frame_start`), which gives the same still as "full" at a fraction of the steps
+    - "none": no simulation, the objects are rendered where they were placed
+    """
+    physics = config.get("physics", "full")
+    if physics == "full":
+        sim.run()
+    elif physics == "settle":
+        sim.run(frame_start=0, frame_end=config.get("physics_frames", scene.frame_start))
+    elif physics != "none":
+        raise ValueError(f"Unknown physics mode {physics}")
+
+
+def postprocess_frame(frame: Dict, config: Dict):
+    """
+    Converts the layers returned by `Blender.render_still` to the arrays stored with 
+    RenderedScenes. Layers that were not rendered are skipped. The depth range is 
+    written to config["depth_scaling"].
+    """
     # get grayscale scene from rgba
-    frame["grayscale"] = frame.pop("rgba")
-    frame["grayscale"] = rgb2gray(frame["grayscale"]).astype(np.uint8)
+    if "rgba" in frame:
+        frame["grayscale"] = frame.pop("rgba")
+        frame["grayscale"] = rgb2gray(frame["grayscale"]).astype(np.uint8)
 
     # process segmentation
-    frame['segmentation'] = frame['segmentation'].astype(np.uint8)
-    frame['segmentation'] -= np.min(frame['segmentation'])
+    if "segmentation" in frame:
+        frame['segmentation'] = frame['segmentation'].astype(np.uint8)
+        frame['segmentation'] -= np.min(frame['segmentation'])
 
     # process object coordinates
-    frame["object_coordinates"] = get_array_from_png(
-        frame["object_coordinates"], 
-        scratch_dir + "/object_coordinates.png"
-    )
+    if "object_coordinates" in frame:
+        frame["object_coordinates"] = array_from_png_data(
+            frame["object_coordinates"]
+        )
 
     # process normals
-    frame["normal"] = get_array_from_png(
-        frame["normal"], 
-        scratch_dir + "/normal.png"
-    )
+    if "normal" in frame:
+        frame["normal"] = array_from_png_data(
+            frame["normal"]
+        )
 
     # process depth
-    min_value = np.min(frame["depth"])
-    max_value = np.max(frame["depth"])
-    
-    frame["depth"] = (frame["depth"] - min_value) * 65535 / (max_value - min_value)
-    frame["depth"] = frame["depth"].astype(np.uint16)
+    if "depth" in frame:
+        min_value = np.min(frame["depth"])
+        max_value = np.max(frame["depth"])
+        
+        frame["depth"] = (frame["depth"] - min_value) * 65535 / (max_value - min_value)
+        frame["depth"] = frame["depth"].astype(np.uint16)
 
-    frame["depth"] = get_array_from_png(
-        frame["depth"], 
-        scratch_dir + "/depth.png"
-    )
+        frame["depth"] = array_from_png_data(
+            frame["depth"]
+        )
+
+        config["depth_scaling"] = {
+            "min_depth": min_value.item(), 
+            "max_depth": max_value.item()
+        }
+    return frame
+
+
+
+def render_views(render_view: Callable[[Dict], Dict], config: Dict, profiler=NULL_PROFILER) -> Dict:
+    """
+    Renders and post-processes the views of a built scene. render_view takes a view, a dict 
+    with the camera "position" and "look_at" (or None for the config's own camera), points 
+    the camera there and returns the layers as `Blender.render_still` does.
+
+    Configs without "camera_views" give a single frame. Otherwise every view is rendered 
+    and the layers are stacked along a new first axis, one entry per view, and 
+    config["depth_scaling"] is a list with the depth range of every view.
+    """
+    views = config.get("camera_views")
+    if views is None:
+        with profiler.span("render"):
+            frame = render_view(None)
+        with profiler.span("postprocess"):
+            return postprocess_frame(frame, config)
+
+    frames, depth_scaling = [], []
+    for view in views:
+        with profiler.span("render"):
+            frame = render_view(view)
+        with profiler.span("postprocess"):
+            frames.append(postprocess_frame(frame, config))
+        depth_scaling.append(config.pop("depth_scaling", None))
+    profiler.count("views", len(views))
+
+    if "depth" in frames[0]:
+        config["depth_scaling"] = depth_scaling
+    return {layer: np.stack([frame[layer] for frame in frames]) for layer in frames[0]}
+
+
+def blender_view(scene, renderer, layers) -> Callable[[Dict], Dict]:
+    """
+    `render_views` callable that moves the camera of a kubric scene to the view and 
+    renders the layers with renderer.
+    """
+    def render_view(view: Dict = None) -> Dict:
+        if view is not None:
+            scene.camera.position = view["position"]
+            scene.camera.look_at(view["look_at"])
+        return renderer.render_still(return_layers=layers)
+    return render_view
+
+
+def render_scene(config: Dict, profiler: Profiler = None, threads: int = None):
+    """
+    This function takes a config of a single image and creates the scene. Config is a Dict
+    with the following keys:
+
+    Keys:
+        seed: seed for the random number generator
+        resolution: [width, height]
+        spawn_region: [[x_min, y_min, z_min], [x_max, y_max, z_max]]
+        sun_position: [x, y, z]
+        camera_position: [x, y, z]
+        camera_look_at: [x, y, z]
+        camera_focal_length: focal length of the camera
+        camera_sensor_width: sensor width of the camera
+        floor_scale: [x, y, z]
+        floor_position: [x, y, z]
+        bg_texture: dictionary with the background texture
+        bg_material: dictionary with the background material
+        ambient_illumination: ambient illumination of the scene
+        num_objects: number of objects in the scene
+        object_shapes: array of strings for KuBasic object shapes in the scene
+        object_scales: array of scales for the objects in the scene
+        object_angles_of_rotation: array of angles of rotation for the objects in the scene
+        object_axes_of_rotation: array of axes of rotation for the objects in the scene
+        object_quaternions: array of quaternions for the objects in the scene
+        object_textures: array of dictionaries with the textures for the objects in the scene
+        object_materials: array of dictionaries with the materials for the objects in the scene
+        scene_hash: hash of the scene
+        placement: optional, "rejection" (default) or "analytic" object placement
+        object_positions: optional, precomputed [x, y, z] per object, skips placement
+        physics: optional, "full" (default), "settle" or "none", see `simulate`
+        physics_frames: optional, last simulated frame with "settle" physics
+        output_layers: optional, subset of RETURN_LAYERS to render, defaults to all
+        camera_views: optional, camera poses the scene is rendered from, see `render_views`
+        render_profile: optional, Cycles samples / adaptive_threshold / denoising, see 
+            `apply_render_profile`, keeps kubric's settings if missing
+
+    Args:
+        config: the scene config described above
+        profiler: profiler the stages are timed with, defaults to a fresh one that emits 
+            to `profiling.default_sink`
+        threads: number of threads blender renders with, defaults to `cpu_allocation`
+        
+    Returns:
+        image: A numpy array representing the image, in 8bit space: [0, 255] as np.unit8, 
+            and the other requested layers, stacked per view if the config has camera_views
+        config: The config of the scene, same as config input but with the object positions, 
+            placement trials, depth scaling, per-stage "timings" (in seconds) and "counts" 
+            (texels baked, placement trials) added
+    """
+    if profiler is None:
+        profiler = Profiler(sink=default_sink())
+
+    scratch_dir = f"./scratch_dir/{config['seed']}"
+    os.makedirs(scratch_dir, exist_ok=True)
+
+    with profiler.span("setup"):
+        scene = core.scene.Scene(resolution=config["resolution"])
+        sim = PyBullet(scene, scratch_dir)
+        renderer = Blender(scene, scratch_dir)
+        apply_render_profile(
+            renderer, 
+            config.get("render_profile"), 
+            cpu_allocation() if threads is None else threads
+        )
+        with profiler.span("manifest"):
+            kubasic = asset_source()
+
+        build_scene(scene, sim, kubasic, config, profiler)
+
+    # run the simulation
+    with profiler.span("simulate"):
+        simulate(sim, scene, config)
+    # renderer.save_state(scratch_dir + "/scene.blend")
 
-    config["depth_scaling"] = {
-        "min_depth": min_value.item(), 
-        "max_depth": max_value.item()
-    }
+    # get scene and complete metadata, the scene is built and simulated once for all views
+    layers = config.get("output_layers", RETURN_LAYERS)
+    set_render_passes(renderer.blender_scene, layers)
+    frame = render_views(blender_view(scene, renderer, layers), config, profiler)
 
-    kb.done()
+    config.update(profiler.summary())
+    profiler.emit(seed=config["seed"], scene_hash=config.get("scene_hash"))
 
-    # clean up
+    # clean up, the asset source is kept for the next scene
     shutil.rmtree(scratch_dir)
     gc.collect()
 
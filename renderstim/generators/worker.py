@@ -0,0 +1,126 @@
+import os
+import shutil
+import gc
+from typing import Dict
+
+import kubric as kb
+from kubric import core
+from kubric.safeimport.bpy import bpy
+from kubric.simulator import PyBullet
+from kubric.renderer import Blender
+
+from .render import (
+    RETURN_LAYERS, 
+    apply_render_profile, 
+    blender_view, 
+    build_scene, 
+    cpu_allocation, 
+    render_settings, 
+    render_views, 
+    set_render_passes, 
+    simulate
+)
+from .assets import asset_source
+from ..profiling import Profiler, default_sink
+
+
+def purge_orphans():
+    """
+    Removes materials, textures, images and meshes that are no longer used by any object.
+    """
+    for material in list(bpy.data.materials):
+        if material.users == 0:
+            bpy.data.materials.remove(material)
+
+    for texture in list(bpy.data.textures):
+        if texture.users == 0:
+            bpy.data.textures.remove(texture)
+
+    for image in list(bpy.data.images):
+        # keep blender's own render result buffers
+        if image.users == 0 and image.type not in ("RENDER_RESULT", "COMPOSITING"):
+            bpy.data.images.remove(image)
+
+    for mesh in list(bpy.data.meshes):
+        if mesh.users == 0:
+            bpy.data.meshes.remove(mesh)
+
+
+class RenderWorker:
+    """
+    Renders many scene configs in a single kubric Scene / PyBullet / Blender session.
+
+    Between configs the scene is emptied and orphaned blender data is purged, instead 
+    of rebuilding the simulator and renderer and reloading the KuBasic manifest. 
+    Calling the worker with a config has the same signature and output as `render_scene`.
+
+    Args:
+        scratch_dir: directory for the simulator / renderer files, one per worker
+        threads: number of threads blender renders with, defaults to `cpu_allocation`
+        sink: profiling sink every scene's timings are emitted to, defaults to 
+            `profiling.default_sink`
+
+    Usage:
+        with RenderWorker() as worker:
+            for config in configs:
+                frame, config = worker(config)
+    """
+
+    def __init__(self, scratch_dir: str = None, threads: int = None, sink=None):
+        if scratch_dir is None:
+            scratch_dir = f"./scratch_dir/worker_{os.getpid()}"
+        self.scratch_dir = scratch_dir
+        os.makedirs(scratch_dir, exist_ok=True)
+
+        self.scene = core.scene.Scene()
+        self.sim = PyBullet(self.scene, scratch_dir)
+        self.renderer = Blender(self.scene, scratch_dir)
+        # restored for configs without a render profile, after one with a profile
+        self.default_profile = render_settings(self.renderer)
+        self.threads = cpu_allocation() if threads is None else threads
+        self.kubasic = asset_source()
+        self.sink = default_sink() if sink is None else sink
+        self.num_rendered = 0
+
+    def reset(self):
+        for asset in list(self.scene.assets):
+            self.scene.remove(asset)
+        purge_orphans()
+
+    def __call__(self, config: Dict):
+        profiler = Profiler(sink=self.sink)
+        with profiler.span("setup"):
+            with profiler.span("reset"):
+                self.reset()
+            self.scene.resolution = config["resolution"]
+            profile = config.get("render_profile")
+            apply_render_profile(
+                self.renderer, self.default_profile if profile is None else profile, self.threads
+            )
+            build_scene(self.scene, self.sim, self.kubasic, config, profiler)
+
+        with profiler.span("simulate"):
+            simulate(self.sim, self.scene, config)
+
+        layers = config.get("output_layers", RETURN_LAYERS)
+        set_render_passes(self.renderer.blender_scene, layers)
+        frame = render_views(blender_view(self.scene, self.renderer, layers), config, profiler)
+
+        config.update(profiler.summary())
+        profiler.emit(seed=config["seed"], scene_hash=config.get("scene_hash"))
+        self.num_rendered += 1
+        return frame, config
+
+    def close(self):
+        self.reset()
+        # kb.done() closes every asset source, so the next one has to be created afresh
+        kb.done()
+        asset_source.cache_clear()
+        shutil.rmtree(self.scratch_dir, ignore_errors=True)
+        gc.collect()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,405 @@
+import inspect
+from typing import Dict, List
+import numpy as np
+import kubric as kb
+
+from .dataset import KUBASIC_IDS, TEXTURES, latent_dataset, scene_params, sample_scene, sample_placed_scene, unplaced
+from .textures import TEXTURE_PARAMS, TEXTURE_IMAGES, sample_param
+from .materials import MATERIAL_KEYS
+from .utils import get_quaternions
+from .placement import place_objects
+
+
+# column kind of every texture parameter, across all texture types
+TEXTURE_FIELDS = {}
+for _params in TEXTURE_PARAMS.values():
+    for _name, _kind, _ in _params:
+        TEXTURE_FIELDS.setdefault(_name, _kind)
+
+
+def _empty_column(kind, n):
+    if kind == 'uniform':
+        return np.full(n, np.nan)
+    elif kind in ('randint', 'size'):
+        return np.full(n, -1, dtype=np.int64)
+    elif kind == 'choice':
+        return np.full(n, "", dtype="<U32")
+    return np.full(n, "", dtype=object)
+
+
+def _empty_textures(types):
+    n = len(types)
+    columns = {"type": np.asarray(types, dtype="<U32")}
+    for name, kind in TEXTURE_FIELDS.items():
+        if kind != 'const':
+            columns[name] = _empty_column(kind, n)
+    columns["size"] = _empty_column('size', n)
+    columns["image_path"] = _empty_column('path', n)
+    return columns
+
+
+def _texture_columns(textures: List[Dict]) -> Dict[str, np.ndarray]:
+    columns = _empty_textures([t["type"] for t in textures])
+    for i, texture in enumerate(textures):
+        for name, value in texture.items():
+            if name in columns and name != "type":
+                columns[name][i] = value
+    return columns
+
+
+def _sample_texture_columns(rng, types, size) -> Dict[str, np.ndarray]:
+    columns = _empty_textures(types)
+    for type, params in TEXTURE_PARAMS.items():
+        rows = np.flatnonzero(columns["type"] == type)
+        if len(rows) == 0:
+            continue
+        for name, kind, args in params:
+            if kind != 'const':
+                columns[name][rows] = sample_param(rng, kind, args, size=len(rows))
+        columns["size"][rows] = size
+
+    rows = np.flatnonzero(columns["type"] == "IMAGE")
+    if len(rows) != 0:
+        columns["image_path"][rows] = rng.choice(TEXTURE_IMAGES, size=len(rows))
+    return columns
+
+
+def _texture(columns, i) -> Dict:
+    type = columns["type"][i]
+    if type in TEXTURE_PARAMS:
+        texture = {'type': type}
+        for name, kind, args in TEXTURE_PARAMS[type]:
+            if kind == 'const':
+                texture[name] = args
+            elif kind == 'choice':
+                texture[name] = columns[name][i]
+            else:
+                texture[name] = columns[name][i].item()
+        texture['size'] = columns["size"][i].item()
+        return texture
+    elif type == 'IMAGE':
+        return {'type': 'IMAGE', 'image_path': np.str_(columns["image_path"][i])}
+    return {'type': 'NONE'}
+
+
+def _material(values, color) -> Dict:
+    material = {'color': kb.Color(*color.tolist())}
+    for key, value in zip(MATERIAL_KEYS[1:], values.tolist()):
+        material[key] = value
+    return material
+
+
+class SceneBatch:
+    """
+    Latents of a batch of scenes, stored column-wise as numpy arrays.
+
+    Per-scene latents live in `scenes` (one row per scene), per-object latents in `objects` 
+    (one row per object, scene i owns rows offsets[i]:offsets[i+1]), and the arguments shared 
+    by all scenes in `params`. Texture dicts are split into one column per parameter. 
+    The per-scene config dicts are only built when indexed or iterated, and are the same 
+    as the ones `latent_dataset` builds.
+    """
+
+    def __init__(self, scenes: Dict, objects: Dict, offsets: np.ndarray, params: Dict):
+        self.scenes = scenes
+        self.objects = objects
+        self.offsets = offsets
+        self.params = params
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"scene {index} out of range for a batch of {len(self)}")
+
+        params, scenes, objects = self.params, self.scenes, self.objects
+        start, stop = self.offsets[index], self.offsets[index + 1]
+
+        latents = {}
+        latents["seed"] = scenes["seed"][index]
+        latents["resolution"] = params["resolution"]
+        latents["spawn_region"] = params["spawn_region"]
+        latents["sun_position"] = list(params["sun_position"])
+        latents["sun_position"][0] = scenes["sun_x"][index].item()
+        latents["sun_position"][1] = scenes["sun_y"][index].item()
+        latents["camera_position"] = params["camera_position"]
+        latents["camera_look_at"] = params["camera_look_at"]
+        latents["camera_focal_length"] = params["camera_focal_length"]
+        latents["camera_sensor_width"] = params["camera_sensor_width"]
+        latents["floor_scale"] = params["floor_scale"]
+        latents["floor_position"] = params["floor_position"]
+        if params["texels_per_pixel"] is not None:
+            latents["texels_per_pixel"] = params["texels_per_pixel"]
+        if params.get("placement") is not None:
+            latents["placement"] = params["placement"]
+        for key in ("physics", "physics_frames"):
+            if params.get(key) is not None:
+                latents[key] = params[key]
+        if params.get("output_layers") is not None:
+            latents["output_layers"] = list(params["output_layers"])
+        if params.get("render_profile") is not None:
+            latents["render_profile"] = dict(params["render_profile"])
+
+        latents["bg_texture"] = _texture(scenes["bg_texture"], index)
+        latents["bg_material"] = _material(scenes["bg_material"][index], scenes["bg_color"][index])
+        latents["ambient_illumination"] = scenes["ambient_illumination"][index].item()
+        latents["num_objects"] = scenes["num_objects"][index].item()
+
+        latents["object_shapes"] = objects["shapes"][start:stop].copy()
+        latents["object_scales"] = objects["scales"][start:stop].copy()
+        latents["object_angles_of_rotation"] = objects["angles_of_rotation"][start:stop].copy()
+        latents["object_axes_of_rotation"] = objects["axes_of_rotation"][start:stop].copy()
+        latents["object_quaternions"] = [tuple(q) for q in objects["quaternions"][start:stop]]
+        latents["object_textures"] = [
+            _texture(objects["textures"], k) for k in range(start, stop)
+        ]
+        latents["object_materials"] = [
+            _material(objects["materials"][k], objects["colors"][k]) for k in range(start, stop)
+        ]
+        if "camera_views" in scenes:
+            latents["camera_views"] = [
+                dict(position=position.tolist(), look_at=look_at.tolist()) 
+                for position, look_at in scenes["camera_views"][index]
+            ]
+        if "positions" in objects:
+            positions = objects["positions"][start:stop]
+            # nan positions mark a scene whose objects did not fit
+            latents["object_positions"] = None if np.isnan(positions).any() else positions.tolist()
+        return latents
+
+    def select(self, indices) -> "SceneBatch":
+        """
+        Batch of the scenes at indices (or where a boolean mask is True), in that order.
+        """
+        indices = np.arange(len(self))[indices]
+        rows = np.concatenate(
+            [np.arange(self.offsets[i], self.offsets[i + 1]) for i in indices] + [np.array([], dtype=np.int64)]
+        )
+
+        def take(column, index):
+            if isinstance(column, dict):  # texture columns
+                return {k: v[index] for k, v in column.items()}
+            return column[index]
+
+        scenes = {key: take(column, indices) for key, column in self.scenes.items()}
+        objects = {key: take(column, rows) for key, column in self.objects.items()}
+        offsets = np.concatenate([[0], np.cumsum(scenes["num_objects"])])
+        return SceneBatch(scenes, objects, offsets, self.params)
+
+    def to_arrays(self, max_objects: int) -> Dict[str, np.ndarray]:
+        """
+        Fixed-shape columns of the batch, one row per scene. Texture columns are named 
+        "bg_texture.<param>" / "textures.<param>", and the per-object columns are padded 
+        to (num_scenes, max_objects, ...) and prefixed with "objects.". Padding is nan for 
+        floats, -1 for ints and "" for strings; `num_objects` tells the valid rows apart. 
+        Strings are stored as fixed-width unicode, so that the arrays can be memory-mapped.
+        """
+        def fixed(column):
+            return column.astype(str) if column.dtype == object else column
+
+        arrays = {}
+        for name, column in self.scenes.items():
+            if isinstance(column, dict):
+                arrays.update((f"{name}.{k}", fixed(v)) for k, v in column.items())
+            else:
+                arrays[name] = fixed(column)
+
+        num_objects = np.diff(self.offsets)
+        if np.any(num_objects > max_objects):
+            raise ValueError(f"A scene has {num_objects.max()} objects, more than max_objects={max_objects}")
+        scene_index = np.repeat(np.arange(len(self)), num_objects)
+        object_index = np.arange(self.offsets[-1]) - np.repeat(self.offsets[:-1], num_objects)
+
+        columns = {}
+        for name, column in self.objects.items():
+            if isinstance(column, dict):
+                columns.update((f"{name}.{k}", fixed(v)) for k, v in column.items())
+            else:
+                columns[name] = fixed(column)
+
+        for name, column in columns.items():
+            if column.dtype.kind == "f":
+                fill = np.nan
+            elif column.dtype.kind in "iu":
+                fill = -1
+            else:
+                fill = ""
+            padded = np.full((len(self), max_objects) + column.shape[1:], fill, dtype=column.dtype)
+            padded[scene_index, object_index] = column
+            arrays[f"objects.{name}"] = padded
+        return arrays
+
+    @classmethod
+    def from_configs(cls, configs: List[Dict], params: Dict = None):
+        """
+        Builds a batch from scene config dicts, e.g. the output of `latent_dataset`.
+        If params is None, the shared arguments are taken from the first config.
+        """
+        if params is None:
+            params = {
+                key: configs[0][key] for key in (
+                    "resolution", "spawn_region", "sun_position", "camera_position", 
+                    "camera_look_at", "camera_focal_length", "camera_sensor_width", 
+                    "floor_scale", "floor_position"
+                )
+            }
+            params["texels_per_pixel"] = configs[0].get("texels_per_pixel")
+            for key in (
+                "placement", "physics", "physics_frames", "output_layers", "render_profile", 
+                "camera_views", "num_views", "camera_jitter"
+            ):
+                params[key] = configs[0].get(key)
+
+        num_objects = np.array([c["num_objects"] for c in configs], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(num_objects)])
+        materials = [m for c in configs for m in c["object_materials"]]
+
+        scenes = dict(
+            seed=np.array([c["seed"] for c in configs], dtype=np.int64),
+            sun_x=np.array([c["sun_position"][0] for c in configs], dtype=np.float64),
+            sun_y=np.array([c["sun_position"][1] for c in configs], dtype=np.float64),
+            bg_texture=_texture_columns([c["bg_texture"] for c in configs]),
+            bg_material=np.array(
+                [[c["bg_material"][k] for k in MATERIAL_KEYS[1:]] for c in configs]
+            ).reshape(-1, len(MATERIAL_KEYS) - 1),
+            bg_color=np.array([c["bg_material"]["color"] for c in configs]).reshape(-1, 4),
+            ambient_illumination=np.array([c["ambient_illumination"] for c in configs]),
+            num_objects=num_objects,
+        )
+        if "camera_views" in configs[0]:
+            # (num_scenes, num_views, position / look_at, xyz)
+            scenes["camera_views"] = np.array([
+                [[view["position"], view["look_at"]] for view in c["camera_views"]] for c in configs
+            ], dtype=np.float64).reshape(len(configs), -1, 2, 3)
+        objects = dict(
+            shapes=np.concatenate([c["object_shapes"] for c in configs] + [np.array([], dtype="<U10")]),
+            scales=np.concatenate([c["object_scales"] for c in configs] + [np.array([])]),
+            angles_of_rotation=np.concatenate(
+                [c["object_angles_of_rotation"] for c in configs] + [np.array([])]
+            ),
+            axes_of_rotation=np.concatenate(
+                [c["object_axes_of_rotation"] for c in configs] + [np.array([], dtype="<U1")]
+            ),
+            quaternions=np.array(
+                [q for c in configs for q in c["object_quaternions"]], dtype=np.float64
+            ).reshape(-1, 4),
+            textures=_texture_columns([t for c in configs for t in c["object_textures"]]),
+            materials=np.array(
+                [[m[k] for k in MATERIAL_KEYS[1:]] for m in materials]
+            ).reshape(-1, len(MATERIAL_KEYS) - 1),
+            colors=np.array([m["color"] for m in materials]).reshape(-1, 4),
+        )
+        if any("object_positions" in c for c in configs):
+            objects["positions"] = np.array([
+                p for c in configs 
+                for p in (c["object_positions"] if not unplaced(c) else np.full((c["num_objects"], 3), np.nan))
+            ], dtype=np.float64).reshape(-1, 3)
+        return cls(scenes, objects, offsets, params)
+
+
+def sample_batch(num_scenes: int = 100, seed: int = None, compat: bool = False, **kwargs) -> SceneBatch:
+    """
+    Draws the latents of `num_scenes` scenes as a SceneBatch.
+
+    By default every latent is drawn for all scenes at once, with one vectorized call per 
+    latent (and per texture parameter), from a single RandomState. This follows the same 
+    distributions as `latent_dataset`, but not the same random streams: the "seed" of 
+    such a scene does not reproduce its latents with `sample_scene`. It only tells the 
+    scenes apart and seeds their placement at render time, as in every config.
+
+    Args:
+        num_scenes: number of scenes
+        seed: seed of the batch, None draws a fresh one
+        compat: draw every scene from its own RandomState(scene seed), exactly like 
+            `latent_dataset`, so that the configs are identical for the same scene seeds
+        kwargs: any other `latent_dataset` argument
+
+    Returns:
+        SceneBatch
+    """
+    signature = inspect.signature(latent_dataset).parameters
+    arguments = {
+        key: value.default for key, value in signature.items() 
+        if key not in ("num_scenes", "dataset_comment", "root_seed", "seeds", "stream")
+    }
+    unknown = set(kwargs) - set(signature)
+    if unknown:
+        raise TypeError(f"Unknown latent_dataset arguments: {sorted(unknown)}")
+    arguments.update((k, v) for k, v in kwargs.items() if k in arguments)
+    params = scene_params(**arguments)
+
+    rng = np.random.default_rng(seed)
+    seeds = rng.choice(2147483647, size=num_scenes, replace=False)
+
+    if compat:
+        sample = sample_placed_scene if params["object_bounds"] is not None else sample_scene
+        return SceneBatch.from_configs([sample(s, params) for s in seeds], params)
+
+    rs = np.random.RandomState(rng.integers(2**32))
+    num_objects = rs.randint(params["min_num_objects"], params["max_num_objects"] + 1, size=num_scenes)
+    offsets = np.concatenate([[0], np.cumsum(num_objects)])
+    total = offsets[-1]
+    _, color = kb.randomness.sample_color("gray", rs)  # the gray strategy is a fixed color
+
+    if params["background_type"] == "artificial":
+        bg_types = rs.choice(TEXTURES, size=num_scenes)
+    else:
+        bg_types = np.full(num_scenes, "IMAGE")
+    bg_size = params["bg_texture_size"] or 3192
+
+    scenes = dict(
+        # not the seed of the latents, which all come from rs, see the docstring
+        seed=seeds.astype(np.int64),
+        sun_x=rs.uniform(-1, 1, size=num_scenes),
+        sun_y=rs.uniform(-1, 1, size=num_scenes),
+        bg_texture=_sample_texture_columns(rs, bg_types, bg_size),
+        bg_material=rs.uniform(0, 1, size=(num_scenes, len(MATERIAL_KEYS) - 1)),
+        bg_color=np.tile(np.array(color, dtype=np.float64), (num_scenes, 1)),
+        ambient_illumination=rs.uniform(0.4, 0.7, size=num_scenes),
+        num_objects=num_objects.astype(np.int64),
+    )
+
+    axes = rs.choice(["x", "y", "z"], size=total)
+    angles = rs.uniform(0, 2*np.pi, size=total)
+    objects = dict(
+        shapes=rs.choice(KUBASIC_IDS, size=total),
+        scales=rs.uniform(0.6, 1.2, size=total),
+        angles_of_rotation=angles,
+        axes_of_rotation=axes,
+        quaternions=get_quaternions(axes, angles),
+        textures=_sample_texture_columns(
+            rs, rs.choice(TEXTURES, size=total), params["object_texture_size"] or 256
+        ),
+        materials=rs.uniform(0, 1, size=(total, len(MATERIAL_KEYS) - 1)),
+        colors=np.tile(np.array(color, dtype=np.float64), (total, 1)),
+    )
+    if params["camera_views"] is not None:
+        views = [[view["position"], view["look_at"]] for view in params["camera_views"]]
+        scenes["camera_views"] = np.tile(np.array(views, dtype=np.float64), (num_scenes, 1, 1, 1))
+    elif params["num_views"] is not None:
+        positions = params["camera_position"] + rs.uniform(
+            -1, 1, size=(num_scenes, params["num_views"], 3)
+        ) * params["camera_jitter"]
+        look_ats = np.broadcast_to(np.asarray(params["camera_look_at"], dtype=np.float64), positions.shape)
+        scenes["camera_views"] = np.stack([positions, look_ats], axis=2)
+    batch = SceneBatch(scenes, objects, offsets, params)
+
+    if params["object_bounds"] is not None:
+        # scenes whose objects do not fit are kept with nan positions, as in `sample_placed_scene`
+        positions = []
+        for i in range(num_scenes):
+            try:
+                positions.extend(place_objects(batch[i], params["object_bounds"]))
+            except RuntimeError:
+                positions.extend(np.full((batch.scenes["num_objects"][i], 3), np.nan))
+        batch.objects["positions"] = np.array(positions, dtype=np.float64).reshape(-1, 3)
+    return batch
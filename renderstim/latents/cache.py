@@ -0,0 +1,141 @@
+import os
+import time
+import json
+import hashlib
+import tempfile
+from functools import lru_cache
+import numpy as np
+
+
+def _to_builtin(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Cannot hash {type(value)} in a texture dict")
+
+
+def texture_key(texture, size):
+    """
+    Stable hash of a texture latent dict plus the baked size. Numpy scalars
+    hash the same as their python counterparts.
+    """
+    payload = json.dumps(
+        {"texture": texture, "size": size},
+        sort_keys=True,
+        default=_to_builtin
+    )
+    return hashlib.md5(payload.encode()).hexdigest()
+
+
+class TextureCache:
+    """
+    Content-addressed store of baked texture pixels, one `.npy` file per key,
+    read back memory-mapped.
+
+    Files are written to a temporary name and renamed into place, so workers
+    sharing the same volume only ever see complete files. The file mtime is
+    bumped on every hit and used for LRU eviction once the directory grows
+    past `max_bytes`.
+
+    The directory is not scanned on every put: a cache keeps the size of its
+    last scan plus what it wrote since, and rescans once that exceeds
+    `max_bytes` or after `scan_every` puts, so other workers' writes can push
+    the directory past the budget until then. Temporary files of writers that
+    died before the rename are removed once they are `stale_seconds` old.
+    """
+
+    def __init__(self, directory, max_bytes=16 * 2**30, scan_every=32, stale_seconds=3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.scan_every = scan_every
+        self.stale_seconds = stale_seconds
+        self._total = None  # bytes at the last scan, plus the ones put since
+        self._puts = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".npy")
+
+    def get(self, texture, size):
+        path = self.path(texture_key(texture, size))
+        try:
+            pixels = np.load(path, mmap_mode="r")
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            # missing, evicted by another worker, or not fully readable
+            return None
+        return pixels
+
+    def put(self, texture, size, pixels):
+        path = self.path(texture_key(texture, size))
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                np.save(fp, np.asarray(pixels, dtype=np.float32))
+            nbytes = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._puts += 1
+        if self._total is not None:
+            self._total += nbytes
+        if self._total is None or self._total > self.max_bytes or self._puts >= self.scan_every:
+            self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used files until the directory fits in max_bytes,
+        and the temporary files left behind by writers that died.
+        """
+        entries = []
+        total = 0
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith((".npy", ".tmp")):
+                continue
+            try:
+                stat = entry.stat()
+                if entry.name.endswith(".tmp"):
+                    if now - stat.st_mtime > self.stale_seconds:
+                        os.remove(entry.path)
+                    else:
+                        total += stat.st_size  # still being written
+                    continue
+            except FileNotFoundError:
+                continue  # renamed or removed by another worker
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        # least recently used first
+        for _, nbytes, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # already evicted by another worker
+            total -= nbytes
+
+        self._total = total
+        self._puts = 0
+
+
+@lru_cache(maxsize=None)
+def default_texture_cache():
+    """
+    Texture cache configured through the environment, or None if caching is off.
+
+    RENDERSTIM_TEXTURE_CACHE: directory of the cache, e.g. on a shared volume
+    RENDERSTIM_TEXTURE_CACHE_BYTES: byte budget before eviction kicks in
+    """
+    directory = os.environ.get("RENDERSTIM_TEXTURE_CACHE")
+    if not directory:
+        return None
+    max_bytes = os.environ.get("RENDERSTIM_TEXTURE_CACHE_BYTES")
+    if max_bytes is None:
+        return TextureCache(directory)
+    return TextureCache(directory, max_bytes=int(max_bytes))
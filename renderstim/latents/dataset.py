@@ -1,10 +1,16 @@
+import os
 import numpy as np
-from typing import Dict, List
-from .textures import get_texture
+from collections.abc import Sequence
+from functools import lru_cache
+from typing import Dict, Iterator, List, Set, Tuple, Union
+from .textures import get_texture, texture_sizes
 from .materials import get_material
 from .utils import get_quaternion
+from .placement import PLACEMENTS, shape_bounds, place_objects
 
 
+KUBASIC_MANIFEST = "gs://kubric-public/assets/KuBasic/KuBasic.json"
+
 KUBASIC_IDS = (
     "cube", 
     "cylinder", 
@@ -18,6 +24,31 @@ KUBASIC_IDS = (
     "suzanne"
 )
 
+
+
+def kubasic_manifest():
+    """
+    Manifest used for the KuBasic shapes. Set RENDERSTIM_KUBASIC_MANIFEST to the 
+    manifest written by `sync_assets` to render from a local copy.
+    """
+    return os.environ.get("RENDERSTIM_KUBASIC_MANIFEST", KUBASIC_MANIFEST)
+
+
+PHYSICS = ("none", "settle", "full")
+
+# kubric layers RenderedScenes can store, rgba is stored as the grayscale scene
+OUTPUT_LAYERS = ("rgba", "segmentation", "object_coordinates", "normal", "depth")
+
+# Cycles settings per render profile: samples per pixel, the noise threshold of adaptive 
+# sampling (None turns it off) and the denoiser. "quality" are the defaults of kubric's 
+# renderer, adaptive sampling with Cycles' default threshold. Legacy configs without a 
+# "render_profile" leave the renderer's settings as they are.
+RENDER_PROFILES = {
+    "quality": dict(samples=128, adaptive_threshold=0.01, denoising=True),
+    "balanced": dict(samples=64, adaptive_threshold=0.01, denoising=True),
+    "fast": dict(samples=16, adaptive_threshold=0.05, denoising=True),
+}
+
 TEXTURES = [
     'NONE',
     # 'IMAGE',
@@ -46,8 +77,21 @@ def latent_dataset(
     floor_scale: List[float] = [20.0, 40.0, 0.01],
     floor_position: List[float] = [0.0, 0.0, 0.0],
     background_type: str = "artificial",
-    dataset_comment: str = "test"
-) -> List[Dict]:
+    dataset_comment: str = "test",
+    texels_per_pixel: float = None,
+    placement: str = None,
+    precompute_positions: bool = False,
+    physics: str = None,
+    physics_frames: int = None,
+    output_layers: List[str] = None,
+    render_profile: Union[str, Dict] = None,
+    camera_views: List[Dict] = None,
+    num_views: int = None,
+    camera_jitter: List[float] = None,
+    root_seed: int = None,
+    seeds: List[int] = None,
+    stream: bool = False
+) -> Union[List[Dict], "LatentScenes"]:
     
     """
     A dataset returns a list of dictionaries, each dictionary is the config for a single scene.
@@ -59,7 +103,7 @@ def latent_dataset(
 
     Args:
         num_scenes: number of scenes to generate scene configs for
-        resolution: (height, width)
+        resolution: (width, height)
         min_num_objects: minimum number of objects in a scene
         max_num_objects: maximum number of objects in a scene
         spawn_region: [[min_x, min_y, min_z], [max_x, max_y, max_z]]
@@ -72,10 +116,166 @@ def latent_dataset(
         floor_position: [x, y, z]
         background_type: "artificial" or "realistic"
         dataset_comment: str describing the dataset
+        texels_per_pixel: if given, background and object texture sizes are derived from the 
+            resolution, camera and floor to give this many texels along each side of a 
+            screen pixel (see `textures.texture_sizes`). 
+            If None, the legacy sizes (3192 for the background, 256 for objects) are used.
+        placement: object placement at render time, "rejection" samples positions until 
+            PyBullet finds no overlap, "analytic" only proposes positions whose bounding boxes 
+            are free (see `placement.place_object`). None keeps the legacy rejection sampling.
+        precompute_positions: if True, the object positions are computed here from the KuBasic 
+            bounding boxes and stored in the config as "object_positions", and the renderer 
+            skips placement. Scenes whose objects do not fit keep their latents, with 
+            "object_positions" None, and are placed at render time (see `sample_placed_scene`).
+        physics: physics simulation before rendering the still, "full", "settle" (only up to 
+            physics_frames) or "none". None keeps the legacy full simulation.
+        physics_frames: last simulated frame with "settle" physics, None simulates up to 
+            the rendered frame
+        output_layers: subset of OUTPUT_LAYERS to render and store, e.g. ["rgba", "segmentation"]. 
+            None renders all of them.
+        render_profile: Cycles settings the scenes are rendered with, the name of one of 
+            RENDER_PROFILES or a dict overriding some of the "quality" settings, e.g. 
+            {"samples": 32}. The resolved settings are stored in the config, so they are 
+            part of the scene hash. None keeps the renderer's settings (kubric's defaults).
+        camera_views: camera poses every scene is rendered from, after building and simulating 
+            it once, as dicts with a "position" [x, y, z] and optionally a "look_at" [x, y, z] 
+            (defaults to camera_look_at). None renders the single camera_position view.
+        num_views: number of views per scene drawn with camera_jitter, instead of camera_views
+        camera_jitter: [dx, dy, dz], the views' positions are drawn uniformly within 
+            camera_position +- camera_jitter, looking at camera_look_at
+        root_seed: seed of the dataset. If given, scene i is drawn with `scene_seed(root_seed, i)`, 
+            so the same arguments give the same scenes, and any scene can be recomputed 
+            from (root_seed, i). None draws fresh seeds on every call.
+        seeds: seeds of the scenes to generate, instead of num_scenes freshly drawn ones, 
+            e.g. to regenerate or replace specific scenes
+        stream: if True, return a `LatentScenes` sequence that builds each scene config 
+            only when it is indexed or iterated over
 
     Returns:
-        A list of dictionaries, each dictionary is the config for a single image.
+        A list of dictionaries, each dictionary is the config for a single image 
+        (or a lazy sequence of them if stream is True).
+    """
+
+    params = scene_params(
+        resolution=resolution, 
+        min_num_objects=min_num_objects, 
+        max_num_objects=max_num_objects, 
+        spawn_region=spawn_region, 
+        sun_position=sun_position, 
+        camera_position=camera_position, 
+        camera_look_at=camera_look_at, 
+        camera_focal_length=camera_focal_length, 
+        camera_sensor_width=camera_sensor_width, 
+        floor_scale=floor_scale, 
+        floor_position=floor_position, 
+        background_type=background_type, 
+        texels_per_pixel=texels_per_pixel, 
+        placement=placement, 
+        precompute_positions=precompute_positions, 
+        physics=physics, 
+        physics_frames=physics_frames, 
+        output_layers=output_layers, 
+        render_profile=render_profile, 
+        camera_views=camera_views, 
+        num_views=num_views, 
+        camera_jitter=camera_jitter
+    )
+
+    if seeds is None and root_seed is not None:
+        seeds = RootSeeds(root_seed, range(num_scenes))
+    elif seeds is None:
+        rng = np.random.default_rng()
+        seeds = rng.choice(2147483647, size=num_scenes, replace=False)
+    sample = sample_placed_scene if precompute_positions else sample_scene
+    scenes = LatentScenes(seeds, params, sample)
+    return scenes if stream else list(scenes)
+
+
+def indexed_scenes(scenes: Sequence, skip: Set[int] = frozenset()) -> Iterator[Tuple[int, Dict]]:
+    """
+    (index, config) of the scenes whose index is not in skip, e.g. when a fill is resumed. 
+    The skipped scenes are not built if scenes is a `LatentScenes`. Without skip, scenes 
+    can be any iterable.
+    """
+    if not skip:
+        return enumerate(scenes)
+    return ((index, scenes[index]) for index in range(len(scenes)) if index not in skip)
+
+
+class RootSeeds(Sequence):
+    """
+    Lazy sequence of the seeds `scene_seed(root_seed, i)` for i in indices.
+    """
+
+    def __init__(self, root_seed: int, indices: range):
+        self.root_seed = root_seed
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return RootSeeds(self.root_seed, self.indices[index])
+        return scene_seed(self.root_seed, self.indices[index])
+
+
+class LatentScenes(Sequence):
+    """
+    The scene configs of `latent_dataset` as a lazy sequence: scene i is built from its seed 
+    only when it is indexed, and slices are again lazy. With a root_seed the seeds are 
+    computed on demand as well, so e.g. a worker can build its own shard of a dataset with 
+    `latent_dataset(..., stream=True)[start:stop]` without the other scenes.
+
+    Args:
+        seeds: sequence of scene seeds
+        params: shared scene parameters, as returned by `scene_params`
+        sample: `sample_scene` (default) or `sample_placed_scene`
+    """
+
+    def __init__(self, seeds, params: Dict, sample=None):
+        self.seeds = seeds
+        self.params = params
+        self.sample = sample_scene if sample is None else sample
+
+    def __len__(self):
+        return len(self.seeds)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return LatentScenes(self.seeds[index], self.params, self.sample)
+        return self.sample(self.seeds[index], self.params)
+
+
+def scene_params(
+    resolution: List[int],
+    min_num_objects: int,
+    max_num_objects: int,
+    spawn_region: List[List[float]],
+    sun_position: List[float],
+    camera_position: List[float],
+    camera_look_at: List[float],
+    camera_focal_length: float,
+    camera_sensor_width: float,
+    floor_scale: List[float],
+    floor_position: List[float],
+    background_type: str,
+    texels_per_pixel: float,
+    placement: str = None,
+    precompute_positions: bool = False,
+    physics: str = None,
+    physics_frames: int = None,
+    output_layers: List[str] = None,
+    render_profile: Union[str, Dict] = None,
+    camera_views: List[Dict] = None,
+    num_views: int = None,
+    camera_jitter: List[float] = None
+) -> Dict:
     """
+    Validates the `latent_dataset` arguments that are shared by all scenes and 
+    returns them as a dict, together with the derived texture sizes.
+    """
+
 
     if len(resolution) != 2:
         raise ValueError(
@@ -117,104 +317,359 @@ def latent_dataset(
         raise ValueError(
             "floor position should be a list of length 3, e.g., [0.0, 0.0, 0.0]"
         )
-        
-    rng = np.random.default_rng()
-    seeds = rng.choice(2147483647, size=num_scenes, replace=False)
-    scenes = []
-    
-    for seed in seeds:
-        latents = {}
 
-        rng = np.random.RandomState(seed)
-        latents["seed"] = seed
+    if background_type not in ("artificial", "realistic"):
+        raise ValueError(
+            "Invalid background type: background_type can be either 'artificial' or 'realistic'"
+        )
 
-        # set resolution
-        latents["resolution"] = resolution
+    if placement is not None and placement not in PLACEMENTS:
+        raise ValueError(
+            f"Invalid placement: placement can be one of {PLACEMENTS}"
+        )
 
-        # set spawn region
-        latents["spawn_region"] = spawn_region
+    if physics is not None and physics not in PHYSICS:
+        raise ValueError(
+            f"Invalid physics: physics can be one of {PHYSICS}"
+        )
 
-        # set sun position
-        latents["sun_position"] = sun_position
-        latents["sun_position"][0] = rng.uniform(-1, 1)
-        latents["sun_position"][1] = rng.uniform(-1, 1)
+    if physics_frames is not None and (physics != "settle" or physics_frames < 0):
+        raise ValueError(
+            "physics frames should be a non-negative int, and only set with physics='settle'"
+        )
 
-        # set camera position
-        latents["camera_position"] = camera_position
+    if output_layers is not None:
+        unknown = set(output_layers) - set(OUTPUT_LAYERS)
+        if unknown or len(output_layers) == 0:
+            raise ValueError(
+                f"output layers should be a non-empty subset of {OUTPUT_LAYERS}, got {sorted(unknown)}"
+            )
+        # canonical order, so that the same selection always gives the same config
+        output_layers = [layer for layer in OUTPUT_LAYERS if layer in output_layers]
 
-        # set camera look at
-        latents["camera_look_at"] = camera_look_at
+    if render_profile is not None:
+        render_profile = resolve_render_profile(render_profile)
 
-        # set camera focal length
-        latents["camera_focal_length"] = camera_focal_length
+    if camera_views is not None:
+        if num_views is not None or camera_jitter is not None:
+            raise ValueError(
+                "camera views are either given as camera_views or drawn with num_views and camera_jitter"
+            )
+        if len(camera_views) == 0 or any(set(view) - {"position", "look_at"} for view in camera_views):
+            raise ValueError(
+                "camera views should be a non-empty list of dicts with a position and optionally a look_at"
+            )
+        # floats, so that e.g. a position of [1, -8, 3] hashes the same as [1.0, -8.0, 3.0]
+        camera_views = [
+            dict(
+                position=[float(v) for v in view["position"]], 
+                look_at=[float(v) for v in view.get("look_at", camera_look_at)]
+            ) for view in camera_views
+        ]
+        if any(len(view["position"]) != 3 or len(view["look_at"]) != 3 for view in camera_views):
+            raise ValueError(
+                "camera view positions and look ats should be lists of length 3, e.g., [0.0, -8.0, 3.6]"
+            )
 
-        # set camera sensor width
-        latents["camera_sensor_width"] = camera_sensor_width
+    if (num_views is None) != (camera_jitter is None):
+        raise ValueError(
+            "num views and camera jitter should be given together"
+        )
+    if num_views is not None and (num_views < 1 or len(camera_jitter) != 3):
+        raise ValueError(
+            "num views should be a positive int and camera jitter a list of length 3, e.g., [0.5, 0.5, 0.2]"
+        )
 
-        # set floor scale
-        latents["floor_scale"] = floor_scale
+    if precompute_positions:
+        object_bounds = shape_bounds(kubasic_manifest())
+        missing = set(KUBASIC_IDS) - set(object_bounds)
+        if missing:
+            raise ValueError(
+                f"The KuBasic manifest has no bounds for {sorted(missing)}"
+            )
+    else:
+        object_bounds = None
 
-        # set floor position
-        latents["floor_position"] = floor_position
+    if texels_per_pixel is None:
+        bg_texture_size, object_texture_size = None, None
+    elif texels_per_pixel <= 0:
+        raise ValueError(
+            "texels per pixel should be a positive number, e.g., 1.0"
+        )
+    else:
+        bg_texture_size, object_texture_size = texture_sizes(
+            texels_per_pixel, 
+            resolution, 
+            camera_position, 
+            camera_look_at, 
+            camera_focal_length, 
+            camera_sensor_width, 
+            floor_scale, 
+            floor_position
+        )
 
-        # set background type
-        if background_type == "artificial":
-            latents["bg_texture"] = get_texture(
-                rng.choice(TEXTURES), rng, True
-            )
-        elif background_type == "realistic":
-            latents["bg_texture"] = get_texture(
-                "IMAGE", rng, True
-            )
-        else:
+    return dict(
+        resolution=resolution, 
+        min_num_objects=min_num_objects, 
+        max_num_objects=max_num_objects, 
+        spawn_region=spawn_region, 
+        sun_position=sun_position, 
+        camera_position=camera_position, 
+        camera_look_at=camera_look_at, 
+        camera_focal_length=camera_focal_length, 
+        camera_sensor_width=camera_sensor_width, 
+        floor_scale=floor_scale, 
+        floor_position=floor_position, 
+        background_type=background_type, 
+        texels_per_pixel=texels_per_pixel, 
+        placement=placement, 
+        object_bounds=object_bounds, 
+        physics=physics, 
+        physics_frames=physics_frames, 
+        output_layers=output_layers, 
+        render_profile=render_profile, 
+        camera_views=camera_views, 
+        num_views=num_views, 
+        camera_jitter=camera_jitter, 
+        bg_texture_size=bg_texture_size, 
+        object_texture_size=object_texture_size
+    )
+
+
+def resolve_render_profile(render_profile: Union[str, Dict]) -> Dict:
+    """
+    The Cycles settings of a render profile, given by name or as a dict of settings 
+    that override the "quality" ones.
+    """
+    if isinstance(render_profile, str):
+        if render_profile not in RENDER_PROFILES:
             raise ValueError(
-                "Invalid background type: background_type can be either 'artificial' or 'realistic'"
+                f"Invalid render profile: render_profile can be one of {tuple(RENDER_PROFILES)}"
             )
+        return dict(RENDER_PROFILES[render_profile])
 
-        # set the background material
-        latents["bg_material"] = get_material(rng)
-        
-        # set ambient illumination
-        latents["ambient_illumination"] = rng.uniform(0.4, 0.7)
-        
-        # object properties
-        # number of objects in the scene 
-        # visibility and overlap depend on camera position and spawn region
-        latents["num_objects"] = rng.randint(min_num_objects, max_num_objects + 1)
-        
-        # choose #num_objects KuBasic shapes
-        latents["object_shapes"] = rng.choice(KUBASIC_IDS, size=latents["num_objects"])
-        
-        # set #num_objects scales
-        latents["object_scales"] = rng.uniform(0.6, 1.2, size=latents["num_objects"])
-        
-        # set #num_objects angles of rotation in (0, 2pi)
-        latents["object_angles_of_rotation"] = rng.uniform(0, 2*np.pi, size=latents["num_objects"])
-        
-        # choose axes of rotation for the objects
-        latents["object_axes_of_rotation"] = rng.choice(["x", "y", "z"], size=latents["num_objects"])
-        
-        # get object quaternions
-        latents["object_quaternions"] = [
-            get_quaternion(
-                latents["object_axes_of_rotation"][k],
-                latents["object_angles_of_rotation"][k]
-            ) for k in range(latents["num_objects"])
+    unknown = set(render_profile) - set(RENDER_PROFILES["quality"])
+    if unknown:
+        raise ValueError(
+            f"render profile settings should be a subset of {tuple(RENDER_PROFILES['quality'])}, got {sorted(unknown)}"
+        )
+    profile = dict(RENDER_PROFILES["quality"], **render_profile)
+    if not isinstance(profile["samples"], (int, np.integer)) or profile["samples"] < 1:
+        raise ValueError(
+            "render profile samples should be a positive int, e.g., 64"
+        )
+    if profile["adaptive_threshold"] is not None and not profile["adaptive_threshold"] > 0:
+        raise ValueError(
+            "render profile adaptive threshold should be a positive number or None, e.g., 0.01"
+        )
+    if not isinstance(profile["denoising"], bool):
+        raise ValueError(
+            "render profile denoising should be True or False"
+        )
+    # plain python types, so that the config hashes and serializes the same everywhere
+    profile["samples"] = int(profile["samples"])
+    if profile["adaptive_threshold"] is not None:
+        profile["adaptive_threshold"] = float(profile["adaptive_threshold"])
+    return profile
+
+
+def sample_scene(seed: int, params: Dict) -> Dict:
+    """
+    Draws the latents of a single scene from a RandomState seeded with `seed`.
+
+    Args:
+        seed: seed of the scene, also used for object placement at render time
+        params: shared scene parameters, as returned by `scene_params`
+
+    Returns:
+        the config of the scene
+    """
+    latents = {}
+
+    rng = np.random.RandomState(seed)
+    latents["seed"] = seed
+
+    # set resolution
+    latents["resolution"] = params["resolution"]
+
+    # set spawn region
+    latents["spawn_region"] = params["spawn_region"]
+
+    # set sun position, copied: configs built before this shared one list, and so all 
+    # carry the sun position drawn for the last scene of their dataset
+    latents["sun_position"] = list(params["sun_position"])
+    latents["sun_position"][0] = rng.uniform(-1, 1)
+    latents["sun_position"][1] = rng.uniform(-1, 1)
+
+    # set camera position
+    latents["camera_position"] = params["camera_position"]
+
+    # set camera look at
+    latents["camera_look_at"] = params["camera_look_at"]
+
+    # set camera focal length
+    latents["camera_focal_length"] = params["camera_focal_length"]
+
+    # set camera sensor width
+    latents["camera_sensor_width"] = params["camera_sensor_width"]
+
+    # set floor scale
+    latents["floor_scale"] = params["floor_scale"]
+
+    # set floor position
+    latents["floor_position"] = params["floor_position"]
+
+    # set texture resolution policy, legacy configs don't carry it
+    if params["texels_per_pixel"] is not None:
+        latents["texels_per_pixel"] = params["texels_per_pixel"]
+
+    # set placement method, legacy configs don't carry it
+    if params["placement"] is not None:
+        latents["placement"] = params["placement"]
+
+    # set physics mode, legacy configs don't carry it
+    if params["physics"] is not None:
+        latents["physics"] = params["physics"]
+    if params["physics_frames"] is not None:
+        latents["physics_frames"] = params["physics_frames"]
+
+    # set rendered layers, legacy configs don't carry them
+    if params["output_layers"] is not None:
+        latents["output_layers"] = list(params["output_layers"])
+
+    # set render settings, legacy configs don't carry them
+    if params["render_profile"] is not None:
+        latents["render_profile"] = dict(params["render_profile"])
+
+    # set background type
+    if params["background_type"] == "artificial":
+        latents["bg_texture"] = get_texture(
+            rng.choice(TEXTURES), rng, True, params["bg_texture_size"]
+        )
+    else:
+        latents["bg_texture"] = get_texture(
+            "IMAGE", rng, True
+        )
+
+    # set the background material
+    latents["bg_material"] = get_material(rng)
+    
+    # set ambient illumination
+    latents["ambient_illumination"] = rng.uniform(0.4, 0.7)
+    
+    # object properties
+    # number of objects in the scene 
+    # visibility and overlap depend on camera position and spawn region
+    latents["num_objects"] = rng.randint(params["min_num_objects"], params["max_num_objects"] + 1)
+    
+    # choose #num_objects KuBasic shapes
+    latents["object_shapes"] = rng.choice(KUBASIC_IDS, size=latents["num_objects"])
+    
+    # set #num_objects scales
+    latents["object_scales"] = rng.uniform(0.6, 1.2, size=latents["num_objects"])
+    
+    # set #num_objects angles of rotation in (0, 2pi)
+    latents["object_angles_of_rotation"] = rng.uniform(0, 2*np.pi, size=latents["num_objects"])
+    
+    # choose axes of rotation for the objects
+    latents["object_axes_of_rotation"] = rng.choice(["x", "y", "z"], size=latents["num_objects"])
+    
+    # get object quaternions
+    latents["object_quaternions"] = [
+        get_quaternion(
+            latents["object_axes_of_rotation"][k],
+            latents["object_angles_of_rotation"][k]
+        ) for k in range(latents["num_objects"])
+    ]
+    
+    # set object textures
+    latents["object_textures"] = [
+        get_texture(
+            rng.choice(TEXTURES), 
+            rng, 
+            False, 
+            params["object_texture_size"]
+        ) for _ in range(latents["num_objects"])
+    ]
+    
+    # set object materials
+    latents["object_materials"] = [get_material(rng) for _ in range(latents["num_objects"])]
+
+    # set camera views, drawn last so that they leave the other latents unchanged, 
+    # legacy configs don't carry them
+    if params["camera_views"] is not None:
+        latents["camera_views"] = [
+            dict(position=list(view["position"]), look_at=list(view["look_at"])) 
+            for view in params["camera_views"]
         ]
-        
-        # set object textures
-        latents["object_textures"] = [
-            get_texture(
-                rng.choice(TEXTURES), 
-                rng, 
-                False
-            ) for _ in range(latents["num_objects"])
+    elif params["num_views"] is not None:
+        offsets = rng.uniform(-1, 1, size=(params["num_views"], 3)) * params["camera_jitter"]
+        latents["camera_views"] = [
+            dict(position=(params["camera_position"] + offset).tolist(), look_at=list(params["camera_look_at"])) 
+            for offset in offsets
         ]
-        
-        # set object materials
-        latents["object_materials"] = [get_material(rng) for _ in range(latents["num_objects"])]
-        
-        # append to dataset
-        scenes.append(latents)
-
-    return scenes
\ No newline at end of file
+
+    return latents
+
+
+@lru_cache(maxsize=None)
+def _seed_permutation(root_seed: int) -> Tuple[int, int]:
+    """
+    Offset in [0, 2147483647) and factor in [1, 2147483647) of `scene_seed`, 
+    drawn from `SeedSequence(root_seed)`.
+    """
+    offset, factor = np.random.SeedSequence(int(root_seed)).generate_state(2, dtype=np.uint64)
+    return int(offset % 2147483647), int(factor % 2147483646) + 1
+
+
+def scene_seed(root_seed: int, index: int) -> int:
+    """
+    Seed of the index-th scene of a dataset with the given root seed, in the same range 
+    as the drawn seeds. The root seed gives an offset and a factor, and the seed is 
+    `factor * (index + offset) % 2147483647`. As 2147483647 is prime, this permutes the 
+    indices below it, so no two scenes of a dataset share a seed.
+    """
+    if not 0 <= index < 2147483647:
+        raise ValueError(f"scene index should be in [0, 2147483647), got {index}")
+    offset, factor = _seed_permutation(int(root_seed))
+    return factor * ((int(index) + offset) % 2147483647) % 2147483647
+
+
+def replacement_seed(entropy: int, seed: int, attempt: int = 0) -> int:
+    """
+    Seed of the scene that replaces the scene with the given seed, from the seed stream 
+    of a dataset (given by its entropy). attempt > 0 gives further candidates, e.g. if 
+    the first one collides with a scene of the dataset.
+    """
+    state = np.random.SeedSequence(int(entropy), spawn_key=(int(seed), attempt)).generate_state(1)
+    return int(state[0] % 2147483647)
+
+
+def sample_placed_scene(seed: int, params: Dict) -> Dict:
+    """
+    `sample_scene` followed by `place_objects`. The latents are the ones of `sample_scene` 
+    whether or not the objects fit, so precompute_positions does not change their 
+    distribution. If they do not fit in the spawn region, "object_positions" is None 
+    and the objects are placed at render time instead (see `unplaced`).
+
+    Args:
+        seed: seed of the scene
+        params: shared scene parameters, as returned by `scene_params` with precompute_positions
+
+    Returns:
+        the config of the scene, with "object_positions"
+    """
+    latents = sample_scene(seed, params)
+    try:
+        latents["object_positions"] = place_objects(latents, params["object_bounds"])
+    except RuntimeError:
+        latents["object_positions"] = None
+    return latents
+
+
+def unplaced(config: Dict) -> bool:
+    """
+    Whether the objects of a scene config drawn with precompute_positions did not fit, 
+    so that they are placed at render time.
+    """
+    return "object_positions" in config and config["object_positions"] is None
@@ -0,0 +1,188 @@
+import hashlib
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+import numpy as np
+
+
+# flat numeric sequences, arrays as well as lists and tuples of numbers, are encoded as one 
+# buffer, widened to one dtype per kind, so that e.g. an int32 array (default on Windows), 
+# an int64 array and a list of python ints of the same values hash the same
+_ARRAY_DTYPES = {
+    "b": np.dtype("|b1"),
+    "i": np.dtype("<i8"),
+    "u": np.dtype("<i8"),
+    "f": np.dtype("<f8"),
+    "c": np.dtype("<c16"),
+}
+
+
+def _scalar_kind(value):
+    """
+    dtype kind of a python or numpy scalar ("b", "i", "f" or "c"), None if it is not a number.
+    """
+    if isinstance(value, (bool, np.bool_)):
+        return "b"
+    if isinstance(value, (int, np.integer)):
+        return "i"
+    if isinstance(value, (float, np.floating)):
+        return "f"
+    if isinstance(value, (complex, np.complexfloating)):
+        return "c"
+    return None
+
+
+def _encode_buffer(values, kind: str, out: List[bytes]) -> bool:
+    """
+    Appends the buffer encoding of a flat sequence of numbers of one kind to out. 
+    Returns False (and appends nothing) for integers that do not fit into an int64.
+    """
+    try:
+        data = np.asarray(values, dtype=_ARRAY_DTYPES[kind])
+    except OverflowError:
+        return False
+    if kind == "u" and len(values) and np.max(values) > np.iinfo(np.int64).max:
+        return False
+    out.append(b"a%s%d:" % (data.dtype.kind.encode(), len(data)))
+    out.append(data.tobytes())
+    return True
+
+
+def _encode_list(values, out: List[bytes]):
+    kind = _scalar_kind(values[0]) if len(values) else None
+    if (
+        kind is not None 
+        and all(_scalar_kind(v) == kind for v in values[1:]) 
+        and _encode_buffer(values, kind, out)
+    ):
+        return
+    out.append(b"l%d:" % len(values))
+    for v in values:
+        _encode(v, out)
+
+
+def _encode(value, out: List[bytes]):
+    """
+    Appends the canonical, type-tagged encoding of value to out.
+
+    - numpy scalars and 0-d arrays encode like the equivalent python scalar
+    - lists, tuples and arrays encode alike, so do dicts regardless of key order
+    - flat sequences of numbers of one kind (bool, int, float or complex) are hashed 
+        from their (dtype-normalized) buffer, arrays with more dimensions as lists of 
+        their rows, string and object arrays as lists of their elements
+    """
+    kind = type(value)
+    if kind is str:
+        data = value.encode()
+        out.append(b"s%d:" % len(data))
+        out.append(data)
+    elif kind is float:
+        out.append(b"f%r;" % value)
+    elif kind is int:
+        out.append(b"i%d;" % value)
+    elif kind is dict:
+        out.append(b"d%d:" % len(value))
+        if all(type(k) is str for k in value):
+            items = sorted(value.items())
+        else:
+            # mixed key types: order by the encoding of the key instead
+            items = sorted(value.items(), key=lambda item: _digest(item[0]))
+        for k, v in items:
+            _encode(k, out)
+            _encode(v, out)
+    elif kind is list or kind is tuple:
+        _encode_list(value, out)
+    elif value is None:
+        out.append(b"N")
+    elif kind is bool:
+        out.append(b"T" if value else b"F")
+    elif isinstance(value, np.generic):
+        _encode(value.item(), out)
+    elif isinstance(value, np.ndarray):
+        if value.ndim == 0:
+            _encode(value.item(), out)
+        elif value.ndim > 1 or value.dtype.kind not in _ARRAY_DTYPES:
+            _encode_list(list(value) if value.ndim > 1 else value.tolist(), out)
+        elif len(value) == 0 or not _encode_buffer(value, value.dtype.kind, out):
+            _encode_list(value.tolist(), out)
+    elif isinstance(value, dict):
+        _encode(dict(value), out)
+    elif isinstance(value, (list, tuple)):
+        # e.g. kb.Color and other NamedTuples
+        _encode(list(value), out)
+    else:
+        raise TypeError(f"Cannot hash {type(value)} in a scene config")
+
+
+def _digest(value) -> bytes:
+    out = []
+    _encode(value, out)
+    return hashlib.md5(b"".join(out)).digest()
+
+
+def scene_hash(config: Dict) -> str:
+    """
+    Canonical md5 hash of a scene config.
+
+    Unlike `make_hash`, the hash does not depend on whether a value is a numpy or a
+    python scalar, a list, a tuple or an array, or on the order of dict keys, so it 
+    survives a round trip through a DataJoint blob.
+    """
+    out = []
+    _encode(config, out)
+    return hashlib.md5(b"".join(out)).hexdigest()
+
+
+def scene_hashes(configs: Iterable[Dict]) -> List[str]:
+    """
+    Hashes of many scene configs, in order, the same as `scene_hash` of each. A value 
+    that several configs share (the same object, e.g. the spawn region, camera and floor 
+    lists that `latent_dataset` gives every scene) is encoded once per batch.
+    """
+    configs = list(configs)  # keeps the values alive, so their ids stay unique
+    shared = {}
+    hashes = []
+    for config in configs:
+        if type(config) is not dict or not all(type(k) is str for k in config):
+            hashes.append(scene_hash(config))
+            continue
+        out = [b"d%d:" % len(config)]
+        for key, value in sorted(config.items()):
+            _encode(key, out)
+            encoded = shared.get(id(value))
+            if encoded is None:
+                buffer = []
+                _encode(value, buffer)
+                encoded = shared[id(value)] = b"".join(buffer)
+            out.append(encoded)
+        hashes.append(hashlib.md5(b"".join(out)).hexdigest())
+    return hashes
+
+
+def hash_changes(rows: Iterable[Tuple[Dict, Dict]]) -> List[Dict]:
+    """
+    Migration check: the (key, config) rows whose key["scene_hash"] is not the `scene_hash` 
+    of their config, e.g. because it was computed with nnfabrik's `make_hash` or with an 
+    older version of the encoding.
+
+    Returns:
+        list of the keys of those rows, each with its `new_hash`
+    """
+    changes = []
+    for key, config in rows:
+        new_hash = scene_hash(config)
+        if new_hash != key["scene_hash"]:
+            changes.append(dict(key, new_hash=new_hash))
+    return changes
+
+
+def unique_scenes(scenes: Iterable[Tuple[int, Dict]], existing: Set[str]) -> Iterator[Tuple[int, str, Dict]]:
+    """
+    Yields (index, scene_hash, config) for the (index, config) pairs of scenes whose hash 
+    is not in existing. Every yielded hash is added to existing, so a scene that repeats an 
+    earlier one is left out as well, e.g. within one chunk of `SceneConfig.fill`.
+    """
+    for index, config in scenes:
+        config_hash = scene_hash(config)
+        if config_hash in existing:
+            continue
+        existing.add(config_hash)
+        yield index, config_hash, config
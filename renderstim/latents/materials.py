@@ -1,17 +1,18 @@
 import kubric as kb
 
+MATERIAL_KEYS = [
+    'color',
+    'metallic', 
+    'specular', 
+    'specular_tint', 
+    'roughness', 
+    'transmission', 
+    'transmission_roughness'
+]
+
 def get_material(rng):
-    material_keys = [
-        'color',
-        'metallic', 
-        'specular', 
-        'specular_tint', 
-        'roughness', 
-        'transmission', 
-        'transmission_roughness'
-    ]
     material_kwargs = {}
-    for key in material_keys:
+    for key in MATERIAL_KEYS:
         if key == 'color':
             _, random_color = kb.randomness.sample_color("gray", rng)
             material_kwargs[key] = random_color
@@ -0,0 +1,232 @@
+import numpy as np
+from functools import lru_cache
+from itertools import product
+from typing import Dict, List, Tuple
+
+from kubric import file_io
+
+from .utils import default_rng
+
+
+PLACEMENTS = ("rejection", "analytic")
+
+
+def blocked_regions(lo: np.ndarray, hi: np.ndarray, placed: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Positions at which an object with AABB [lo, hi] (relative to its position) would overlap
+    one of the placed AABBs, as one open box [min, max] per placed AABB (Minkowski difference).
+    """
+    placed = np.asarray(placed, dtype=np.float64).reshape(-1, 2, 3)
+    return placed[:, 0] - hi, placed[:, 1] - lo
+
+
+def overlapping(positions: np.ndarray, blocked_min: np.ndarray, blocked_max: np.ndarray) -> np.ndarray:
+    """
+    Boolean mask of the positions that lie inside any of the blocked boxes.
+    """
+    inside = (positions[:, None] > blocked_min[None]) & (positions[:, None] < blocked_max[None])
+    return inside.all(axis=-1).any(axis=-1)
+
+
+def free_cells(low, high, blocked_min, blocked_max, cells: int = 32):
+    """
+    Splits the region [low, high] into a grid of cells (one cell along degenerate axes),
+    and returns the flat indices of the cells that are not completely blocked, with the
+    grid edges and shape.
+    """
+    shape = tuple(cells if h > l else 1 for l, h in zip(low, high))
+    edges = [np.linspace(l, h, n + 1) for l, h, n in zip(low, high, shape)]
+
+    blocked = np.zeros(shape, dtype=bool)
+    for b_min, b_max in zip(blocked_min, blocked_max):
+        # cells whose edges both lie inside the blocked box
+        index = tuple(
+            slice(np.searchsorted(e, m, side="left"), np.searchsorted(e, M, side="right") - 1)
+            for e, m, M in zip(edges, b_min, b_max)
+        )
+        blocked[index] = True
+
+    return np.flatnonzero(~blocked), edges, shape
+
+
+def sample_candidates(rng, free, edges, shape, batch_size: int) -> np.ndarray:
+    """
+    Draws batch_size positions uniformly from the free grid cells returned by `free_cells`.
+    """
+    index = np.unravel_index(rng.choice(free, size=batch_size), shape)
+    offsets = rng.uniform(size=(batch_size, 3))
+    return np.stack([
+        e[i] + u * (e[i + 1] - e[i]) for e, i, u in zip(edges, index, offsets.T)
+    ], axis=1)
+
+
+def effective_region(spawn_region, lo, hi) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Positions at which an object with AABB [lo, hi] lies inside spawn_region.
+    """
+    region = np.asarray(spawn_region, dtype=np.float64)
+    low, high = region[0] - lo, region[1] - hi
+    return np.minimum(low, high), np.maximum(low, high)
+
+
+def place_object(
+    asset,
+    simulator,
+    spawn_region: List[List[float]],
+    placed: List,
+    rng=default_rng(),
+    floor_top: float = None,
+    batch_size: int = 32,
+    max_trials: int = 1000
+) -> Dict:
+    """
+    Places asset inside spawn_region without overlapping the already placed objects, with
+    the same distribution as rejection sampling with PyBullet (`utils.figure_out_overlap`),
+    but with fewer physics queries.
+
+    Candidate positions are drawn uniformly from the positions at which the asset's AABB
+    lies inside spawn_region, batch_size at a time. A candidate whose AABB overlaps none
+    of the placed AABBs (and lies above floor_top) cannot overlap anything, so it is accepted
+    without asking the simulator. Only candidates whose AABB does overlap are checked with
+    `simulator.check_overlap`, which decides on the exact shapes. Placement is deterministic
+    given rng.
+
+    Args:
+        asset: kubric object, with its scale and rotation already set
+        simulator: PyBullet simulator of the scene
+        spawn_region: [[x_min, y_min, z_min], [x_max, y_max, z_max]]
+        placed: AABBs ([min, max]) of the objects placed so far
+        rng: np.random.RandomState
+        floor_top: height of the top of the floor, candidates reaching below it are
+            checked with the simulator. None if there is no floor
+        batch_size: number of candidates drawn at once
+        max_trials: maximum number of candidates, as the trials of `figure_out_overlap`
+
+    Returns:
+        dict with the number of candidate `proposals` and of `physics_checks` it took
+
+    Raises:
+        RuntimeError: if no free position was found
+    """
+    asset.position = (0, 0, 0)  # reset position to origin
+    lo, hi = np.asarray(asset.aabbox, dtype=np.float64)
+    low, high = effective_region(spawn_region, lo, hi)
+    blocked_min, blocked_max = blocked_regions(lo, hi, placed)
+
+    proposals = physics_checks = 0
+    while proposals < max_trials:
+        candidates = rng.uniform(low, high, size=(min(batch_size, max_trials - proposals), 3))
+        clear = ~overlapping(candidates, blocked_min, blocked_max)
+        if floor_top is not None:
+            clear &= candidates[:, 2] + lo[2] >= floor_top
+        for k, candidate in enumerate(candidates):
+            asset.position = candidate
+            if not clear[k]:
+                physics_checks += 1
+                if simulator.check_overlap(asset):
+                    continue
+            return dict(proposals=proposals + k + 1, physics_checks=physics_checks)
+        proposals += len(candidates)
+
+    raise RuntimeError("Failed to place", asset)
+
+
+@lru_cache(maxsize=None)
+def shape_bounds(manifest: str) -> Dict[str, np.ndarray]:
+    """
+    Bounds ([min, max] at unit scale) of every asset in an asset source manifest, 
+    as the asset source passes them to the created objects.
+    """
+    assets = file_io.read_json(manifest)["assets"]
+    return {
+        asset_id: np.asarray(entry["kwargs"]["bounds"], dtype=np.float64)
+        for asset_id, entry in assets.items() if "bounds" in entry.get("kwargs", {})
+    }
+
+
+def rotation_matrices(quaternions: np.ndarray) -> np.ndarray:
+    """
+    (n, 3, 3) rotation matrices of (n, 4) unit (w, x, y, z) quaternions.
+    """
+    w, x, y, z = np.asarray(quaternions, dtype=np.float64).reshape(-1, 4).T
+    return np.stack([
+        np.stack([1 - 2*(y*y + z*z), 2*(x*y - w*z), 2*(x*z + w*y)], axis=-1),
+        np.stack([2*(x*y + w*z), 1 - 2*(x*x + z*z), 2*(y*z - w*x)], axis=-1),
+        np.stack([2*(x*z - w*y), 2*(y*z + w*x), 1 - 2*(x*x + y*y)], axis=-1),
+    ], axis=1)
+
+
+def object_aabbs(bounds: np.ndarray, scales: np.ndarray, quaternions: np.ndarray) -> np.ndarray:
+    """
+    (n, 2, 3) AABBs of n objects at the origin, from their (n, 2, 3) bounds, scales 
+    and quaternions, computed like kubric's `PhysicalObject.aabbox`.
+    """
+    bounds = np.asarray(bounds, dtype=np.float64) * np.reshape(scales, (-1, 1, 1))
+    corners = np.stack([
+        np.stack([bounds[:, i, 0], bounds[:, j, 1], bounds[:, k, 2]], axis=-1)
+        for i, j, k in product((0, 1), repeat=3)
+    ], axis=1)
+    rotated = np.einsum("nij,ncj->nci", rotation_matrices(quaternions), corners)
+    return np.stack([rotated.min(axis=1), rotated.max(axis=1)], axis=1)
+
+
+def place_objects(
+    config: Dict,
+    bounds: Dict[str, np.ndarray],
+    batch_size: int = 32,
+    cells: int = 32,
+    max_trials: int = 1000
+) -> List[List[float]]:
+    """
+    Places the objects of a scene config without a simulator, so that their AABBs 
+    do not overlap, lie inside the spawn region and above the floor. Uses a RandomState 
+    seeded with the scene seed, so the positions are deterministic given the config.
+
+    AABBs of rotated objects are larger than the objects, so this rejects some scenes 
+    that PyBullet placement would manage to fit.
+
+    Args:
+        config: scene config, as returned by `sample_scene`
+        bounds: unit scale bounds per shape, see `shape_bounds`
+        batch_size: number of candidates drawn at once
+        cells: grid cells per axis
+        max_trials: maximum number of candidate batches per object
+
+    Returns:
+        list of [x, y, z] positions, one per object
+
+    Raises:
+        RuntimeError: if an object could not be placed
+    """
+    rng = np.random.RandomState(seed=config["seed"])
+    aabbs = object_aabbs(
+        [bounds[shape] for shape in config["object_shapes"]], 
+        config["object_scales"], 
+        config["object_quaternions"]
+    ).reshape(-1, 2, 3)
+
+    positions = []
+    placed = []
+    # top of the floor, which the simulator check would otherwise catch
+    floor_top = config["floor_position"][2] + config["floor_scale"][2]
+
+    for i, (lo, hi) in enumerate(aabbs):
+        low, high = effective_region(config["spawn_region"], lo, hi)
+        low[2] = max(low[2], floor_top - lo[2])
+        high[2] = max(high[2], low[2])
+        blocked_min, blocked_max = blocked_regions(lo, hi, placed)
+        free, edges, shape = free_cells(low, high, blocked_min, blocked_max, cells)
+
+        for _ in range(max_trials if len(free) != 0 else 0):
+            candidates = sample_candidates(rng, free, edges, shape, batch_size)
+            accepted = np.flatnonzero(~overlapping(candidates, blocked_min, blocked_max))
+            if len(accepted) != 0:
+                position = candidates[accepted[0]]
+                break
+        else:
+            raise RuntimeError("Failed to place", config["object_shapes"][i])
+
+        positions.append(position.tolist())
+        placed.append([position + lo, position + hi])
+
+    return positions
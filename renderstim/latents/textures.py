@@ -1,163 +1,289 @@
 from kubric.safeimport.bpy import bpy
 from glob import glob
+import numpy as np
+from .cache import default_texture_cache
+from ..profiling import NULL_PROFILER
 
 
 TEXTURE_IMAGES = glob("/mnt/image_textures/*.png")
 
-def get_texture(type, rng, background=False):
-    if background: size = 3192
-    else: size = 256
-    
-    if type == 'CLOUDS':
-        cloud_noise_basis = [
-            'IMPROVED_PERLIN',
-            'VORONOI_F1',
-            'VORONOI_F2',
-            'VORONOI_F3',
-            'VORONOI_F2_F1',
-            'VORONOI_CRACKLE'
-        ]
-        return {
-            'type': 'CLOUDS',
-            'nabla': rng.uniform(0.001, 0.1),
-            'noise_depth': rng.randint(0, 5),
-            'noise_scale': rng.randint(10, 30),
-            'noise_basis': rng.choice(cloud_noise_basis),
-            'size': size
-        }
-    elif type == 'DISTORTED_NOISE':
-        distorted_noise_basis = [
-            'BLENDER_ORIGINAL', 
-            'ORIGINAL_PERLIN',
-            'VORONOI_F2',
-            'VORONOI_F4',
-            'VORONOI_CRACKLE', 
-            'CELL_NOISE'
-        ]
-        return {
-            'type': 'DISTORTED_NOISE',
-            'nabla': rng.uniform(0.001, 0.1),
-            'distortion': rng.randint(1, 10),
-            'noise_basis': rng.choice(distorted_noise_basis),
-            'noise_scale': rng.randint(10, 30),
-            'noise_distortion': rng.choice(distorted_noise_basis),
-            'size': size
-        }
-    elif type == 'MAGIC':
-        return {
-            'type': 'MAGIC',
-            'noise_depth': rng.randint(0, 5),
-            'turbulence': rng.randint(5, 10),
-            'size': size
-        }
+# side of the UV square of each face of kubric's Cube (Blender's default cube UVs, 
+# a cross of 0.25 x 0.25 squares), relative to the side of its image texture
+CUBE_FACE_UV = 0.25
 
-    elif type == 'MARBLE':
-        marble_noise_basis = [
-            'BLENDER_ORIGINAL', 
-            'VORONOI_F2',
-            'VORONOI_CRACKLE', 
-            'CELL_NOISE'
-        ]
-        return {
-            'type': 'MARBLE',
-            'nabla': rng.uniform(0.001, 0.1),
-            'noise_depth': rng.randint(0, 5),
-            'noise_scale': rng.randint(10, 30),
-            'noise_basis': rng.choice(marble_noise_basis),
-            'marble_type': rng.choice(['SOFT', 'SHARP']),
-            'turbulence': rng.randint(5, 15),
-            'size': size
-        }
-    elif type == 'MUSGRAVE':
-        musgrave_noise_basis = [
-            'BLENDER_ORIGINAL', 
-            'VORONOI_F1',   
-            'VORONOI_F2_F1',
-            'VORONOI_CRACKLE', 
-            'CELL_NOISE'
-        ]
-
-        musgrave_types = [
-            'MULTIFRACTAL',
-            'RIDGED_MULTIFRACTAL',
-            'FBM'
-        ]
+def camera_axes(camera_position, camera_look_at):
+    """
+    Forward, right and up unit vectors of a camera looking at camera_look_at, with the
+    world z axis up (as kubric's `look_at`).
+    """
+    forward = np.subtract(camera_look_at, camera_position).astype(np.float64)
+    forward /= np.linalg.norm(forward)
+    right = np.cross(forward, [0.0, 0.0, 1.0])
+    right /= np.linalg.norm(right)
+    return forward, right, np.cross(right, forward)
 
-        return {
-            "type": "MUSGRAVE",
-            "dimension_max": rng.uniform(0.001, 2),
-            "gain": rng.randint(1, 6),
-            "lacunarity": rng.randint(1, 6),
-            "musgrave_type": rng.choice(musgrave_types),
-            "nabla": rng.uniform(0.001, 0.1),
-            "noise_basis": rng.choice(musgrave_noise_basis),
-            "noise_intensity": rng.randint(1, 10),
-            "noise_scale": rng.randint(10, 30),
-            "octaves": rng.randint(1, 8),
-            "offset": 1,
-            "size": size
-        }
-    elif type == 'STUCCI':
-        stucci_noise_basis = [
-            'BLENDER_ORIGINAL', 
-            'VORONOI_F1',   
-            'VORONOI_F2_F1',
-            'VORONOI_CRACKLE', 
-            'CELL_NOISE'
-        ]
-
-        stucci_types = [
-            'PLASTIC',
-            'WALL_IN',
-            'WALL_OUT'
-        ]
+def visible_floor(
+    resolution, 
+    camera_position, 
+    camera_look_at, 
+    camera_focal_length, 
+    camera_sensor_width, 
+    floor_scale, 
+    floor_position, 
+    samples=128
+):
+    """
+    How much of the image shows the top face of the floor, and how much of that face is in
+    view, ignoring occlusion by the objects. Both are measured on a grid of samples x samples
+    points, of the image and of the face respectively.
 
-        return {
-            "type": "STUCCI",
-            "noise_basis": rng.choice(stucci_noise_basis),
-            "noise_scale": rng.randint(10, 30),
-            "noise_type": 'HARD_NOISE',
-            "stucci_type": rng.choice(stucci_types),
-            "turbulence": rng.randint(5, 15),
-            "size": size
-        }
-    elif type == 'VORONOI':
-        voronoi_distance_metric = [
-            'DISTANCE',
-            'DISTANCE_SQUARED',
-            'MANHATTAN',
-            'CHEBYCHEV',
-            'MINKOVSKY_HALF',
-            'MINKOVSKY_FOUR',
-            'MINKOVSKY'
-        ]
+    Returns:
+        (image_fraction, floor_fraction)
+    """
+    forward, right, up = camera_axes(camera_position, camera_look_at)
+    width, height = resolution
+    # half extents of the image plane at unit depth; the sensor width spans the longer side
+    half_width = camera_sensor_width / (2 * camera_focal_length) * width / max(resolution)
+    half_height = camera_sensor_width / (2 * camera_focal_length) * height / max(resolution)
+    floor_low = np.subtract(floor_position, floor_scale)[:2]
+    floor_high = np.add(floor_position, floor_scale)[:2]
+    floor_top = floor_position[2] + floor_scale[2]
+    grid = (np.arange(samples) + 0.5) / samples
 
-        return {
-            "type": "VORONOI",
-            "color_mode": "INTENSITY",
-            "distance_metric": rng.choice(voronoi_distance_metric),
-            "minkovsky_exponent": rng.randint(1, 10),
-            "nabla": rng.uniform(0.001, 0.1),
-            "noise_scale": rng.randint(10, 30),
-            "size": size
-        }
-    elif type == 'WOOD':
-        wood_noise_basis = [
-            'BLENDER_ORIGINAL',
-            'VORONOI_F1',
-            'VORONOI_CRACKLE',
-            'CELL_NOISE'
-        ]
+    # rays through the image grid that hit the face
+    u, v = np.meshgrid(2 * grid - 1, 2 * grid - 1, indexing="ij")
+    rays = forward + (u * half_width)[..., None] * right + (v * half_height)[..., None] * up
+    with np.errstate(divide="ignore", invalid="ignore"):
+        distance = (floor_top - camera_position[2]) / rays[..., 2]
+    hits = np.asarray(camera_position)[:2] + distance[..., None] * rays[..., :2]
+    image_fraction = np.mean(
+        (distance > 0) & np.all((hits >= floor_low) & (hits <= floor_high), axis=-1)
+    )
 
-        return {
-            "type": "WOOD",
-            "nabla": rng.uniform(0.001, 0.1),
-            "noise_scale": rng.randint(10, 30),
-            "turbulence": rng.randint(5, 15),
-            "wood_type": 'BANDNOISE',
-            "noise_basis": rng.choice(wood_noise_basis),
-            "size": size
-        }
+    # points of the face that project into the image
+    x, y = np.meshgrid(
+        floor_low[0] + grid * (floor_high[0] - floor_low[0]), 
+        floor_low[1] + grid * (floor_high[1] - floor_low[1]), 
+        indexing="ij"
+    )
+    points = np.stack([x, y, np.full_like(x, floor_top)], axis=-1) - camera_position
+    depth = points @ forward
+    with np.errstate(divide="ignore", invalid="ignore"):
+        in_view = (
+            (depth > 0) 
+            & (np.abs(points @ right / depth) <= half_width) 
+            & (np.abs(points @ up / depth) <= half_height)
+        )
+    return float(image_fraction), float(np.mean(in_view))
+
+def texture_sizes(
+    texels_per_pixel, 
+    resolution, 
+    camera_position, 
+    camera_look_at, 
+    camera_focal_length, 
+    camera_sensor_width, 
+    floor_scale, 
+    floor_position=(0.0, 0.0, 0.0), 
+    object_scale=1.2
+):
+    """
+    Background and object texture sizes that give about `texels_per_pixel` texels 
+    along each side of a screen pixel, a linear density: a pixel covers about 
+    texels_per_pixel**2 texels.
+
+    The top face of the floor (a kubric Cube) is mapped to a CUBE_FACE_UV fraction of 
+    the side of the background texture. The texture is sized so that the part of the 
+    face in view has texels_per_pixel texels per pixel along each axis, from the number 
+    of pixels showing the floor and the fraction of the face in view (see `visible_floor`). 
+    Object textures are assumed to wrap once around an object of scale `object_scale` 
+    at the distance the camera is looking at.
+    Sizes are rounded up to a multiple of 16 and clipped to [16, 4096].
+
+    Returns:
+        (background_size, object_size)
+    """
+    def _round(texels):
+        return int(np.clip(16 * np.ceil(texels / 16), 16, 4096))
+
+    image_fraction, floor_fraction = visible_floor(
+        resolution, 
+        camera_position, 
+        camera_look_at, 
+        camera_focal_length, 
+        camera_sensor_width, 
+        floor_scale, 
+        floor_position
+    )
+    floor_pixels = image_fraction * resolution[0] * resolution[1]
+    # texels along a side of the whole face, at texels_per_pixel along a side of a pixel
+    face_texels = texels_per_pixel * np.sqrt(floor_pixels / floor_fraction) if floor_fraction > 0 else 0
+    background_size = _round(face_texels / CUBE_FACE_UV)
+
+    distance = np.linalg.norm(np.subtract(camera_position, camera_look_at))
+    # world units covered by one pixel; the sensor width spans the longer image side
+    pixel_footprint = distance * camera_sensor_width / (camera_focal_length * max(resolution))
+    object_size = _round(texels_per_pixel * 2 * np.pi * object_scale / pixel_footprint)
+    return background_size, object_size
+
+CLOUD_NOISE_BASIS = [
+    'IMPROVED_PERLIN',
+    'VORONOI_F1',
+    'VORONOI_F2',
+    'VORONOI_F3',
+    'VORONOI_F2_F1',
+    'VORONOI_CRACKLE'
+]
+
+DISTORTED_NOISE_BASIS = [
+    'BLENDER_ORIGINAL', 
+    'ORIGINAL_PERLIN',
+    'VORONOI_F2',
+    'VORONOI_F4',
+    'VORONOI_CRACKLE', 
+    'CELL_NOISE'
+]
+
+MARBLE_NOISE_BASIS = [
+    'BLENDER_ORIGINAL', 
+    'VORONOI_F2',
+    'VORONOI_CRACKLE', 
+    'CELL_NOISE'
+]
+
+MUSGRAVE_NOISE_BASIS = [
+    'BLENDER_ORIGINAL', 
+    'VORONOI_F1',   
+    'VORONOI_F2_F1',
+    'VORONOI_CRACKLE', 
+    'CELL_NOISE'
+]
+
+MUSGRAVE_TYPES = [
+    'MULTIFRACTAL',
+    'RIDGED_MULTIFRACTAL',
+    'FBM'
+]
+
+STUCCI_NOISE_BASIS = [
+    'BLENDER_ORIGINAL', 
+    'VORONOI_F1',   
+    'VORONOI_F2_F1',
+    'VORONOI_CRACKLE', 
+    'CELL_NOISE'
+]
+
+STUCCI_TYPES = [
+    'PLASTIC',
+    'WALL_IN',
+    'WALL_OUT'
+]
+
+VORONOI_DISTANCE_METRIC = [
+    'DISTANCE',
+    'DISTANCE_SQUARED',
+    'MANHATTAN',
+    'CHEBYCHEV',
+    'MINKOVSKY_HALF',
+    'MINKOVSKY_FOUR',
+    'MINKOVSKY'
+]
+
+WOOD_NOISE_BASIS = [
+    'BLENDER_ORIGINAL',
+    'VORONOI_F1',
+    'VORONOI_CRACKLE',
+    'CELL_NOISE'
+]
+
+# (name, kind, args) of the parameters of each procedural texture, in the order 
+# they are drawn from the rng. kind is one of 'uniform', 'randint', 'choice', 'const'.
+TEXTURE_PARAMS = {
+    'CLOUDS': (
+        ('nabla', 'uniform', (0.001, 0.1)),
+        ('noise_depth', 'randint', (0, 5)),
+        ('noise_scale', 'randint', (10, 30)),
+        ('noise_basis', 'choice', CLOUD_NOISE_BASIS),
+    ),
+    'DISTORTED_NOISE': (
+        ('nabla', 'uniform', (0.001, 0.1)),
+        ('distortion', 'randint', (1, 10)),
+        ('noise_basis', 'choice', DISTORTED_NOISE_BASIS),
+        ('noise_scale', 'randint', (10, 30)),
+        ('noise_distortion', 'choice', DISTORTED_NOISE_BASIS),
+    ),
+    'MAGIC': (
+        ('noise_depth', 'randint', (0, 5)),
+        ('turbulence', 'randint', (5, 10)),
+    ),
+    'MARBLE': (
+        ('nabla', 'uniform', (0.001, 0.1)),
+        ('noise_depth', 'randint', (0, 5)),
+        ('noise_scale', 'randint', (10, 30)),
+        ('noise_basis', 'choice', MARBLE_NOISE_BASIS),
+        ('marble_type', 'choice', ['SOFT', 'SHARP']),
+        ('turbulence', 'randint', (5, 15)),
+    ),
+    'MUSGRAVE': (
+        ('dimension_max', 'uniform', (0.001, 2)),
+        ('gain', 'randint', (1, 6)),
+        ('lacunarity', 'randint', (1, 6)),
+        ('musgrave_type', 'choice', MUSGRAVE_TYPES),
+        ('nabla', 'uniform', (0.001, 0.1)),
+        ('noise_basis', 'choice', MUSGRAVE_NOISE_BASIS),
+        ('noise_intensity', 'randint', (1, 10)),
+        ('noise_scale', 'randint', (10, 30)),
+        ('octaves', 'randint', (1, 8)),
+        ('offset', 'const', 1),
+    ),
+    'STUCCI': (
+        ('noise_basis', 'choice', STUCCI_NOISE_BASIS),
+        ('noise_scale', 'randint', (10, 30)),
+        ('noise_type', 'const', 'HARD_NOISE'),
+        ('stucci_type', 'choice', STUCCI_TYPES),
+        ('turbulence', 'randint', (5, 15)),
+    ),
+    'VORONOI': (
+        ('color_mode', 'const', 'INTENSITY'),
+        ('distance_metric', 'choice', VORONOI_DISTANCE_METRIC),
+        ('minkovsky_exponent', 'randint', (1, 10)),
+        ('nabla', 'uniform', (0.001, 0.1)),
+        ('noise_scale', 'randint', (10, 30)),
+    ),
+    'WOOD': (
+        ('nabla', 'uniform', (0.001, 0.1)),
+        ('noise_scale', 'randint', (10, 30)),
+        ('turbulence', 'randint', (5, 15)),
+        ('wood_type', 'const', 'BANDNOISE'),
+        ('noise_basis', 'choice', WOOD_NOISE_BASIS),
+    ),
+}
+
+def sample_param(rng, kind, args, size=None):
+    """
+    Draws one texture parameter (or `size` of them) from a RandomState.
+    """
+    if kind == 'uniform':
+        return rng.uniform(*args, size=size)
+    elif kind == 'randint':
+        return rng.randint(*args, size=size)
+    elif kind == 'choice':
+        return rng.choice(args, size=size)
+    elif kind == 'const':
+        return args if size is None else np.full(size, args)
+    raise ValueError(f"Unknown parameter kind {kind}")
+
+def get_texture(type, rng, background=False, size=None):
+    if size is None:
+        # legacy sizes, kept so that old configs hash the same
+        size = 3192 if background else 256
+
+    if type in TEXTURE_PARAMS:
+        texture = {'type': type}
+        for name, kind, args in TEXTURE_PARAMS[type]:
+            texture[name] = sample_param(rng, kind, args)
+        texture['size'] = size
+        return texture
     elif type == 'IMAGE':
         return {
             'type': 'IMAGE',
@@ -177,12 +303,55 @@ def texture_pixels(texture=None, x=512, y=512):
             final_pixels.append(fl)
     return final_pixels
 
-def apply_texture(obj_name, material_name, texture=None):
+def bake_texture(texture=None, x=512, y=512, chunk_size=2**20):
+    """
+    Same pixel layout as `texture_pixels`, as a float32 array of shape (x, y, 4) ready for
+    `foreach_set`, but evaluated by blender in bulk instead of one `evaluate` call per pixel.
 
-    if texture['type'] == 'NONE':
-        return None
-    
-    elif texture['type'] == 'CLOUDS':
+    The texel coordinates are the vertices of a point cloud mesh, which a displace modifier
+    moves along z by the texture intensity at their local coordinates. All procedural textures
+    use the default (black to white) color ramp, so color and alpha equal the intensity.
+    The mesh holds at most chunk_size vertices (whole rows of the texture) at a time.
+    """
+    pixels = np.empty((x, y, 4), dtype=np.float32)
+    rows = max(1, chunk_size // y)
+
+    mesh = bpy.data.meshes.new("texture_bake")
+    obj = bpy.data.objects.new("texture_bake", mesh)
+    displace = obj.modifiers.new("texture_bake", type="DISPLACE")
+    displace.texture = texture
+    displace.texture_coords = "LOCAL"
+    displace.direction = "Z"
+    displace.mid_level = 0.0
+    displace.strength = 1.0
+    bpy.context.scene.collection.objects.link(obj)
+    try:
+        for start in range(0, x, rows):
+            stop = min(start + rows, x)
+            coords = np.zeros((stop - start, y, 3), dtype=np.float32)
+            coords[..., 0] = np.arange(start, stop, dtype=np.float32)[:, None]
+            coords[..., 1] = np.arange(y, dtype=np.float32)
+
+            mesh.clear_geometry()
+            mesh.vertices.add(coords.shape[0] * y)
+            mesh.vertices.foreach_set("co", coords.ravel())
+            mesh.update()
+
+            evaluated = obj.evaluated_get(bpy.context.evaluated_depsgraph_get())
+            baked = evaluated.to_mesh()
+            baked.vertices.foreach_get("co", coords.ravel())
+            evaluated.to_mesh_clear()
+            pixels[start:stop] = coords[..., 2:]
+    finally:
+        bpy.data.objects.remove(obj)
+        bpy.data.meshes.remove(mesh)
+    return pixels
+
+def new_texture(texture):
+    """
+    Creates the bpy texture described by a texture latent dict.
+    """
+    if texture['type'] == 'CLOUDS':
         tex = bpy.data.textures.new(
             name="clouds_texture", 
             type="CLOUDS"
@@ -287,6 +456,19 @@ def apply_texture(obj_name, material_name, texture=None):
         tex.noise_basis = texture['noise_basis']
         tex.wood_type = texture['wood_type']
         tex.turbulence = texture['turbulence']
+
+    else:
+        raise ValueError(f"Cannot bake texture of type {texture['type']}")
+
+    return tex
+
+def apply_texture(obj_name, material_name, texture=None, cache=None, profiler=NULL_PROFILER):
+
+    if texture['type'] == 'NONE':
+        return None
+
+    if cache is None:
+        cache = default_texture_cache()
     
     # select the object
     obj = bpy.data.objects[obj_name]
@@ -322,11 +504,19 @@ def apply_texture(obj_name, material_name, texture=None):
             texture['size'], 
             alpha=True
         )
-        node_tex.image.pixels = texture_pixels(
-            tex, 
-            x=node_tex.image.size[0], 
-            y=node_tex.image.size[1]
-        )
+        pixels = None if cache is None else cache.get(texture, texture['size'])
+        if pixels is None:
+            pixels = bake_texture(
+                new_texture(texture), 
+                x=node_tex.image.size[0], 
+                y=node_tex.image.size[1]
+            )
+            profiler.count("texels_baked", texture['size'] ** 2)
+            if cache is not None:
+                cache.put(texture, texture['size'], pixels)
+        else:
+            profiler.count("textures_cached")
+        node_tex.image.pixels.foreach_set(pixels.ravel())
 
     elif texture['type'] == 'IMAGE':
         node_tex.image = bpy.data.images.load(texture['image_path'])
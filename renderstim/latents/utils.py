@@ -2,9 +2,16 @@ import numpy as np
 import pyquaternion as pyquat
 from kubric.core import objects
 import png
+import PIL
 from PIL import Image
 
 
+# PIL decodes 16 bit grayscale pngs as int32 ("I") before 10.3 and as uint16 ("I;16") since
+_PIL_GRAY16_DTYPE = (
+    np.uint16 if tuple(map(int, PIL.__version__.split(".")[:2])) >= (10, 3) else np.int32
+)
+
+
 def default_rng():
     return np.random.RandomState()
   
@@ -27,11 +34,11 @@ def resample_while(
     max_trials=1000, 
     rng=default_rng()
 ):
-    for _ in range(max_trials):
+    for trial in range(max_trials):
         for sampler in samplers:
             sampler(asset, rng)
         if not condition(asset):
-            return
+            return trial + 1
     else:
         raise RuntimeError("Failed to place", asset)
         # print("Failed to place ", asset)
@@ -73,7 +80,26 @@ def get_quaternion(axis, angle):
     return tuple(quat)
 
 
-def write_png(data: np.array, filename: str) -> None:
+def get_quaternions(axes, angles):
+    """
+    Vectorized `get_quaternion`.
+    axes: array of "x", "y" or "z"
+    angles: array of angles in radians
+    Returns: (n, 4) array of (w, x, y, z) quaternions
+    """
+    axes = np.char.upper(np.asarray(axes))
+    angles = np.asarray(angles, dtype=np.float64)
+    quats = np.zeros((len(angles), 4))
+    quats[:, 0] = np.cos(angles / 2.0)
+    for i, axis in enumerate("XYZ", start=1):
+        quats[:, i] = np.where(axes == axis, 1.0, 0.0) * np.sin(angles / 2.0)
+    return quats
+
+
+def png_data(data: np.array) -> np.array:
+    """
+    Casts data to the uint8 / uint16 array that gets written to png.
+    """
     if data.dtype in [np.uint32, np.uint64]:
         max_value = np.amax(data)
         if max_value > 65535:
@@ -92,6 +118,11 @@ def write_png(data: np.array, filename: str) -> None:
     else:
         raise NotImplementedError(f"Cannot handle {data.dtype}.")
 
+    return data
+
+
+def write_png(data: np.array, filename: str) -> None:
+    data = png_data(data)
     bitdepth = 8 if data.dtype == np.uint8 else 16
 
     assert data.ndim == 3, data.shape
@@ -121,4 +152,32 @@ def write_png(data: np.array, filename: str) -> None:
 
 def get_array_from_png(frame, path):
     write_png(frame, path)
-    return np.asarray(Image.open(path))
\ No newline at end of file
+    return np.asarray(Image.open(path))
+
+
+def array_from_png_data(frame):
+    """
+    Same array as `get_array_from_png`, computed in memory: the frame is cast 
+    like in `write_png` and then converted the way PIL decodes the png.
+    """
+    data = png_data(frame)
+
+    assert data.ndim == 3, data.shape
+    channels = data.shape[-1]
+
+    if channels == 1:
+        data = data[..., 0]
+        if data.dtype == np.uint16:
+            return data.astype(_PIL_GRAY16_DTYPE)
+        return data.copy()
+
+    if channels == 2:
+        data = np.concatenate(
+            [data, np.zeros_like(data[:, :, :1])], 
+            axis=-1
+        )
+
+    if data.dtype == np.uint16:
+        # PIL has no 16 bit colour modes and keeps the most significant byte
+        return (data >> 8).astype(np.uint8)
+    return data.copy()
\ No newline at end of file
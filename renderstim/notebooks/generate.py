@@ -1,6 +1,14 @@
+import os
 from renderstim.schema.scenes import RenderedScenes
 import datajoint as dj
 
 dj.config["enable_python_native_blobs"] = True
 key = dict(dataset_hash="86b0f40049d6576502ff06a7cc0f3a30")
-RenderedScenes().populate(key, display_progress=True, reserve_jobs=True, suppress_errors=True)
\ No newline at end of file
+
+if __name__ == "__main__":
+    # one blender session per worker process, sharing the pod's cpus
+    RenderedScenes().render_farm(
+        key, 
+        num_workers=int(os.environ.get("RENDERSTIM_WORKERS", 1)), 
+        threads=int(os.environ["RENDERSTIM_THREADS"]) if "RENDERSTIM_THREADS" in os.environ else None
+    )
\ No newline at end of file
@@ -0,0 +1,140 @@
+"""
+Lightweight per-stage profiling of scene rendering.
+
+A `Profiler` times nested stages with `span` context managers and sums counters, e.g. the
+texels baked. Its `summary` is what `render_scene` attaches to the config as "timings" and
+"counts". Records can also be emitted to a sink, any callable taking a dict: `log_sink`,
+`JsonlSink` or `MemorySink`. Code paths called without a profiler use `NULL_PROFILER`,
+whose spans and counters do nothing.
+"""
+import os
+import json
+import time
+import logging
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
+from typing import Callable, Dict
+
+
+class Profiler:
+    """
+    Sums the time spent in named spans, nested spans are named "outer/inner".
+
+    Usage:
+        profiler = Profiler(sink=MemorySink())
+        with profiler.span("setup"):
+            with profiler.span("textures"):
+                ...
+            profiler.count("texels_baked", 256 * 256)
+        profiler.emit(scene_hash=...)
+
+    Args:
+        sink: callable that receives the records of `emit`, None drops them
+    """
+
+    def __init__(self, sink: Callable[[Dict], None] = None):
+        self.sink = sink
+        self.timings = {}
+        self.counts = {}
+        self._stack = []
+
+    @contextmanager
+    def span(self, name: str):
+        self._stack.append(name)
+        path = "/".join(self._stack)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[path] = self.timings.get(path, 0.0) + time.perf_counter() - start
+            self._stack.pop()
+
+    def count(self, name: str, value: int = 1):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def summary(self) -> Dict:
+        """
+        Seconds per span (rounded to microseconds) and the counters.
+        """
+        return dict(
+            timings={name: round(seconds, 6) for name, seconds in self.timings.items()},
+            counts=dict(self.counts)
+        )
+
+    def emit(self, **fields):
+        """
+        Sends the summary, with fields added to it, to the sink.
+        """
+        if self.sink is not None:
+            self.sink(dict(fields, **self.summary()))
+
+
+_NULL_SPAN = nullcontext()
+
+
+class NullProfiler:
+    """
+    Profiler that records nothing, the default of the instrumented functions.
+    """
+
+    def span(self, name: str):
+        return _NULL_SPAN
+
+    def count(self, name: str, value: int = 1):
+        pass
+
+    def summary(self) -> Dict:
+        return dict(timings={}, counts={})
+
+    def emit(self, **fields):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+def log_sink(logger: logging.Logger = None, level: int = logging.INFO) -> Callable[[Dict], None]:
+    """
+    Sink that logs every record as one line of json.
+    """
+    if logger is None:
+        logger = logging.getLogger("renderstim.profiling")
+    return lambda record: logger.log(level, json.dumps(record, default=str))
+
+
+class JsonlSink:
+    """
+    Sink that appends every record as one line to a jsonl file. Lines are written
+    with a single call, so several processes can share the file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __call__(self, record: Dict):
+        with open(self.path, "a") as fp:
+            fp.write(json.dumps(record, default=str) + "\n")
+
+
+class MemorySink(list):
+    """
+    Sink that keeps the records in a list, e.g. for notebooks and benchmarks.
+    """
+
+    def __call__(self, record: Dict):
+        self.append(record)
+
+
+@lru_cache(maxsize=None)
+def default_sink():
+    """
+    Sink configured through the environment, or None if emitting is off.
+
+    RENDERSTIM_PROFILE: "log" to log the records, or the path of a jsonl file
+    """
+    target = os.environ.get("RENDERSTIM_PROFILE")
+    if not target:
+        return None
+    if target == "log":
+        return log_sink()
+    return JsonlSink(target)
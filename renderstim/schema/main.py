@@ -1,11 +1,80 @@
+import inspect
 import warnings
-from typing import Dict, List
+from itertools import islice
+from typing import Dict, Iterable, List, Sequence
 import datajoint as dj
+from datajoint.hash import key_hash
 from nnfabrik.builder import resolve_data
 from nnfabrik.utility.nnf_helper import cleanup_numpy_scalar
 from nnfabrik.utility.dj_helpers import make_hash
 from . import schema
 from ..generators import resolve_generator
+from ..latents.hashing import hash_changes, scene_hash, scene_hashes, unique_scenes
+from ..latents.dataset import indexed_scenes, replacement_seed, scene_seed, unplaced
+from ..latents.materials import MATERIAL_KEYS
+
+
+def chunked(iterable: Iterable, size: int):
+    """
+    Yields lists of at most `size` consecutive items of iterable.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def material_columns(material: Dict, prefix: str = "") -> Dict:
+    """
+    Flattens a material of a scene config into columns, with the color split into r, g, b.
+    """
+    columns = {f"{prefix}color_{c}": float(v) for c, v in zip("rgb", material["color"])}
+    for name in MATERIAL_KEYS[1:]:
+        columns[prefix + name] = float(material[name])
+    return columns
+
+
+def latent_rows(key: Dict, config: Dict):
+    """
+    Columns of a scene config for the SceneLatents and ObjectLatents tables.
+
+    Args:
+        key: primary key of the SceneConfig row
+        config: its scene config
+
+    Returns:
+        the SceneLatents row and the list of ObjectLatents rows
+    """
+    scene = dict(
+        key,
+        seed=int(config["seed"]),
+        num_objects=int(config["num_objects"]),
+        sun_x=float(config["sun_position"][0]),
+        sun_y=float(config["sun_position"][1]),
+        ambient_illumination=float(config["ambient_illumination"]),
+        bg_texture=str(config["bg_texture"]["type"]),
+        **material_columns(config["bg_material"], "bg_")
+    )
+
+    positions = config.get("object_positions")
+    objects = []
+    for i in range(int(config["num_objects"])):
+        row = dict(
+            key,
+            object_id=i,
+            shape=str(config["object_shapes"][i]),
+            scale=float(config["object_scales"][i]),
+            axis=str(config["object_axes_of_rotation"][i]),
+            angle=float(config["object_angles_of_rotation"][i]),
+            texture=str(config["object_textures"][i]["type"]),
+            **material_columns(config["object_materials"][i])
+        )
+        if positions is not None:
+            row.update(zip(("position_x", "position_y", "position_z"), map(float, positions[i])))
+        objects.append(row)
+    return scene, objects
 
 
 @schema
@@ -25,14 +94,30 @@ class LatentDataset(dj.Manual):
         -> master
         scene_hash:                 varchar(64)    # hash of the config object
         ---
-        scene_config:               longblob       # scene config object
+        scene_config=null:          longblob       # scene config object, null if it is recomputed from its seed
         """
 
-        def fill(self, key: Dict = None):
+        def fill(self, key: Dict = None, chunk_size: int = 10000, resume: bool = False, 
+                 store_configs: bool = True):
             """
             Fills the SceneConfig table with the individual scene configs.
+
+            The configs are generated lazily (if the dataset_fn supports `stream`), 
+            and hashed and inserted in chunks, each chunk in its own transaction. 
+            So memory stays bounded and an interrupted fill leaves only complete chunks. 
+            With precompute_positions, the fraction of scenes whose objects did not fit 
+            (and are placed at render time) is reported at the end.
+
             Args:
                 key: primary key of the GenerateLatentDataset table
+                chunk_size: number of scene configs inserted per transaction
+                resume: continue an interrupted fill, generating only the missing 
+                    number of scenes and skipping hashes that are already present or 
+                    were replaced (see `replace`). Datasets with a root_seed only generate 
+                    the scene indices that are neither stored nor replaced
+                store_configs: if False, only the latents are stored and scene_config is 
+                    left null, to be recomputed from the seed by `fetch_config`. 
+                    Needs a dataset_fn with a seeds argument.
             """
 
             if key is None:
@@ -42,66 +127,412 @@ class LatentDataset(dj.Manual):
             key = (self.master() & key).fetch1("KEY")   
             
             # make sure that there are no configs already filled for this key
-            if len(self & key) != 0:
+            num_existing = len(self & key)
+            if num_existing != 0 and not resume:
                 raise AssertionError(
                     f"Image Configs are already present for key {key}. "
                     f"Entries have to be deleted first. Overwrite is not possible to have consistency downstream"
                 )
 
+            dataset = self.master() & key
+            if not store_configs and "seeds" not in inspect.signature(resolve_data(dataset.fn_config[0])).parameters:
+                raise TypeError(f"The scene configs of {key} cannot be recomputed, they have to be stored")
+
+            # scene i of a dataset with a root_seed can be recomputed from i alone
+            indexed = dataset.dataset_arg("root_seed") is not None
+
+            overrides = {}
+            existing, done = set(), set()
+            if resume:
+                replaced = self.master.Replaced & key
+                if indexed:
+                    done = set((self.master.SceneLatents & key & "scene_index is not null").fetch("scene_index"))
+                    done |= set((replaced & "scene_index is not null").fetch("scene_index"))
+                else:
+                    overrides["num_scenes"] = max(dataset.num_scenes - num_existing, 0)
+                existing = set((self & key).fetch("scene_hash")) | set(replaced.fetch("scene_hash"))
+
             # call the dataset_fn with the config
-            scene_configs = self.master().get_scene_configs(key=key)
+            scene_configs = self.master().get_scene_configs(key=key, stream=True, **overrides)
 
-            # iterate over the list and insert the image_config into the ImageConfig table
+            # iterate over the configs and insert them chunk by chunk into the SceneConfig table
             print("... filling individual scene tables ...")
 
-            keys = []
-            for sc in scene_configs:
-                key_copy = key.copy()
-                key_copy["scene_hash"] = make_hash(sc)
-                key_copy["scene_config"] = sc
-                keys.append(key_copy)
+            # duplicates are left out within a chunk as well, they would fail its insert
+            num_inserted = num_unplaced = 0
+            scenes = indexed_scenes(scene_configs, {int(index) for index in done})
+            for chunk in chunked(unique_scenes(scenes, existing), chunk_size):
+                keys = [dict(key, scene_hash=h, scene_config=sc) for _, h, sc in chunk]
+                indices = [index if indexed else None for index, _, _ in chunk]
+
+                with self.connection.transaction:
+                    self.insert(keys if store_configs else [dict(k, scene_config=None) for k in keys])
+                    self.master.SceneLatents().insert_configs(keys, indices)
+
+                num_inserted += len(keys)
+                num_unplaced += sum(unplaced(sc) for _, _, sc in chunk)
+                print(f"... inserted {num_inserted} scene configs ...")
 
-            self.insert(keys)
+            if num_unplaced != 0:
+                print(
+                    f"... the objects of {num_unplaced} of {num_inserted} scenes "
+                    f"({num_unplaced / num_inserted:.1%}) did not fit, they are placed at render time ..."
+                )
         
-        def replace(self, key: Dict = None, bad_hashes: List = None):
+        def fetch_config(self, scenes: Sequence = None) -> Dict:
+            """
+            Scene config of a single row, recomputed from its seed (and the dataset_config) 
+            if it was not stored.
+
+            Args:
+                scenes: the dataset's `LatentDataset.scenes`. If given, a row with a 
+                    scene_index is computed from it, without fetching the scene_config blob
+
+            Raises:
+                ValueError: if the recomputed config does not match the scene hash, e.g. 
+                    because the dataset_fn changed since the fill
+            """
+            row_key = self.fetch1("KEY")
+            if scenes is not None:
+                index = (self.master.SceneLatents & row_key & "scene_index is not null").fetch("scene_index")
+                if len(index) != 0:
+                    config = scenes[int(index[0])]
+                    if scene_hash(config) == row_key["scene_hash"]:
+                        return config
+
+            config = (self & row_key).fetch1("scene_config")
+            if config is not None:
+                return config
+
+            seed = (self.master.SceneLatents & row_key).fetch1("seed")
+            config = (self.master() & row_key).get_scene_configs(seeds=[int(seed)])[0]
+            if scene_hash(config) != row_key["scene_hash"]:
+                raise ValueError(f"Recomputed config of scene {row_key['scene_hash']} does not match its hash")
+            return config
+
+        def failed_jobs(self, table, key: Dict = None, chunk_size: int = 10000) -> List[Dict]:
+            """
+            Jobs of table (e.g. RenderedScenes) that ended in an error, for the scenes 
+            of a dataset.
+
+            The jobs table only stores the hash of a job's key, so the keys of the 
+            dataset's scenes are hashed the same way and the jobs restricted to them 
+            in SQL, chunk by chunk, instead of fetching the error jobs of all datasets.
+
+            Args:
+                table: table whose jobs to look at
+                key: restriction to a single dataset
+                chunk_size: number of scene keys per query
+
+            Returns:
+                list of dicts with the primary key of the job and the `scene_hash`
+            """
             if key is None:
                 key = {}
-            
+            key = (self.master() & key).fetch1("KEY")
+
+            jobs = table.connection.schemas[table.target.database].jobs
+            errors = jobs & dict(table_name=table.target.table_name, status="error")
+            failed = []
+            for chunk in chunked((self & key).fetch("KEY"), chunk_size):
+                restricted = errors & [dict(key_hash=key_hash(scene_key)) for scene_key in chunk]
+                for job_key, scene_key in zip(*restricted.fetch("KEY", "key")):
+                    failed.append(dict(job_key, scene_hash=scene_key["scene_hash"]))
+            return failed
+
+        def replace(self, key: Dict = None, bad_hashes: List = None, table=None, max_attempts: int = 100):
+            """
+            Replaces scene configs that could not be rendered by new ones, in bulk.
+
+            The replacement of a scene is drawn with `replacement_seed` from the seed stream 
+            of the dataset (seeded with the dataset_hash) and the seed of the bad scene, so it 
+            does not depend on the order or the number of replaced scenes. Seeds whose config 
+            collides with a scene of the dataset (or a replaced one) are skipped. The bad rows 
+            are deleted, the replacements inserted and the bad scenes recorded in the Replaced 
+            part, so that a resumed `fill` leaves them out, all in one transaction.
+
+            Args:
+                key: restriction to a single dataset
+                bad_hashes: scene hashes to replace, defaults to the scenes whose jobs of 
+                    table ended in an error
+                table: table whose error jobs to replace (and clear), e.g. RenderedScenes()
+                max_attempts: candidate seeds per bad scene
+
+            Returns:
+                dict mapping the bad scene hashes to the hashes of their replacements
+            """
+            if key is None:
+                key = {}
+            key = (self.master() & key).fetch1("KEY")
+
+            failed = []
             if bad_hashes is None:
-                return
-            
-            key = (self.master() & key).fetch1("KEY")   
-            
-            if len(bad_hashes) != 0:
-                # delete the non generated scene configs
-                for h in bad_hashes:
-                    ((self & key) & dict(scene_hash=h)).delete_quick()
-                    
-                print(f"Deleted {len(bad_hashes)} from LatentDataset.SceneConfig")
-                dataset_fn, dc = (self.master() & key).fn_config
-                dataset_fn = resolve_data(dataset_fn)
-                
-                dc['num_scenes'] = len(bad_hashes)
-                dc = cleanup_numpy_scalar(dc)
-                scs = dataset_fn(**dc)
-
-                keys = []
-                for sc in scs:
-                    key_copy = key.copy()
-                    key_copy["scene_hash"] = make_hash(sc)
-                    key_copy["scene_config"] = sc
-                    keys.append(key_copy)
-
-                self.insert(keys)
-                print("... Replacing individual scene configs ...")
-                    
+                if table is None:
+                    return {}
+                failed = self.failed_jobs(table, key)
+                bad_hashes = [job["scene_hash"] for job in failed]
+
+            bad_hashes = list(dict.fromkeys(bad_hashes))
+            if len(bad_hashes) == 0:
+                return {}
+
+            dataset_fn, _ = (self.master() & key).fn_config
+            if "seeds" not in inspect.signature(resolve_data(dataset_fn)).parameters:
+                raise TypeError(f"{dataset_fn} has no seeds argument, its scenes cannot be replaced")
+
+            bad = (self & key) & [dict(scene_hash=h) for h in bad_hashes]
+            bad_seeds = dict(zip(*(self.master.SceneLatents & bad.proj()).fetch("scene_hash", "seed")))
+            bad_indices = dict(zip(*(
+                self.master.SceneLatents & bad.proj() & "scene_index is not null"
+            ).fetch("scene_hash", "scene_index")))
+            missing = bad - self.master.SceneLatents
+            for h, config in zip(*missing.fetch("scene_hash", "scene_config")):
+                bad_seeds[h] = int(config["seed"])
+            unknown = set(bad_hashes) - set(bad_seeds)
+            if unknown:
+                raise ValueError(f"{len(unknown)} of the bad hashes are not in the dataset, e.g. {unknown.pop()}")
+
+            # draw replacements, with the next candidate seed for the ones that collide
+            entropy = int(key["dataset_hash"], 16)
+            taken = set((self & key).fetch("scene_hash")) - set(bad_hashes)
+            taken |= set((self.master.Replaced & key).fetch("scene_hash"))
+            attempts = dict.fromkeys(bad_hashes, 0)
+            replacements = {}
+            pending = list(bad_hashes)
+            while pending:
+                seeds = [replacement_seed(entropy, bad_seeds[h], attempts[h]) for h in pending]
+                configs = self.master().get_scene_configs(key=key, seeds=seeds)
+                retry = []
+                for h, config, new_hash in zip(pending, configs, scene_hashes(configs)):
+                    if new_hash in taken or new_hash in bad_seeds:
+                        attempts[h] += 1
+                        if attempts[h] >= max_attempts:
+                            raise RuntimeError(f"No free replacement for scene {h} in {max_attempts} seeds")
+                        retry.append(h)
+                        continue
+                    taken.add(new_hash)
+                    replacements[h] = dict(key, scene_hash=new_hash, scene_config=config)
+                pending = retry
+
+            with self.connection.transaction:
+                (self.master.ObjectLatents & bad.proj()).delete_quick()
+                (self.master.SceneLatents & bad.proj()).delete_quick()
+                bad.delete_quick()
+                rows = list(replacements.values())
+                self.insert(rows)
+                self.master.SceneLatents().insert_configs(rows)
+                self.master.Replaced().insert([
+                    dict(key, scene_hash=h, scene_index=bad_indices.get(h), replacement_hash=row["scene_hash"])
+                    for h, row in replacements.items()
+                ])
+
+            if failed:
+                # the replaced scenes are gone, so are their jobs
+                jobs = table.connection.schemas[table.target.database].jobs
+                (jobs & [{k: job[k] for k in ("table_name", "key_hash")} for job in failed]).delete_quick()
+
+            print(f"... replaced {len(replacements)} scene configs ...")
+            return {h: row["scene_hash"] for h, row in replacements.items()}
+
+        def hash_migration(self, key: Dict = None):
+            """
+            Reports the stored scene hashes that differ from the canonical `scene_hash`
+            of their config (see `hashing.hash_changes`), i.e. the rows that were hashed 
+            with nnfabrik's `make_hash` before the switch, or with an earlier encoding.
+
+            Migrating changes the scene_hash primary key, so the RenderedScenes rows
+            of an affected dataset have to be re-keyed (or re-rendered) with it.
+
+            Args:
+                key: restriction on the SceneConfig table
+
+            Returns:
+                list of dicts with the primary key of each affected row and its `new_hash`
+            """
+            if key is None:
+                key = {}
+
+            rows = (self & key & "scene_config is not null").fetch("KEY", "scene_config")
+            changes = hash_changes(zip(*rows))
+
+            print(f"{len(changes)} of {len(rows[0])} stored scene hashes would change")
+            return changes
+
+    class Replaced(dj.Part):
+        definition = """
+        # scene configs deleted by SceneConfig.replace, left out when a fill is resumed
+        -> master
+        scene_hash:                 varchar(64)    # hash of the replaced scene config
+        ---
+        scene_index=null:           int unsigned   # its index in a dataset with a root_seed
+        replacement_hash:           varchar(64)    # hash of the scene config that replaced it
+        """
+
+    class SceneLatents(dj.Part):
+        definition = """
+        # per scene latents of SceneConfig, as columns for querying
+        -> master.SceneConfig
+        ---
+        seed:                       int unsigned   # seed of the scene
+        scene_index=null:           int unsigned   # index of the scene in a dataset with a root_seed
+        num_objects:                tinyint unsigned
+        sun_x:                      float          # sun position x
+        sun_y:                      float          # sun position y
+        ambient_illumination:       float
+        bg_texture:                 varchar(16)    # texture type of the floor, e.g. MARBLE
+        bg_color_r:                 float
+        bg_color_g:                 float
+        bg_color_b:                 float
+        bg_metallic:                float
+        bg_specular:                float
+        bg_specular_tint:           float
+        bg_roughness:               float
+        bg_transmission:            float
+        bg_transmission_roughness:  float
+        """
+
+        def insert_configs(self, keys: List[Dict], indices: List[int] = None):
+            """
+            Inserts the latents of SceneConfig rows, given as dicts with their 
+            primary key and "scene_config", and optionally their scene_index.
+            """
+            if indices is None:
+                indices = [None] * len(keys)
+
+            scenes, objects = [], []
+            for row, index in zip(keys, indices):
+                key = {k: v for k, v in row.items() if k != "scene_config"}
+                scene, scene_objects = latent_rows(key, row["scene_config"])
+                scene["scene_index"] = index
+                scenes.append(scene)
+                objects.extend(scene_objects)
+            self.insert(scenes)
+            self.master.ObjectLatents().insert(objects)
+
+        def backfill(self, key: Dict = None, chunk_size: int = 10000):
+            """
+            Fills the latents of SceneConfig rows that were inserted before this table 
+            existed, chunk by chunk, each chunk in its own transaction.
+
+            Args:
+                key: restriction on the SceneConfig table
+                chunk_size: number of scene configs per transaction
+            """
+            if key is None:
+                key = {}
+
+            missing = (self.master.SceneConfig & key) - self
+            num_inserted = 0
+            for chunk in chunked(missing.fetch("KEY"), chunk_size):
+                rows = (self.master.SceneConfig & chunk).fetch(as_dict=True)
+                with self.connection.transaction:
+                    self.insert_configs(rows)
+                num_inserted += len(rows)
+                print(f"... backfilled the latents of {num_inserted} scene configs ...")
+
+    class ObjectLatents(dj.Part):
+        definition = """
+        # per object latents of SceneConfig, as columns for querying
+        -> master.SceneLatents
+        object_id:                  tinyint unsigned  # index of the object in the scene config
+        ---
+        shape:                      varchar(32)    # KuBasic asset id, e.g. torus
+        scale:                      float
+        axis:                       char(1)        # axis of rotation, x, y or z
+        angle:                      float          # angle of rotation in radians
+        texture:                    varchar(16)    # texture type, e.g. MARBLE
+        color_r:                    float
+        color_g:                    float
+        color_b:                    float
+        metallic:                   float
+        specular:                   float
+        specular_tint:              float
+        roughness:                  float
+        transmission:               float
+        transmission_roughness:     float
+        position_x=null:            float          # precomputed position, if the config has one
+        position_y=null:            float
+        position_z=null:            float
+        """
+
+    def find_scenes(self, *restrictions, objects: List = ()):
+        """
+        Hashes of the scenes whose latents match the restrictions, without fetching 
+        any scene config.
+
+        Example, the scenes of a dataset with a torus and a MARBLE floor:
+            (LatentDataset & key).find_scenes(dict(bg_texture="MARBLE"), objects=[dict(shape="torus")])
+
+        Args:
+            restrictions: restrictions on SceneLatents, e.g. "num_objects > 4"
+            objects: restrictions on ObjectLatents, each of which at least one object 
+                of a scene has to match, e.g. [dict(shape="torus"), "scale > 1"]
+
+        Returns:
+            np.ndarray of scene hashes
+        """
+        scenes = (self.SceneLatents & self.proj()) & dj.AndList(restrictions)
+        for restriction in objects:
+            scenes = scenes & (self.ObjectLatents & restriction).proj()
+        return scenes.fetch("scene_hash")
+
     @property
     def fn_config(self):
         dataset_fn, dataset_config = self.fetch1("dataset_fn", "dataset_config")
         dataset_config = cleanup_numpy_scalar(dataset_config)
         return dataset_fn, dataset_config
 
-    def get_scene_configs(self, key: Dict = None):
+    def dataset_arg(self, name: str):
+        """
+        Value of a dataset_fn argument, from the dataset_config or the fn's default.
+        None if the dataset_fn has no such argument.
+        """
+        dataset_fn, dataset_config = self.fn_config
+        if name in dataset_config:
+            return dataset_config[name]
+        parameter = inspect.signature(resolve_data(dataset_fn)).parameters.get(name)
+        return None if parameter is None else parameter.default
+
+    @property
+    def num_scenes(self):
+        """
+        Number of scenes the dataset_fn generates, from the config or the fn's default.
+        """
+        return self.dataset_arg("num_scenes")
+
+    def recompute_scene(self, index: int) -> Dict:
+        """
+        Config of the index-th scene of a dataset with a root_seed, computed from 
+        (root_seed, index) without generating the other scenes.
+        """
+        root_seed = self.dataset_arg("root_seed")
+        if root_seed is None:
+            raise ValueError("Only the scenes of datasets with a root_seed can be recomputed")
+        return self.get_scene_configs(seeds=[scene_seed(root_seed, index)])[0]
+
+    @property
+    def scenes(self) -> Sequence:
+        """
+        Scene configs of a dataset with a root_seed, as a lazy sequence (see 
+        `LatentScenes`), so scene i is computed without the other scenes or the database.
+        """
+        if self.dataset_arg("root_seed") is None:
+            raise ValueError("Only the scenes of datasets with a root_seed are reproducible by index")
+        scenes = self.get_scene_configs(stream=True)
+        if not isinstance(scenes, Sequence):
+            raise TypeError("The dataset_fn does not return a sequence with stream=True")
+        return scenes
+
+    def get_scene_configs(self, key: Dict = None, stream: bool = False, **overrides):
+        """
+        Calls the dataset_fn with the stored dataset_config.
+
+        Args:
+            key: restriction to a single dataset
+            stream: ask the dataset_fn for a generator instead of a list, 
+                if the dataset_fn has a `stream` argument
+            overrides: dataset_config entries to replace for this call, e.g. num_scenes
+        """
         if key is None:
             key = {}
 
@@ -109,6 +540,9 @@ class LatentDataset(dj.Manual):
         dataset_fn, dataset_config = (self & key).fn_config
         dataset_fn = resolve_data(dataset_fn)
         dataset_config = cleanup_numpy_scalar(dataset_config)
+        dataset_config.update(overrides)
+        if stream and "stream" in inspect.signature(dataset_fn).parameters:
+            dataset_config["stream"] = True
         return dataset_fn(**dataset_config)
 
     def add_entry(
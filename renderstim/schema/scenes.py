@@ -1,4 +1,5 @@
 from .templates.rendered_scenes import RenderedScenesBase
+from ..codecs import rendered_layer  # adapter for tables with layer_type = "<rendered_layer>"
 from .main import LatentDataset
 from . import schema
 
@@ -0,0 +1,203 @@
+import os
+import time
+import queue
+import traceback
+import multiprocessing as mp
+from typing import Dict
+
+import numpy as np
+import datajoint as dj
+
+from ...generators import WORKERS
+from ...generators.render import cpu_allocation
+
+
+def farm_worker(table_class, keys, dj_config: Dict, worker_id: int,
+                max_scenes: int, threads: int, messages):
+    """
+    Body of one render farm process. Takes keys of table_class from the keys queue, claims
+    them through the DataJoint jobs table and renders them in a single worker session,
+    until max_scenes are done or the queue's final None is reached.
+
+    Reports ("start", worker_id, key, pid) before a scene is rendered, ("scene", worker_id, 
+    scene_hash, timings) per rendered scene, ("error", worker_id, scene_hash, message) per 
+    failed scene and finally ("exit", worker_id, exhausted, pid).
+    """
+    dj.config.update(dj_config)
+    table = table_class()
+    jobs = table.connection.schemas[table.target.database].jobs
+
+    scratch_dir = f"./scratch_dir/farm_{worker_id}_{os.getpid()}"
+    workers = {}
+    num_rendered = 0
+    exhausted = True
+    try:
+        while True:
+            if num_rendered >= max_scenes:
+                exhausted = False
+                break
+            key = keys.get()
+            if key is None:
+                keys.put(None)  # for the other workers
+                break
+            if not jobs.reserve(table.target.table_name, key):
+                continue  # claimed by another process
+            if table & key:
+                jobs.complete(table.target.table_name, key)
+                continue  # rendered in the meantime
+
+            messages.put(("start", worker_id, key, os.getpid()))
+            try:
+                generator_fn, scene_config = table.get_generator_fn_config(key)
+                if generator_fn in WORKERS:
+                    if generator_fn not in workers:
+                        workers[generator_fn] = WORKERS[generator_fn](
+                            scratch_dir=scratch_dir, threads=threads
+                        )
+                    generator_fn = workers[generator_fn]
+                frame, metadata = generator_fn(scene_config)
+                table.insert_frame(dict(key), frame, metadata, allow_direct_insert=True)
+            except Exception as error:
+                jobs.error(
+                    table.target.table_name, key,
+                    error_message=f"{error.__class__.__name__}: {error}"[:2047],
+                    error_stack=traceback.format_exc()
+                )
+                messages.put(("error", worker_id, key["scene_hash"], str(error)))
+                # the blender session may be in a bad state, let the driver replace it
+                exhausted = False
+                break
+
+            jobs.complete(table.target.table_name, key)
+            num_rendered += 1
+            messages.put(("scene", worker_id, key["scene_hash"], metadata.get("timings", {})))
+    finally:
+        for worker in workers.values():
+            worker.close()
+        messages.put(("exit", worker_id, exhausted, os.getpid()))
+
+
+def render_farm(table, *restrictions, num_workers: int = None, scenes_per_worker: int = 100,
+                threads: int = None, report_every: float = 60.0, max_crashes: int = 3):
+    """
+    Renders the scenes of table that match restrictions with num_workers local processes.
+
+    The keys to render are fetched once and handed to the processes through a queue. Every
+    process has its own scratch dir and blender session, and claims keys through the
+    DataJoint jobs table, so farms on several nodes (and `populate(reserve_jobs=True)`) can
+    work on the same dataset. A process is replaced by a fresh one after scenes_per_worker
+    scenes, or after an error, to contain leaks in long-lived blender sessions. The job of
+    a process that dies while rendering a scene is marked as an error.
+
+    Args:
+        table: RenderedScenes table (instance) to fill
+        restrictions: restrictions on the table's scene_config_table, e.g. a dataset key
+        num_workers: number of render processes, defaults to the cpus of this process 
+            (see `generators.render.cpu_allocation`)
+        scenes_per_worker: scenes a process renders before it is recycled
+        threads: blender threads per process, defaults to cpus // num_workers
+        report_every: seconds between throughput reports
+        max_crashes: a worker slot is given up after this many crashes in a row
+
+    Returns:
+        dict with the number of rendered and failed scenes, the elapsed time,
+        scenes per minute, and the per scene timings
+    """
+    cpus = cpu_allocation()
+    if num_workers is None:
+        num_workers = cpus
+    if threads is None:
+        threads = max(cpus // num_workers, 1)
+
+    # spawn, so that no process inherits a blender session or a database connection
+    context = mp.get_context("spawn")
+    messages = context.Queue()
+    dj_config = dict(dj.config)
+    jobs = table.connection.schemas[table.target.database].jobs
+
+    keys = ((table.key_source & dj.AndList(restrictions)) - table).fetch("KEY")
+    np.random.shuffle(keys)  # spread farms on several nodes over the keys
+    key_queue = context.Queue()
+    for key in keys:
+        key_queue.put(key)
+    key_queue.put(None)
+    print(f"... rendering {len(keys)} scenes with {num_workers} workers ...")
+
+    def start(worker_id):
+        process = context.Process(
+            target=farm_worker,
+            args=(type(table), key_queue, dj_config, worker_id,
+                  scenes_per_worker, threads, messages),
+            daemon=True
+        )
+        process.start()
+        return process
+
+    processes = {i: start(i) for i in range(num_workers)}
+    crashes = {i: 0 for i in range(num_workers)}
+    rendering = {}  # worker_id: key of the scene its process is rendering
+    timings = []
+    errors = []
+    start_time = last_report = time.perf_counter()
+
+    while processes:
+        try:
+            message = messages.get(timeout=5)
+        except queue.Empty:
+            message = None
+
+        if message is not None and message[0] == "start":
+            worker_id, key, pid = message[1:]
+            if worker_id in processes and processes[worker_id].pid == pid:
+                rendering[worker_id] = key
+        elif message is not None and message[0] == "scene":
+            timings.append(dict(scene_hash=message[2], **message[3]))
+            crashes[message[1]] = 0
+            rendering.pop(message[1], None)
+        elif message is not None and message[0] == "error":
+            errors.append(dict(scene_hash=message[2], error=message[3]))
+            rendering.pop(message[1], None)
+        elif message is not None and message[0] == "exit":
+            worker_id, exhausted, pid = message[1:]
+            # ignore the exit of a process that was already replaced after a crash
+            if worker_id in processes and processes[worker_id].pid == pid:
+                processes.pop(worker_id).join()
+                if not exhausted:
+                    processes[worker_id] = start(worker_id)
+
+        # processes that died without reporting, e.g. a segfault in blender
+        for worker_id, process in list(processes.items()):
+            if not process.is_alive() and process.exitcode not in (None, 0):
+                key = rendering.pop(worker_id, None)
+                if key is not None:
+                    # its reservation would otherwise block the scene forever
+                    error = f"render process died with exit code {process.exitcode}"
+                    jobs.error(table.target.table_name, key, error_message=error)
+                    errors.append(dict(scene_hash=key["scene_hash"], error=error))
+                crashes[worker_id] += 1
+                if crashes[worker_id] >= max_crashes:
+                    print(f"... worker {worker_id} crashed {max_crashes} times, giving up on it ...")
+                    processes.pop(worker_id)
+                    continue
+                print(f"... worker {worker_id} died with exit code {process.exitcode}, restarting ...")
+                processes[worker_id] = start(worker_id)
+
+        now = time.perf_counter()
+        if now - last_report >= report_every:
+            last_report = now
+            print(
+                f"... {len(timings)} scenes rendered, {len(errors)} failed, "
+                f"{60 * len(timings) / (now - start_time):.1f} scenes/minute ..."
+            )
+
+    elapsed = time.perf_counter() - start_time
+    scenes_per_minute = 60 * len(timings) / elapsed
+    print(f"... rendered {len(timings)} scenes in {elapsed:.0f}s, {scenes_per_minute:.1f} scenes/minute ...")
+    return dict(
+        rendered=len(timings),
+        failed=len(errors),
+        elapsed=elapsed,
+        scenes_per_minute=scenes_per_minute,
+        timings=timings,
+        errors=errors
+    )
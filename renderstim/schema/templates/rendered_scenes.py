@@ -1,7 +1,14 @@
+import types
+from contextlib import nullcontext
 from typing import Dict
 import datajoint as dj
-from ..main import LatentDataset
-from ...generators import resolve_generator
+import numpy as np
+from ..main import LatentDataset, chunked
+from ...codecs import rendered_layer
+from ...generators import resolve_generator, WORKERS
+from .farm import render_farm
+from ...latents.batch import SceneBatch
+from ...shards import ShardWriter
 import gc
 
 from nnfabrik.utility.nnf_helper import cleanup_numpy_scalar
@@ -14,6 +21,59 @@ dj.config['stores'].update({
 })
 
 
+LAYERS = ("scene", "segmentation", "object_coordinates", "normals", "depth")
+
+# RenderedScenes layer column of every `render_scene` layer
+FRAME_LAYERS = dict(
+    scene="grayscale", 
+    segmentation="segmentation", 
+    object_coordinates="object_coordinates", 
+    normals="normal", 
+    depth="depth"
+)
+
+
+class RenderedViewBase:
+    """
+    Layers of one view of a scene whose config has "camera_views", see `render_scene`. 
+    The layers of such scenes are stored here, one row per view, and their master row 
+    only holds the metadata.
+    """
+
+    @property
+    def definition(self):
+        definition = """
+        # views of a scene rendered from several cameras
+        -> master
+        view_index:                        smallint unsigned # index into the config's camera_views
+        ---
+        scene=null:                        {layer_type}     # grayscale scene
+        segmentation=null:                 {layer_type}     
+        object_coordinates=null:           {layer_type}     
+        normals=null:                      {layer_type}     
+        depth=null:                        {layer_type}     
+        """.format(layer_type=self.master.layer_type)
+        return definition
+
+
+def depth_bound(depth_scaling, bound: str):
+    """
+    Depth bound of a scene's depth_scaling, a list of them for scenes with camera_views.
+    """
+    if isinstance(depth_scaling, list):
+        return [scaling[bound] for scaling in depth_scaling]
+    return depth_scaling.get(bound, np.nan)
+
+
+def views_per_scene(dataset) -> int:
+    """
+    Number of camera views the scenes of a LatentDataset entry are rendered from, 
+    None if they are rendered from the single camera_position.
+    """
+    camera_views = dataset.dataset_arg("camera_views")
+    return dataset.dataset_arg("num_views") if camera_views is None else len(camera_views)
+
+
 class RenderedScenesBase(dj.Computed):
     """
     Base class for defining a RenderedScene table used to store 
@@ -24,11 +84,23 @@ class RenderedScenesBase(dj.Computed):
 
     This table should depend on an SceneConfig table, that stores the configs of individual images.
     By default, it depends on the LatentDataset.SceneConfig table, as found in ...schema.main
+
+    The layer columns are nullable, layers that were not requested through the dataset's 
+    `output_layers` are stored as null and take no external storage. Tables declared before 
+    the columns became nullable can be updated with `RenderedScenes().alter()`.
+
+    Set `layer_type = "<rendered_layer>"` in a subclass to store the layers compressed 
+    (see `codecs.LayerAdapter`); they are decoded on fetch and the codec is recorded in 
+    the metadata. By default the layers are stored as raw blobs.
+
+    Scenes rendered from several `camera_views` store their layers in the View part, 
+    one row per view_index, see `fetch_views`.
     """
 
     # table level comment
     table_comment = "rendered scenes"
     scene_config_table = LatentDataset.SceneConfig
+    layer_type = "blob@rendered"
 
     @property
     def definition(self):
@@ -36,22 +108,46 @@ class RenderedScenesBase(dj.Computed):
         # {table_comment}
         -> self.scene_config_table()
         ---
-        scene:                             blob@rendered     
-        segmentation:                      blob@rendered     
-        object_coordinates:                blob@rendered     
-        normals:                           blob@rendered     
-        depth:                             blob@rendered     
+        scene=null:                        {layer_type}     # grayscale scene
+        segmentation=null:                 {layer_type}     
+        object_coordinates=null:           {layer_type}     
+        normals=null:                      {layer_type}     
+        depth=null:                        {layer_type}     
         metadata:                          longblob          # dict containing metadata about the scene
         rendering_ts=CURRENT_TIMESTAMP: timestamp            # UTZ timestamp at time of insertion
-        """.format(table_comment=self.table_comment)
+        """.format(table_comment=self.table_comment, layer_type=self.layer_type)
         return definition
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # a part table is bound to a single master, so every table gets its own View class
+        if "View" not in cls.__dict__:
+            cls.View = types.new_class("View", (RenderedViewBase, dj.Part))
+
+    def dataset_scenes(self, key: Dict):
+        """
+        `LatentDataset.scenes` of the dataset of key, cached on the table instance, 
+        or None if its scenes are not reproducible by index.
+        """
+        master = self.scene_config_table.master
+        primary_key = master().primary_key
+        dataset = {k: key[k] for k in primary_key if k in key}
+        if len(dataset) != len(primary_key):
+            return None
+
+        cache = self.__dict__.setdefault("_dataset_scenes", {})
+        dataset_id = tuple(sorted(dataset.items()))
+        if dataset_id not in cache:
+            table = master() & dataset
+            cache[dataset_id] = table.scenes if table.dataset_arg("root_seed") is not None else None
+        return cache[dataset_id]
+
     def get_generator_fn_config(self, key: Dict = None):
         if key is None:
             key = {}
-        gf, sc = (self.scene_config_table() & key).fetch1("generator_fn", "scene_config")
-        generator_fn = resolve_generator(gf)
-        scene_config = cleanup_numpy_scalar(sc)
+        scene = self.scene_config_table() & key
+        generator_fn = resolve_generator(scene.fetch1("generator_fn"))
+        scene_config = cleanup_numpy_scalar(scene.fetch_config(self.dataset_scenes(key)))
         return generator_fn, scene_config
 
     def make(self, key):
@@ -62,11 +158,192 @@ class RenderedScenesBase(dj.Computed):
         """
         generator_fn, scene_config = self.get_generator_fn_config(key)
         frame, metadata = generator_fn(scene_config)
-        key["scene"] = frame["grayscale"]
-        key["segmentation"] = frame["segmentation"]
-        key["normals"] = frame["normal"]
-        key["object_coordinates"] = frame["object_coordinates"]
-        key["depth"] = frame["depth"]
-        key["metadata"] = metadata
-        self.insert1(key)
-        gc.collect()
\ No newline at end of file
+        self.insert_frame(key, frame, metadata)
+        gc.collect()
+
+    def insert_frame(self, key, frame, metadata, allow_direct_insert: bool = False):
+        """
+        Stores the frame and metadata that the generator_fn returned for key. Inserts made 
+        outside of `populate` (e.g. by `render_batches` and the render farm) have to pass 
+        allow_direct_insert=True, as DataJoint refuses them into a computed table otherwise.
+        """
+        if self.layer_type == "<rendered_layer>":
+            metadata["layer_codec"] = rendered_layer.codec
+        views = metadata.get("camera_views")
+        if views is None:
+            # layers that were not rendered are stored as null
+            for column, layer in FRAME_LAYERS.items():
+                key[column] = frame.get(layer)
+            key["metadata"] = metadata
+            self.insert1(key, allow_direct_insert=allow_direct_insert)
+            return
+
+        # the layers are stacked per view, and stored one view per row of the View part
+        rows = [
+            dict(
+                key, view_index=i, 
+                **{column: None if layer not in frame else frame[layer][i] for column, layer in FRAME_LAYERS.items()}
+            ) for i in range(len(views))
+        ]
+        transaction = nullcontext() if self.connection.in_transaction else self.connection.transaction
+        with transaction:
+            self.insert1(dict(key, metadata=metadata), allow_direct_insert=allow_direct_insert)
+            self.View().insert(rows)
+
+    def fetch_views(self, key: Dict) -> Dict:
+        """
+        Layers of a scene rendered from several camera_views, stacked in view order as 
+        `render_scene` returned them. Layers that were not rendered are None.
+        """
+        rows = (self.View() & key).fetch(*LAYERS, order_by="view_index", as_dict=True)
+        return {
+            layer: None if rows[0][layer] is None else np.stack([row[layer] for row in rows]) 
+            for layer in LAYERS
+        }
+
+    def render_batches(self, *restrictions, batch_size: int = 100, max_scenes: int = None):
+        """
+        Renders the scenes that are not yet in the table with long-lived render workers, 
+        keeping one Blender / PyBullet session alive per batch of `batch_size` scenes 
+        instead of building one per scene. Scenes whose generator_fn has no worker are 
+        rendered by calling the generator_fn directly.
+
+        Args:
+            restrictions: restrictions on the scene_config_table, e.g. a dataset key
+            batch_size: number of scenes rendered per worker session
+            max_scenes: stop after this many scenes
+
+        Returns:
+            list of dicts with the scene_hash and the setup, simulate, render and postprocess time in seconds
+        """
+        keys = ((self.key_source & dj.AndList(restrictions)) - self).fetch("KEY")
+        if max_scenes is not None:
+            keys = keys[:max_scenes]
+
+        timings = []
+        for batch_start in range(0, len(keys), batch_size):
+            workers = {}
+            batch = []
+            try:
+                for key in keys[batch_start:batch_start + batch_size]:
+                    if self & key:
+                        continue  # rendered in the meantime
+                    generator_fn, scene_config = self.get_generator_fn_config(key)
+                    if generator_fn in WORKERS:
+                        if generator_fn not in workers:
+                            workers[generator_fn] = WORKERS[generator_fn]()
+                        generator_fn = workers[generator_fn]
+                    frame, metadata = generator_fn(scene_config)
+                    self.insert_frame(dict(key), frame, metadata, allow_direct_insert=True)
+                    batch.append(dict(scene_hash=key["scene_hash"], **metadata.get("timings", {})))
+            finally:
+                for worker in workers.values():
+                    worker.close()
+
+            timings.extend(batch)
+            batch = [t for t in batch if "setup" in t]
+            if batch:
+                print(
+                    f"... rendered {len(timings)}/{len(keys)} scenes, per scene "
+                    f"setup: {np.mean([t['setup'] for t in batch]):.2f}s, "
+                    f"simulate: {np.mean([t.get('simulate', 0) for t in batch]):.2f}s, "
+                    f"render: {np.mean([t['render'] for t in batch]):.2f}s ..."
+                )
+        return timings
+
+    def render_farm(self, *restrictions, num_workers: int = None, scenes_per_worker: int = 100,
+                    threads: int = None):
+        """
+        Renders the missing scenes with num_workers local render processes that claim keys 
+        through the jobs table, see `farm.render_farm`.
+
+        Args:
+            restrictions: restrictions on the scene_config_table, e.g. a dataset key
+            num_workers: number of render processes, defaults to the cpus of this process
+            scenes_per_worker: scenes a process renders before it is replaced by a fresh one
+            threads: blender threads per process, defaults to cpus // num_workers
+
+        Returns:
+            dict with rendered / failed counts, elapsed time, scenes_per_minute and timings
+        """
+        return render_farm(
+            self, *restrictions, 
+            num_workers=num_workers, 
+            scenes_per_worker=scenes_per_worker, 
+            threads=threads
+        )
+
+    def export_shards(self, directory: str, *restrictions, shard_size: int = 10000, 
+                      chunk_size: int = 500, max_objects: int = None, string_width: int = 32):
+        """
+        Exports the rendered layers and the flattened latents of the matching scenes to a 
+        sharded, memory-mappable dataset (see `renderstim.shards`), that training jobs can 
+        read with `ShardReader` without DataJoint.
+
+        Scenes are fetched and written chunk_size at a time, so memory does not grow with 
+        the number of scenes. Every layer that is not null in the first scene becomes a 
+        column, the latents become the columns of `SceneBatch.to_arrays`, next to 
+        scene_hash, depth_min and depth_max. Scenes with camera_views are exported with 
+        their layers and depth ranges stacked per view, as returned by `fetch_views`, so 
+        all exported datasets need the same number of views per scene.
+
+        Args:
+            directory: output directory
+            restrictions: restrictions on the table, e.g. a dataset key
+            shard_size: scenes per shard
+            chunk_size: scenes fetched and written at once
+            max_objects: objects the per-object columns are padded to, defaults to the 
+                largest max_num_objects of the exported datasets
+            string_width: minimum width of the string columns
+
+        Returns:
+            number of exported scenes
+
+        Raises:
+            ValueError: if the datasets differ in their number of views per scene, 
+                e.g. single view datasets with camera_views ones
+        """
+        restriction = dj.AndList(restrictions)
+        datasets = (self.scene_config_table.master() & (self & restriction)).fetch("KEY")
+        num_views = {views_per_scene(self.scene_config_table.master() & key) for key in datasets}
+        if len(num_views) > 1:
+            raise ValueError(
+                "The exported datasets have different numbers of views per scene ("
+                + ", ".join("single view" if n is None else f"{n} views" for n in sorted(num_views, key=lambda n: n or 0))
+                + "), export them separately"
+            )
+        if max_objects is None:
+            max_objects = max(
+                (self.scene_config_table.master() & key).dataset_arg("max_num_objects") 
+                for key in datasets
+            )
+
+        keys = (self & restriction).fetch("KEY")
+        layers = None
+        num_exported = 0
+        writer = ShardWriter(directory, shard_size=shard_size, string_width=string_width)
+        for chunk in chunked(keys, chunk_size):
+            rows = (self & chunk).fetch(*self.primary_key, "metadata", *LAYERS, as_dict=True)
+            for row in rows:
+                if "camera_views" in row["metadata"]:
+                    row.update(self.fetch_views({k: row[k] for k in self.primary_key}))
+            if layers is None:
+                layers = [layer for layer in LAYERS if rows[0][layer] is not None]
+
+            columns = SceneBatch.from_configs([row["metadata"] for row in rows]).to_arrays(max_objects)
+            columns["scene_hash"] = np.array([row["scene_hash"] for row in rows])
+            for column, bound in (("depth_min", "min_depth"), ("depth_max", "max_depth")):
+                columns[column] = np.array([
+                    depth_bound(row["metadata"].get("depth_scaling", {}), bound) for row in rows
+                ])
+            for layer in layers:
+                if any(row[layer] is None for row in rows):
+                    raise ValueError(f"Layer {layer} is null for some of the exported scenes")
+                columns[layer] = np.stack([row[layer] for row in rows])
+
+            writer.write(columns)
+            num_exported += len(rows)
+            print(f"... exported {num_exported}/{len(keys)} scenes ...")
+
+        writer.close(layers=layers, max_objects=max_objects, datasets=datasets)
+        return num_exported
@@ -0,0 +1,246 @@
+"""
+Sharded, fixed-shape array datasets on disk, for training jobs that should not talk to DataJoint.
+
+A dataset directory holds `index.json` and one sub directory per shard, with one `.npy` file per
+column of shape (shard_size, ...). Every column has a fixed shape and dtype across the dataset,
+so the files can be memory-mapped and rows read with plain indexing. Only numpy is needed to read.
+"""
+import os
+import json
+import queue
+import threading
+from typing import Dict, Iterator, List
+import numpy as np
+
+
+class ShardWriter:
+    """
+    Appends rows to a sharded dataset, chunk by chunk, so that only one chunk is held in memory.
+
+    The columns and their row shape / dtype are fixed by the first chunk. String columns get
+    at least `string_width` characters, longer strings in later chunks raise a ValueError.
+
+    Usage:
+        with ShardWriter(directory, shard_size=10000) as writer:
+            for chunk in chunks:
+                writer.write({"scene": scenes, "seed": seeds})
+    """
+
+    def __init__(self, directory: str, shard_size: int = 10000, string_width: int = 32):
+        self.directory = directory
+        self.shard_size = shard_size
+        self.string_width = string_width
+        self.columns = None
+        self.shards = []
+        self.arrays = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _spec(self, column: np.ndarray):
+        dtype = column.dtype
+        if dtype.kind == "U":
+            dtype = np.dtype(f"<U{max(dtype.itemsize // 4, self.string_width)}")
+        return dict(shape=list(column.shape[1:]), dtype=dtype.str)
+
+    def _open_shard(self):
+        name = f"shard_{len(self.shards):05d}"
+        os.makedirs(os.path.join(self.directory, name), exist_ok=True)
+        self.arrays = {
+            column: np.lib.format.open_memmap(
+                os.path.join(self.directory, name, f"{column}.npy"),
+                mode="w+",
+                dtype=np.dtype(spec["dtype"]),
+                shape=(self.shard_size, *spec["shape"])
+            ) for column, spec in self.columns.items()
+        }
+        self.shards.append(dict(name=name, num_rows=0))
+
+    def _close_shard(self):
+        for array in self.arrays.values():
+            array.flush()
+        self.arrays = None
+
+    def write(self, chunk: Dict[str, np.ndarray]):
+        """
+        Appends the rows of chunk, a dict of arrays with the same number of rows.
+        """
+        chunk = {column: np.asarray(values) for column, values in chunk.items()}
+        if self.columns is None:
+            self.columns = {column: self._spec(values) for column, values in chunk.items()}
+
+        if set(chunk) != set(self.columns):
+            raise ValueError(f"Expected columns {sorted(self.columns)}, got {sorted(chunk)}")
+        for column, values in chunk.items():
+            spec = self.columns[column]
+            if list(values.shape[1:]) != spec["shape"]:
+                raise ValueError(f"Column {column} has rows of shape {values.shape[1:]}, expected {spec['shape']}")
+            dtype = np.dtype(spec["dtype"])
+            if dtype.kind == "U" and len(values) and np.char.str_len(values).max() > dtype.itemsize // 4:
+                raise ValueError(f"Column {column} has strings longer than {dtype.itemsize // 4}, raise string_width")
+
+        num_rows = len(next(iter(chunk.values())))
+        start = 0
+        while start < num_rows:
+            if self.arrays is None:
+                self._open_shard()
+            shard = self.shards[-1]
+            stop = min(num_rows, start + self.shard_size - shard["num_rows"])
+            for column, values in chunk.items():
+                self.arrays[column][shard["num_rows"]:shard["num_rows"] + stop - start] = values[start:stop]
+            shard["num_rows"] += stop - start
+            start = stop
+            if shard["num_rows"] == self.shard_size:
+                self._close_shard()
+
+    def close(self, **attributes):
+        """
+        Flushes the last shard and writes index.json, with attributes added to it.
+        """
+        if self.arrays is not None:
+            self._close_shard()
+        index = dict(
+            shard_size=self.shard_size,
+            num_rows=sum(shard["num_rows"] for shard in self.shards),
+            columns=self.columns or {},
+            shards=self.shards,
+            **attributes
+        )
+        with open(os.path.join(self.directory, "index.json"), "w") as fp:
+            json.dump(index, fp, indent=2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+
+
+class ShardReader:
+    """
+    Random access to a dataset written by `ShardWriter`, through memory-mapped files.
+
+    Indexing with an int returns a dict with one row per column, with a slice a dict of
+    arrays. `iterate` reads batches sequentially and prefetches the next ones in a thread.
+
+    Args:
+        directory: dataset directory
+        columns: columns to read, defaults to all
+    """
+
+    def __init__(self, directory: str, columns: List[str] = None):
+        with open(os.path.join(directory, "index.json")) as fp:
+            self.index = json.load(fp)
+        self.directory = directory
+        self.columns = list(self.index["columns"]) if columns is None else list(columns)
+        self.shard_size = self.index["shard_size"]
+        self.shards = [
+            {
+                column: np.load(os.path.join(directory, shard["name"], f"{column}.npy"), mmap_mode="r")
+                for column in self.columns
+            } for shard in self.index["shards"]
+        ]
+
+    def __len__(self):
+        return self.index["num_rows"]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return self.take(np.arange(start, stop, step))
+            return self.read(start, stop)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"row {index} out of range for a dataset of {len(self)}")
+        shard, row = divmod(index, self.shard_size)
+        return {column: np.array(self.shards[shard][column][row]) for column in self.columns}
+
+    def read(self, start: int, stop: int) -> Dict[str, np.ndarray]:
+        """
+        Rows start:stop of every column, copied into memory.
+        """
+        stop = min(stop, len(self))
+        parts = {column: [] for column in self.columns}
+        while start < stop:
+            shard, row = divmod(start, self.shard_size)
+            end = min(row + stop - start, self.shard_size)
+            for column in self.columns:
+                parts[column].append(self.shards[shard][column][row:end])
+            start += end - row
+        return {
+            column: np.concatenate(arrays) if arrays else self._empty(column)
+            for column, arrays in parts.items()
+        }
+
+    def _empty(self, column: str) -> np.ndarray:
+        spec = self.index["columns"][column]
+        return np.empty((0, *spec["shape"]), dtype=spec["dtype"])
+
+    def take(self, indices) -> Dict[str, np.ndarray]:
+        """
+        Rows at indices of every column, e.g. a shuffled batch.
+
+        Raises:
+            IndexError: if an index is out of range
+        """
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+        out_of_range = (indices < -len(self)) | (indices >= len(self))
+        if out_of_range.any():
+            raise IndexError(f"row {indices[out_of_range][0]} out of range for a dataset of {len(self)}")
+        if not len(indices):
+            return {column: self._empty(column) for column in self.columns}
+        indices = np.where(indices < 0, indices + len(self), indices)
+        shards, rows = np.divmod(indices, self.shard_size)
+        return {
+            column: np.stack([self.shards[s][column][r] for s, r in zip(shards, rows)])
+            for column in self.columns
+        }
+
+    def iterate(self, batch_size: int = 256, prefetch: int = 2, start: int = 0, stop: int = None) -> Iterator[Dict]:
+        """
+        Yields consecutive batches of rows start:stop, while a background thread reads
+        the next `prefetch` batches. The thread stops when the iteration is left early.
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        batches = queue.Queue(maxsize=max(prefetch, 1))
+        stopped = threading.Event()
+        done = object()
+
+        def put(item):
+            # gives up once the consumer is gone, instead of blocking on a full queue
+            while not stopped.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        def produce():
+            try:
+                for batch_start in range(start, stop, batch_size):
+                    if stopped.is_set():
+                        return
+                    put(self.read(batch_start, min(batch_start + batch_size, stop)))
+                put(done)
+            except BaseException as error:
+                put(error)
+
+        thread = threading.Thread(target=produce, daemon=True)
+        thread.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is done:
+                    break
+                if isinstance(batch, BaseException):
+                    raise batch
+                yield batch
+        finally:
+            stopped.set()
+            while True:
+                try:
+                    batches.get_nowait()
+                except queue.Empty:
+                    break
+            thread.join()
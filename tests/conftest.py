@@ -0,0 +1,7 @@
+"""
+Without kubric (and blender) installed, the tests run against the stub backend of
+`renderstim.benchmarks.stub`.
+"""
+from renderstim.benchmarks import stub
+
+STUBBED = stub.install()
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from renderstim.latents.batch import sample_batch
+from renderstim.latents.dataset import TEXTURES, latent_dataset
+from renderstim.latents.hashing import scene_hash
+from renderstim.latents.materials import MATERIAL_KEYS
+from renderstim.latents.textures import get_texture
+
+VARIANTS = [
+    dict(),
+    dict(texels_per_pixel=0.5, placement="analytic", physics="settle", physics_frames=4),
+    dict(output_layers=["rgba", "depth"], render_profile="fast"),
+    dict(camera_views=[dict(position=[0.0, -8.0, 3.6]), dict(position=[1.0, -8.0, 3.6])]),
+    dict(num_views=2, camera_jitter=[0.5, 0.5, 0.2]),
+    dict(precompute_positions=True),
+]
+
+
+@pytest.mark.parametrize("kwargs", VARIANTS)
+def test_compat_batch_equals_latent_dataset(kwargs):
+    batch = sample_batch(num_scenes=10, seed=0, compat=True, **kwargs)
+    configs = latent_dataset(seeds=[int(seed) for seed in batch.scenes["seed"]], **kwargs)
+    assert [scene_hash(c) for c in batch] == [scene_hash(c) for c in configs]
+
+
+@pytest.mark.parametrize("kwargs", VARIANTS)
+def test_vectorized_batch_has_the_keys_of_sample_scene(kwargs):
+    batch = sample_batch(num_scenes=50, seed=0, **kwargs)
+    config = latent_dataset(num_scenes=1, root_seed=0, **kwargs)[0]
+
+    for scene in batch:
+        assert scene.keys() == config.keys()
+        for texture in [scene["bg_texture"], *scene["object_textures"]]:
+            assert texture.keys() == get_texture(texture["type"], np.random.RandomState(0), size=16).keys()
+        for material in [scene["bg_material"], *scene["object_materials"]]:
+            assert list(material) == list(MATERIAL_KEYS)
+
+
+def test_vectorized_batch_follows_the_distributions_of_sample_scene():
+    batch = list(sample_batch(num_scenes=4000, seed=0))
+    configs = latent_dataset(num_scenes=1000, root_seed=0)
+
+    def column(scenes, latent):
+        return np.array([latent(scene) for scene in scenes], dtype=np.float64)
+
+    def objects(scenes, latent):
+        return np.array([v for scene in scenes for v in latent(scene)])
+
+    for latent in (
+        lambda c: c["num_objects"],
+        lambda c: c["sun_position"][0],
+        lambda c: c["ambient_illumination"],
+        lambda c: c["bg_material"]["roughness"],
+    ):
+        a, b = column(batch, latent), column(configs, latent)
+        assert a.min() >= b.min() - 0.05 and a.max() <= b.max() + 0.05
+        assert abs(a.mean() - b.mean()) < 4 * b.std() / np.sqrt(len(b))
+
+    for latent in (lambda c: c["object_scales"], lambda c: c["object_angles_of_rotation"]):
+        a, b = objects(batch, latent).astype(np.float64), objects(configs, latent).astype(np.float64)
+        assert abs(a.mean() - b.mean()) < 4 * b.std() / np.sqrt(len(b))
+
+    for latent, values in (
+        (lambda c: [c["bg_texture"]["type"]], TEXTURES),
+        (lambda c: [t["type"] for t in c["object_textures"]], TEXTURES),
+        (lambda c: c["object_shapes"], None),
+        (lambda c: c["object_axes_of_rotation"], None),
+    ):
+        a, b = objects(batch, latent), objects(configs, latent)
+        assert set(a) == set(b)
+        if values is not None:
+            assert set(a) <= set(values)
+        for value in set(b):
+            p = np.mean(b == value)
+            assert abs(np.mean(a == value) - p) < 4 * np.sqrt(p * (1 - p) / len(b))
+
+
+def test_vectorized_seeds_tell_the_scenes_apart():
+    batch = sample_batch(num_scenes=100, seed=0)
+    assert len(set(batch.scenes["seed"])) == 100
+    assert sample_batch(num_scenes=100, seed=0).scenes["seed"].tolist() == batch.scenes["seed"].tolist()
@@ -0,0 +1,91 @@
+import os
+import time
+
+import numpy as np
+
+from renderstim.latents.cache import TextureCache, texture_key
+
+TEXTURE = dict(type="MARBLE", noise_scale=0.25, noise_depth=np.int64(2))
+
+
+def pixels(value, size=8):
+    return np.full((size, size, 4), value, dtype=np.float32)
+
+
+def files(directory, suffix=".npy"):
+    return sorted(name for name in os.listdir(directory) if name.endswith(suffix))
+
+
+def test_texture_key():
+    assert texture_key(TEXTURE, 8) == texture_key(dict(TEXTURE, noise_depth=2), 8)
+    assert texture_key(TEXTURE, 8) != texture_key(TEXTURE, 16)
+
+
+def test_miss_then_hit(tmp_path):
+    cache = TextureCache(str(tmp_path))
+    assert cache.get(TEXTURE, 8) is None
+
+    cache.put(TEXTURE, 8, pixels(0.5))
+    hit = cache.get(TEXTURE, 8)
+    assert hit.dtype == np.float32
+    np.testing.assert_array_equal(hit, pixels(0.5))
+    assert cache.get(TEXTURE, 16) is None
+    assert files(tmp_path, ".tmp") == []
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    nbytes = os.path.getsize(save_one(tmp_path))
+    cache = TextureCache(str(tmp_path / "cache"), max_bytes=2 * nbytes)
+    textures = [dict(TEXTURE, noise_scale=float(i)) for i in range(3)]
+
+    cache.put(textures[0], 8, pixels(0))
+    cache.put(textures[1], 8, pixels(1))
+    past = time.time() - 100
+    os.utime(cache.path(texture_key(textures[0], 8)), (past, past))
+    os.utime(cache.path(texture_key(textures[1], 8)), (past - 10, past - 10))
+    assert cache.get(textures[0], 8) is not None  # now the most recently used
+
+    cache.put(textures[2], 8, pixels(2))
+    assert cache.get(textures[1], 8) is None
+    assert cache.get(textures[0], 8) is not None
+    assert cache.get(textures[2], 8) is not None
+
+
+def test_put_rescans_only_when_needed(tmp_path):
+    cache = TextureCache(str(tmp_path), scan_every=4)
+    scans = []
+    evict = cache.evict
+    cache.evict = lambda: scans.append(1) or evict()
+    for i in range(9):
+        cache.put(dict(TEXTURE, noise_scale=float(i)), 8, pixels(i))
+    # the first put, then every 4th
+    assert len(scans) == 3
+
+
+def test_two_writers_of_the_same_key(tmp_path):
+    first, second = TextureCache(str(tmp_path)), TextureCache(str(tmp_path))
+    first.put(TEXTURE, 8, pixels(0.25))
+    second.put(TEXTURE, 8, pixels(0.25))
+
+    assert files(tmp_path) == [texture_key(TEXTURE, 8) + ".npy"]
+    assert files(tmp_path, ".tmp") == []
+    np.testing.assert_array_equal(first.get(TEXTURE, 8), second.get(TEXTURE, 8))
+
+
+def test_stale_temporary_files_are_swept(tmp_path):
+    cache = TextureCache(str(tmp_path), stale_seconds=60)
+    stale, fresh = tmp_path / "stale.tmp", tmp_path / "fresh.tmp"
+    stale.write_bytes(b"0" * 100)
+    fresh.write_bytes(b"0" * 100)
+    past = time.time() - 120
+    os.utime(stale, (past, past))
+
+    cache.evict()
+    assert files(tmp_path, ".tmp") == ["fresh.tmp"]
+    assert cache._total == 100
+
+
+def save_one(directory):
+    path = os.path.join(directory, "one.npy")
+    np.save(path, pixels(0))
+    return path
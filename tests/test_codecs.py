@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("datajoint")
+from renderstim import codecs
+
+
+def layers():
+    rng = np.random.default_rng(0)
+    rgba = rng.integers(0, 256, size=(2, 24, 32, 4), dtype=np.uint8)
+    rgba[..., 3] = 255
+    depth = rng.integers(0, 2**16, size=(2, 24, 32), dtype=np.uint16)
+    depth[:, :12] = 2**16 - 1  # background
+    segmentation = np.repeat(np.arange(6, dtype=np.uint8), 128).reshape(24, 32)
+    return dict(
+        rgba=rgba,
+        depth=depth,
+        segmentation=segmentation,
+        segmentation_ids=segmentation.astype(np.uint32) * 70000,
+        view=rgba[1, ::2, 1:],  # not contiguous
+    )
+
+
+@pytest.fixture(params=["zlib", "zstd"])
+def codec(request):
+    if request.param == "zstd":
+        pytest.importorskip("zstandard")
+    return request.param
+
+
+@pytest.mark.parametrize("name", list(layers()))
+def test_layers_round_trip(codec, name):
+    array = layers()[name]
+    encoded = codecs.encode_layer(array, codec)
+    assert encoded["codec"] == codec and encoded["data"].dtype == np.uint8
+
+    decoded = codecs.decode_layer(encoded)
+    assert decoded.dtype == array.dtype and decoded.shape == array.shape
+    np.testing.assert_array_equal(decoded, array)
+
+
+@pytest.mark.parametrize("name", list(layers()))
+def test_adapter_round_trip(codec, name):
+    adapter = codecs.LayerAdapter(codec)
+    array = layers()[name]
+    decoded = adapter.get(adapter.put(array))
+    assert decoded.dtype == array.dtype
+    np.testing.assert_array_equal(decoded, array)
+
+
+def test_adapter_passes_missing_and_raw_layers():
+    adapter = codecs.LayerAdapter("zlib")
+    assert adapter.put(None) is None
+    assert adapter.get(None) is None
+    raw = layers()["depth"]
+    assert adapter.get(raw) is raw
@@ -0,0 +1,72 @@
+import pytest
+
+from renderstim.latents.batch import SceneBatch, sample_batch
+from renderstim.latents.dataset import RootSeeds, latent_dataset, scene_seed, unplaced
+from renderstim.latents.hashing import scene_hash
+
+
+def without_positions(config):
+    return {k: v for k, v in config.items() if k != "object_positions"}
+
+
+def test_precomputed_positions_keep_the_latents():
+    placed = latent_dataset(num_scenes=200, root_seed=0, precompute_positions=True)
+    drawn = latent_dataset(num_scenes=200, root_seed=0)
+    assert [scene_hash(without_positions(c)) for c in placed] == [scene_hash(c) for c in drawn]
+
+    for config in placed:
+        if not unplaced(config):
+            assert len(config["object_positions"]) == config["num_objects"]
+    assert 0 < sum(map(unplaced, placed)) < len(placed)
+    assert not any(map(unplaced, drawn))
+
+
+def test_unplaced_scenes_in_a_batch():
+    configs = latent_dataset(num_scenes=20, root_seed=0, precompute_positions=True)
+    batch = SceneBatch.from_configs(configs)
+    assert [scene_hash(c) for c in batch] == [scene_hash(c) for c in configs]
+
+    batch = sample_batch(num_scenes=20, seed=0, precompute_positions=True)
+    assert len(batch) == 20
+    assert 0 < sum(map(unplaced, batch)) < len(batch)
+
+
+def test_scene_seeds_are_unique():
+    for root_seed in (0, 1, 2**40):
+        seeds = [scene_seed(root_seed, i) for i in range(200000)]
+        assert len(set(seeds)) == len(seeds)
+        assert all(0 <= seed < 2147483647 for seed in seeds)
+    assert scene_seed(0, 5) == scene_seed(0, 5)
+    assert scene_seed(0, 5) != scene_seed(1, 5)
+    with pytest.raises(ValueError):
+        scene_seed(0, 2147483647)
+
+
+@pytest.mark.parametrize("kwargs", [
+    dict(root_seed=0),
+    dict(seeds=[5, 17, 2**31 - 2, 0, 123456]),
+    dict(root_seed=3, precompute_positions=True),
+    dict(root_seed=4, num_views=2, camera_jitter=[0.5, 0.5, 0.2]),
+])
+def test_streamed_scenes_equal_the_list(kwargs):
+    num_scenes = len(kwargs.get("seeds", range(12)))
+    configs = latent_dataset(num_scenes=num_scenes, **kwargs)
+    stream = latent_dataset(num_scenes=num_scenes, stream=True, **kwargs)
+    expected = [scene_hash(c) for c in configs]
+
+    assert len(stream) == num_scenes
+    assert [scene_hash(c) for c in stream] == expected
+    assert [scene_hash(stream[i]) for i in reversed(range(num_scenes))] == expected[::-1]
+    assert [scene_hash(stream[i]) for i in range(-num_scenes, 0)] == expected
+    assert [scene_hash(c) for c in stream[2:9:3]] == expected[2:9:3]
+    assert [scene_hash(c) for c in stream[3:][1:4]] == expected[4:7]
+
+
+def test_root_seeds_equal_the_list():
+    seeds = RootSeeds(7, range(100))
+    expected = [scene_seed(7, i) for i in range(100)]
+    assert list(seeds) == expected
+    assert [seeds[i] for i in range(-100, 0)] == expected
+    assert list(seeds[10:50:4]) == expected[10:50:4]
+    assert list(seeds[5:][5:10]) == expected[10:15]
+    assert [int(c["seed"]) for c in latent_dataset(num_scenes=100, root_seed=7, stream=True)[::10]] == expected[::10]
@@ -0,0 +1,74 @@
+"""
+The checks of `RenderedScenesBase.export_shards` before anything is written, against fake tables.
+"""
+import os
+from types import SimpleNamespace
+
+import pytest
+
+dj = pytest.importorskip("datajoint")
+try:
+    from renderstim.schema.templates.rendered_scenes import RenderedScenesBase, views_per_scene
+except Exception as error:  # renderstim.schema connects to the database on import
+    pytest.skip(f"renderstim.schema cannot be imported: {error}", allow_module_level=True)
+
+
+class FakeDataset:
+    def __init__(self, config):
+        self.config = config
+
+    def dataset_arg(self, name):
+        return self.config.get(name)
+
+
+class FakeDatasets:
+    """
+    LatentDataset entries by dataset_hash, restrictions other than a key are ignored.
+    """
+
+    def __init__(self, configs):
+        self.configs = configs
+
+    def __call__(self):
+        return self
+
+    def __and__(self, key):
+        if isinstance(key, dict):
+            return FakeDataset(self.configs[key["dataset_hash"]])
+        return self
+
+    def fetch(self, attribute):
+        return [dict(dataset_hash=h) for h in self.configs]
+
+
+class FakeRenderedScenes:
+    export_shards = RenderedScenesBase.export_shards
+
+    def __init__(self, configs):
+        self.scene_config_table = SimpleNamespace(master=FakeDatasets(configs))
+
+    def __and__(self, restriction):
+        return self
+
+
+VIEWS = [dict(position=[0.0, -8.0, 3.6]), dict(position=[1.0, -8.0, 3.6])]
+
+
+@pytest.mark.parametrize("config, expected", [
+    (dict(), None),
+    (dict(camera_views=VIEWS), 2),
+    (dict(num_views=3, camera_jitter=[0.5, 0.5, 0.2]), 3),
+])
+def test_views_per_scene(config, expected):
+    assert views_per_scene(FakeDataset(config)) == expected
+
+
+@pytest.mark.parametrize("configs", [
+    dict(a=dict(), b=dict(camera_views=VIEWS)),
+    dict(a=dict(camera_views=VIEWS), b=dict(num_views=3, camera_jitter=[0.5, 0.5, 0.2])),
+])
+def test_mixed_views_are_rejected_up_front(configs, tmp_path):
+    directory = str(tmp_path / "shards")
+    with pytest.raises(ValueError, match="views per scene"):
+        FakeRenderedScenes(configs).export_shards(directory, max_objects=6)
+    assert not os.path.exists(directory)
@@ -0,0 +1,138 @@
+"""
+Smoke test of a render farm worker against a fake RenderedScenes table and jobs table.
+"""
+import queue
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+dj = pytest.importorskip("datajoint")
+try:
+    from renderstim.schema.templates import farm
+    from renderstim.schema.templates.rendered_scenes import RenderedScenesBase
+except Exception as error:  # renderstim.schema connects to the database on import
+    pytest.skip(f"renderstim.schema cannot be imported: {error}", allow_module_level=True)
+
+
+KEYS = [dict(dataset_hash="d", scene_hash=f"{i:032x}") for i in range(5)]
+
+
+class FakeJobs:
+    def __init__(self):
+        self.reserved = set()
+        self.completed = []
+        self.errors = []
+
+    def reserve(self, table_name, key):
+        if key["scene_hash"] in self.reserved:
+            return False
+        self.reserved.add(key["scene_hash"])
+        return True
+
+    def complete(self, table_name, key):
+        self.reserved.discard(key["scene_hash"])
+        self.completed.append(key["scene_hash"])
+
+    def error(self, table_name, key, error_message, error_stack):
+        self.errors.append((key["scene_hash"], error_message))
+
+
+def key_queue(keys):
+    """
+    Keys as `render_farm` hands them to its workers.
+    """
+    keys_to_render = queue.Queue()
+    for key in keys:
+        keys_to_render.put(dict(key))
+    keys_to_render.put(None)
+    return keys_to_render
+
+
+def generate(config):
+    frame = dict(grayscale=np.zeros((2, 3), dtype=np.uint8), depth=np.zeros((2, 3), dtype=np.uint16))
+    return frame, dict(seed=config["seed"], timings=dict(render=0.0))
+
+
+class FakeRenderedScenes:
+    """
+    RenderedScenes with the real `insert_frame`, whose insert1 refuses direct inserts, 
+    as DataJoint does for a computed table outside of `populate`.
+    """
+
+    layer_type = "blob@rendered"
+    rows = {}
+    jobs = FakeJobs()
+    target = SimpleNamespace(database="renderstim", table_name="__rendered_scenes")
+    connection = SimpleNamespace(schemas=dict(renderstim=SimpleNamespace(jobs=jobs)), in_transaction=False)
+    insert_frame = RenderedScenesBase.insert_frame
+
+    def __and__(self, key):
+        return key["scene_hash"] in self.rows
+
+    def get_generator_fn_config(self, key):
+        return generate, dict(seed=int(key["scene_hash"], 16))
+
+    def insert1(self, row, allow_direct_insert=False):
+        if not allow_direct_insert:
+            raise dj.DataJointError(
+                "Inserts into an auto-populated table can only be done inside its make method"
+            )
+        self.rows[row["scene_hash"]] = row
+
+
+@pytest.fixture(autouse=True)
+def fresh_tables():
+    FakeRenderedScenes.rows.clear()
+    FakeRenderedScenes.jobs.__init__()
+
+
+def drain(messages):
+    reported = []
+    while not messages.empty():
+        reported.append(messages.get())
+    return reported
+
+
+def test_farm_worker_renders_every_key():
+    messages = queue.Queue()
+    farm.farm_worker(FakeRenderedScenes, key_queue(KEYS), {}, 0, 10, 1, messages)
+
+    reported = drain(messages)
+    assert FakeRenderedScenes.jobs.errors == []
+    assert sorted(FakeRenderedScenes.rows) == [key["scene_hash"] for key in KEYS]
+    assert sorted(FakeRenderedScenes.jobs.completed) == [key["scene_hash"] for key in KEYS]
+    assert [message[0] for message in reported] == ["start", "scene"] * len(KEYS) + ["exit"]
+    assert [message[2] for message in reported[:-1:2]] == KEYS
+    assert reported[-1][1:3] == (0, True)
+
+    row = FakeRenderedScenes.rows[KEYS[0]["scene_hash"]]
+    assert row["scene"].shape == (2, 3) and row["segmentation"] is None
+
+
+def test_recycled_worker_continues():
+    messages = queue.Queue()
+    keys = key_queue(KEYS)
+    farm.farm_worker(FakeRenderedScenes, keys, {}, 0, 2, 1, messages)
+    assert len(FakeRenderedScenes.rows) == 2
+    assert drain(messages)[-1][1:3] == (0, False)
+
+    farm.farm_worker(FakeRenderedScenes, keys, {}, 1, 10, 1, messages)
+    assert len(FakeRenderedScenes.rows) == len(KEYS)
+    assert FakeRenderedScenes.jobs.errors == []
+    assert drain(messages)[-1][1:3] == (1, True)
+
+    # the queue stays closed for the workers that come after
+    farm.farm_worker(FakeRenderedScenes, keys, {}, 2, 10, 1, messages)
+    assert [message[0] for message in drain(messages)] == ["exit"]
+
+
+def test_claimed_and_rendered_keys_are_skipped():
+    FakeRenderedScenes.jobs.reserved.add(KEYS[0]["scene_hash"])
+    FakeRenderedScenes.rows[KEYS[1]["scene_hash"]] = dict(KEYS[1])
+    messages = queue.Queue()
+    farm.farm_worker(FakeRenderedScenes, key_queue(KEYS), {}, 0, 10, 1, messages)
+
+    started = [message[2] for message in drain(messages) if message[0] == "start"]
+    assert started == KEYS[2:]
+    assert FakeRenderedScenes.jobs.reserved == {KEYS[0]["scene_hash"]}
@@ -0,0 +1,279 @@
+"""
+`SceneConfig.fill` and `SceneConfig.replace` against in-memory stand-ins of the LatentDataset tables.
+"""
+import copy
+from collections.abc import Sequence
+from contextlib import contextmanager
+
+import numpy as np
+import pytest
+
+pytest.importorskip("datajoint")
+try:
+    from renderstim.schema.main import LatentDataset
+except Exception as error:  # renderstim.schema connects to the database on import
+    pytest.skip(f"renderstim.schema cannot be imported: {error}", allow_module_level=True)
+
+from renderstim.latents.hashing import scene_hash
+
+DATASET_KEY = dict(dataset_fn="renderstim.latents.dataset.latent_dataset", dataset_hash="d0", generator_fn="g")
+SCENE_KEY = (*DATASET_KEY, "scene_hash")
+
+
+class Storage:
+    """
+    Rows of a table, with its primary key and its attributes (None allows any).
+    """
+
+    def __init__(self, primary_key, attributes=None):
+        self.primary_key = primary_key
+        self.attributes = attributes
+        self.rows = []
+
+
+def predicate(restriction):
+    if isinstance(restriction, dict):
+        return lambda row: all(row[k] == v for k, v in restriction.items() if k in row)
+    if isinstance(restriction, str):
+        attribute, condition = restriction.split(" ", 1)
+        assert condition == "is not null", restriction
+        return lambda row: row.get(attribute) is not None
+    if isinstance(restriction, list):
+        alternatives = [predicate(r) for r in restriction]
+        return lambda row: any(p(row) for p in alternatives)
+    # a relation: semijoin on its primary key
+    keys = [tuple(row[k] for k in restriction.primary_key) for row in restriction.rows()]
+    return lambda row: tuple(row.get(k) for k in restriction.primary_key) in keys
+
+
+class Relation:
+    """
+    Just enough of a DataJoint table / query: restriction (&, -), fetch, insert, delete_quick.
+    """
+
+    def __init__(self, storage, master=None, connection=None):
+        self.storage = storage
+        self.master = master
+        self.connection = connection
+        self.predicates = ()
+
+    def __call__(self):
+        return self
+
+    @property
+    def primary_key(self):
+        return self.storage.primary_key
+
+    def rows(self):
+        return [row for row in self.storage.rows if all(p(row) for p in self.predicates)]
+
+    def __len__(self):
+        return len(self.rows())
+
+    def __and__(self, restriction):
+        restricted = copy.copy(self)
+        restricted.predicates = self.predicates + (predicate(restriction),)
+        return restricted
+
+    def __sub__(self, other):
+        keep = predicate(other)
+        restricted = copy.copy(self)
+        restricted.predicates = self.predicates + ((lambda row: not keep(row)),)
+        return restricted
+
+    def proj(self):
+        return self
+
+    def _column(self, rows, attribute):
+        if attribute == "KEY":
+            return [{k: row[k] for k in self.primary_key} for row in rows]
+        # fresh copies, as deserialized from the database
+        return np.array([copy.deepcopy(row.get(attribute)) for row in rows], dtype=object)
+
+    def fetch(self, *attributes, as_dict=False):
+        rows = self.rows()
+        if as_dict:
+            return [dict(row) for row in rows]
+        columns = [self._column(rows, attribute) for attribute in attributes]
+        return columns[0] if len(columns) == 1 else columns
+
+    def fetch1(self, *attributes):
+        rows = self.rows()
+        assert len(rows) == 1, f"fetch1 on {len(rows)} rows"
+        values = [self._column(rows, attribute)[0] for attribute in attributes]
+        return values[0] if len(values) == 1 else values
+
+    def insert(self, rows):
+        keys = {tuple(row[k] for k in self.primary_key) for row in self.storage.rows}
+        for row in rows:
+            if self.storage.attributes is not None and set(row) - set(self.storage.attributes):
+                raise KeyError(f"Unknown attributes {set(row) - set(self.storage.attributes)}")
+            key = tuple(row[k] for k in self.primary_key)
+            if key in keys:
+                raise KeyError(f"Duplicate entry {key}")
+            keys.add(key)
+        self.storage.rows.extend(dict(row) for row in rows)
+
+    def delete_quick(self):
+        rows = self.rows()
+        self.storage.rows = [row for row in self.storage.rows if all(row is not r for r in rows)]
+
+
+class Interrupted(Sequence):
+    """
+    Scene configs that raise KeyboardInterrupt when more than limit of them are built.
+    """
+
+    def __init__(self, scenes, limit):
+        self.scenes = scenes
+        self.limit = limit
+        self.built = 0
+
+    def __len__(self):
+        return len(self.scenes)
+
+    def __getitem__(self, index):
+        if self.built == self.limit:
+            raise KeyboardInterrupt
+        self.built += 1
+        return self.scenes[index]
+
+
+class Datasets(Relation):
+    fn_config = LatentDataset.fn_config
+    dataset_arg = LatentDataset.dataset_arg
+    num_scenes = LatentDataset.num_scenes
+    interrupt_after = None
+
+    def get_scene_configs(self, key=None, stream=False, **overrides):
+        scenes = LatentDataset.get_scene_configs(self, key, stream, **overrides)
+        return scenes if self.interrupt_after is None else Interrupted(scenes, self.interrupt_after)
+
+
+class SceneConfig(Relation):
+    fill = LatentDataset.SceneConfig.fill
+    replace = LatentDataset.SceneConfig.replace
+
+
+class SceneLatents(Relation):
+    insert_configs = LatentDataset.SceneLatents.insert_configs
+
+
+class Connection:
+    """
+    `transaction` rolls the storages back if its block raises, like a chunk's transaction.
+    """
+
+    def __init__(self):
+        self.storages = []
+
+    @property
+    @contextmanager
+    def transaction(self):
+        saved = [list(storage.rows) for storage in self.storages]
+        try:
+            yield
+        except BaseException:
+            for storage, rows in zip(self.storages, saved):
+                storage.rows = rows
+            raise
+
+
+def tables(**dataset_config):
+    """
+    The SceneConfig stand-in of a single dataset with the given dataset_config.
+    """
+    connection = Connection()
+    master = Datasets(Storage(tuple(DATASET_KEY), (*DATASET_KEY, "dataset_config")), connection=connection)
+    master.insert([dict(DATASET_KEY, dataset_config=dataset_config)])
+    master.SceneLatents = SceneLatents(Storage(SCENE_KEY), master, connection)
+    master.ObjectLatents = Relation(Storage((*SCENE_KEY, "object_id")), master, connection)
+    master.Replaced = Relation(
+        Storage(SCENE_KEY, (*SCENE_KEY, "scene_index", "replacement_hash")), master, connection
+    )
+    scene_configs = SceneConfig(Storage(SCENE_KEY, (*SCENE_KEY, "scene_config")), master, connection)
+    connection.storages.extend(table.storage for table in (
+        master, master.SceneLatents, master.ObjectLatents, master.Replaced, scene_configs
+    ))
+    return scene_configs
+
+
+def indices(table):
+    return sorted(i for i in table.master.SceneLatents.fetch("scene_index") if i is not None)
+
+
+def test_duplicates_within_a_chunk_are_skipped():
+    table = tables(seeds=[1, 2, 1, 3])
+    table.fill(chunk_size=10)
+
+    assert len(table) == 3
+    assert len(table.master.SceneLatents) == 3
+    assert indices(table) == []
+
+
+def test_fill_twice_fails():
+    table = tables(num_scenes=3, root_seed=0)
+    table.fill()
+    with pytest.raises(AssertionError):
+        table.fill()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 10])
+def test_interrupted_fill_resumes(chunk_size):
+    complete = tables(num_scenes=25, root_seed=0)
+    complete.fill(chunk_size=chunk_size)
+
+    table = tables(num_scenes=25, root_seed=0)
+    table.master.interrupt_after = 2 * chunk_size
+    with pytest.raises(KeyboardInterrupt):
+        table.fill(chunk_size=chunk_size)
+    assert len(table) == len(table.master.SceneLatents) == 2 * chunk_size
+
+    table.master.interrupt_after = None
+    table.fill(chunk_size=chunk_size, resume=True)
+    assert set(table.fetch("scene_hash")) == set(complete.fetch("scene_hash"))
+    assert dict(zip(*table.master.SceneLatents.fetch("scene_hash", "scene_index"))) == dict(
+        zip(*complete.master.SceneLatents.fetch("scene_hash", "scene_index"))
+    )
+
+
+def test_interrupted_fill_without_root_seed_resumes():
+    table = tables(num_scenes=12)
+    table.master.interrupt_after = 5
+    with pytest.raises(KeyboardInterrupt):
+        table.fill(chunk_size=5)
+    assert len(table) == 5
+
+    table.master.interrupt_after = None
+    table.fill(chunk_size=5, resume=True)
+    assert len(table) == len(table.master.SceneLatents) == 12
+    assert indices(table) == []
+
+
+def test_latents_only():
+    table = tables(num_scenes=4, root_seed=0)
+    table.fill(store_configs=False)
+
+    assert list(table.fetch("scene_config")) == [None] * 4
+    configs = table.master().get_scene_configs(seeds=[int(s) for s in table.master.SceneLatents.fetch("seed")])
+    assert {scene_hash(c) for c in configs} == set(table.fetch("scene_hash"))
+
+
+def test_resume_leaves_out_replaced_scenes():
+    table = tables(num_scenes=25, root_seed=0)
+    table.master.interrupt_after = 15
+    with pytest.raises(KeyboardInterrupt):
+        table.fill(chunk_size=5)
+    table.master.interrupt_after = None
+
+    bad = list(table.fetch("scene_hash")[:2])
+    bad_indices = {h: i for h, i in zip(*table.master.SceneLatents.fetch("scene_hash", "scene_index")) if h in bad}
+    replacements = table.replace(bad_hashes=bad)
+    assert len(table) == 15
+    assert dict(zip(*table.master.Replaced.fetch("scene_hash", "scene_index"))) == bad_indices
+
+    table.fill(chunk_size=5, resume=True)
+    assert len(table) == 25
+    assert not set(table.fetch("scene_hash")) & set(bad)
+    assert set(replacements.values()) <= set(table.fetch("scene_hash"))
+    assert indices(table) == sorted(set(range(25)) - set(bad_indices.values()))
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from renderstim.latents.dataset import latent_dataset
+from renderstim.latents.hashing import hash_changes, scene_hash, scene_hashes
+
+
+def blob_round_trip(value):
+    """
+    The types a config comes back with from a DataJoint blob: numpy scalars, tuples as 
+    lists and lists of numbers as arrays.
+    """
+    if isinstance(value, dict):
+        return {k: blob_round_trip(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        if value and all(type(v) in (int, float) for v in value):
+            return np.array(value)
+        return [blob_round_trip(v) for v in value]
+    if type(value) is int:
+        return np.int64(value)
+    if type(value) is float:
+        return np.float64(value)
+    return value
+
+
+@pytest.mark.parametrize("a, b", [
+    (1, np.int32(1)),
+    (0.5, np.float64(0.5)),
+    (True, np.bool_(True)),
+    ("cube", np.str_("cube")),
+    ([1, 2, 3], np.array([1, 2, 3])),
+    ([1, 2, 3], np.array([1, 2, 3], dtype=np.int32)),
+    ([1, 2, 3], np.array([1, 2, 3], dtype=np.uint8)),
+    ([1, 2, 3], (1, 2, 3)),
+    ([1, 2, 3], [np.int64(1), np.int16(2), 3]),
+    ([0.5, 1.5], np.array([0.5, 1.5])),
+    ([0.5, 1.5], (np.float64(0.5), 1.5)),
+    ([np.float32(0.1)], np.array([0.1], dtype=np.float32)),
+    ([True, False], np.array([True, False])),
+    ([[1.0, 2.0], [3.0, 4.0]], np.array([[1.0, 2.0], [3.0, 4.0]])),
+    ([[1.0, 2.0], [3.0, 4.0]], [np.array([1.0, 2.0]), (3.0, 4.0)]),
+    (["cube", "torus"], np.array(["cube", "torus"])),
+    ([], np.array([])),
+    ([1, "a"], np.array([1, "a"], dtype=object)),
+    ([2**63], np.array([2**63], dtype=np.uint64)),
+    (dict(a=1, b=[1.0]), dict(b=np.array([1.0]), a=np.int8(1))),
+])
+def test_equivalent_values_hash_alike(a, b):
+    assert scene_hash(a) == scene_hash(b)
+
+
+@pytest.mark.parametrize("a, b", [
+    (1, 1.0),
+    ([1, 2], [1.0, 2.0]),
+    ([1, 2.0], [1.0, 2.0]),
+    ([1, 2], [2, 1]),
+    ([[1, 2]], [1, 2]),
+    ("1", 1),
+    (None, []),
+    (dict(a=1), dict(a=[1])),
+])
+def test_different_values_hash_differently(a, b):
+    assert scene_hash(a) != scene_hash(b)
+
+
+def test_configs_survive_a_blob_round_trip():
+    configs = latent_dataset(num_scenes=20, root_seed=0, num_views=2, camera_jitter=[0.5, 0.5, 0.2])
+    assert scene_hashes(configs) == scene_hashes(map(blob_round_trip, configs))
+    assert len(set(scene_hashes(configs))) == len(configs)
+
+
+def test_hash_changes_reports_the_stale_rows():
+    configs = latent_dataset(num_scenes=5, root_seed=0)
+    rows = [(dict(dataset_hash="d", scene_hash=scene_hash(c)), c) for c in configs]
+    rows[1] = (dict(rows[1][0], scene_hash="made with make_hash"), configs[1])
+    rows[3] = (rows[3][0], dict(configs[3], num_objects=configs[3]["num_objects"] + 1))
+
+    changes = hash_changes(rows)
+
+    assert [change["scene_hash"] for change in changes] == [rows[1][0]["scene_hash"], rows[3][0]["scene_hash"]]
+    assert changes[0] == dict(dataset_hash="d", scene_hash="made with make_hash", new_hash=scene_hash(configs[1]))
+    assert hash_changes(rows[:1]) == []
+
+
+def test_batched_hashes_equal_the_single_hashes():
+    configs = latent_dataset(num_scenes=50, root_seed=0, num_views=2, camera_jitter=[0.5, 0.5, 0.2])
+    configs += [dict(configs[0], sun_position=[1.0, 2.0, 3.0]), dict(a=1), {1: "a"}, [1, 2]]
+    assert scene_hashes(configs) == [scene_hash(c) for c in configs]
+    assert scene_hashes(iter(configs)) == scene_hashes(configs)
@@ -0,0 +1,80 @@
+"""
+`place_object` against simulators that decide the overlaps themselves.
+"""
+import numpy as np
+import pytest
+
+from renderstim.benchmarks.stub import StubObject
+from renderstim.latents.placement import place_object
+
+SPAWN_REGION = [[-1, -1, 0], [1, 1, 1]]
+
+
+class CountingSimulator:
+    """
+    Overlaps with any of the given AABBs, or with none if exact is None.
+    """
+
+    def __init__(self, exact=None):
+        self.exact = [] if exact is None else exact
+        self.checks = 0
+
+    def check_overlap(self, obj):
+        self.checks += 1
+        lo, hi = obj.aabbox
+        return any(np.all(lo < b_max) and np.all(hi > b_min) for b_min, b_max in self.exact)
+
+
+def test_clear_candidates_skip_the_simulator():
+    simulator = CountingSimulator()
+    obj = StubObject("cube", scale=0.1)
+    trials = place_object(obj, simulator, SPAWN_REGION, [], np.random.RandomState(0))
+    assert trials == dict(proposals=1, physics_checks=0)
+    assert simulator.checks == 0
+
+
+def test_aabb_overlap_is_not_a_rejection():
+    # the placed AABB blocks the whole region, but the simulator finds no exact overlap
+    placed = [np.array([[-2, -2, -1], [2, 2, 2]])]
+    simulator = CountingSimulator()
+    obj = StubObject("cube", scale=0.1)
+    trials = place_object(obj, simulator, SPAWN_REGION, placed, np.random.RandomState(0))
+    assert trials == dict(proposals=1, physics_checks=1)
+
+
+def test_exact_overlaps_are_rejected():
+    placed = [np.array([[-1, -1, 0], [0, 1, 1]])]
+    simulator = CountingSimulator(exact=placed)
+    for seed in range(20):
+        obj = StubObject("cube", scale=0.1)
+        place_object(obj, simulator, SPAWN_REGION, placed, np.random.RandomState(seed))
+        assert obj.aabbox[0][0] >= 0
+
+
+def test_floor_is_checked_with_the_simulator():
+    floor = [np.array([[-1, -1, 0], [1, 1, 0.5]])]
+    simulator = CountingSimulator(exact=floor)
+    for seed in range(20):
+        obj = StubObject("cube", scale=0.1)
+        place_object(obj, simulator, SPAWN_REGION, [], np.random.RandomState(seed), floor_top=0.5)
+        assert obj.aabbox[0][2] >= 0.5
+    assert simulator.checks > 0
+
+
+def test_deterministic():
+    placed = [np.array([[-1, -1, 0], [0.5, 0.5, 1]])]
+    positions = []
+    for _ in range(2):
+        obj = StubObject("cube", scale=0.1)
+        place_object(obj, CountingSimulator(exact=placed), SPAWN_REGION, placed, np.random.RandomState(3))
+        positions.append(np.asarray(obj.position))
+    np.testing.assert_array_equal(*positions)
+
+
+def test_max_trials():
+    placed = [np.array([[-2, -2, -1], [2, 2, 2]])]
+    simulator = CountingSimulator(exact=placed)
+    with pytest.raises(RuntimeError):
+        place_object(StubObject("cube", scale=0.1), simulator, SPAWN_REGION, placed,
+                     np.random.RandomState(0), max_trials=50)
+    assert simulator.checks == 50
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from renderstim.generators.raster import floor_hits, preview_positions, raster_frame, raster_scene
+from renderstim.latents.dataset import latent_dataset
+
+RESOLUTION = [32, 24]  # width, height
+
+
+def small_config(**kwargs):
+    return latent_dataset(num_scenes=1, root_seed=0, resolution=RESOLUTION, **kwargs)[0]
+
+
+def only_object(config, index):
+    """
+    config with only its object at index.
+    """
+    config = dict(config, num_objects=1)
+    for key in ("object_shapes", "object_scales", "object_quaternions", "object_materials"):
+        config[key] = config[key][index:index + 1]
+    return config
+
+
+@pytest.mark.parametrize("kwargs, views", [
+    (dict(), ()),
+    (dict(num_views=3, camera_jitter=[0.5, 0.5, 0.2]), (3,)),
+])
+def test_layer_shapes_and_dtypes(kwargs, views):
+    frame, config = raster_scene(small_config(**kwargs))
+    image = (*views, 24, 32)
+    expected = dict(
+        grayscale=(image, np.uint8),
+        segmentation=((*image, 1), np.uint8),
+        object_coordinates=((*image, 3), np.uint8),
+        normal=((*image, 3), np.uint8),
+        depth=(image, np.uint16),
+    )
+    assert {layer: (array.shape, array.dtype) for layer, array in frame.items()} == expected
+
+    depth_scaling = config["depth_scaling"] if views else [config["depth_scaling"]]
+    assert len(depth_scaling) == (views[0] if views else 1)
+    assert all(0 < scaling["min_depth"] < scaling["max_depth"] for scaling in depth_scaling)
+    assert config["renderer"] == "raster" and len(config["object_positions"]) == config["num_objects"]
+
+
+def test_only_the_output_layers_are_rendered():
+    frame, _ = raster_scene(small_config(output_layers=["rgba", "depth"]))
+    assert sorted(frame) == ["depth", "grayscale"]
+
+
+def test_segmentation_follows_the_object_order():
+    config = small_config()
+    positions = np.asarray(preview_positions(config))
+    segmentation = raster_frame(config, positions)["segmentation"][..., 0]
+    assert set(np.unique(segmentation)) <= set(range(config["num_objects"] + 1))
+
+    for i in range(config["num_objects"]):
+        alone = raster_frame(only_object(config, i), positions[i:i + 1])["segmentation"][..., 0]
+        assert set(np.unique(alone)) <= {0, 1}
+        # object i is labeled i + 1, where it is not hidden by the others
+        assert np.all(alone[segmentation == i + 1] == 1)
+
+
+def test_depth_is_finite_where_the_floor_is_visible():
+    config = small_config()
+    positions = np.asarray(preview_positions(config))
+    frame = raster_frame(config, positions, layers=["segmentation", "depth"])
+    depth = frame["depth"][..., 0]
+    floor, _ = floor_hits(config)
+    floor = floor.reshape(depth.shape)
+
+    objects = frame["segmentation"][..., 0] > 0
+    visible = np.isfinite(floor) & ~objects
+    assert visible.any() and objects.any()
+    assert np.all(np.isfinite(depth))
+    np.testing.assert_allclose(depth[visible], floor[visible], rtol=1e-5)
+    assert np.all(depth[objects] <= floor[objects] * (1 + 1e-5))  # objects are in front of the floor
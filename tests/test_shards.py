@@ -0,0 +1,78 @@
+import threading
+
+import numpy as np
+import pytest
+
+from renderstim.shards import ShardReader, ShardWriter
+
+NUM_ROWS = 23
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    rng = np.random.default_rng(0)
+    columns = dict(
+        scene=rng.integers(0, 256, size=(NUM_ROWS, 4, 6), dtype=np.uint8),
+        seed=np.arange(NUM_ROWS, dtype=np.int64),
+        scene_hash=np.array([f"{i:032x}" for i in range(NUM_ROWS)]),
+    )
+    # chunks that end inside and on the shard boundaries
+    with ShardWriter(str(tmp_path), shard_size=5) as writer:
+        for start, stop in [(0, 3), (3, 10), (10, 11), (11, NUM_ROWS)]:
+            writer.write({column: values[start:stop] for column, values in columns.items()})
+    return ShardReader(str(tmp_path)), columns
+
+
+def assert_rows_equal(rows, columns, indices):
+    assert set(rows) == set(columns)
+    for column, values in columns.items():
+        assert rows[column].dtype == values.dtype
+        np.testing.assert_array_equal(rows[column], values[indices])
+
+
+def test_read_returns_the_written_rows(dataset):
+    reader, columns = dataset
+    assert len(reader) == NUM_ROWS
+    assert len(reader.index["shards"]) == 5
+
+    assert_rows_equal(reader.read(0, NUM_ROWS), columns, slice(None))
+    assert_rows_equal(reader.read(4, 12), columns, slice(4, 12))
+    assert_rows_equal(reader.read(20, 100), columns, slice(20, None))
+    assert_rows_equal(reader[3:17:4], columns, slice(3, 17, 4))
+    assert_rows_equal(reader.read(7, 7), columns, slice(7, 7))
+    assert reader[-1]["seed"] == NUM_ROWS - 1
+
+
+def test_take(dataset):
+    reader, columns = dataset
+    indices = np.random.default_rng(1).permutation(NUM_ROWS)
+    assert_rows_equal(reader.take(indices), columns, indices)
+    assert_rows_equal(reader.take([-1, 0, -NUM_ROWS]), columns, [-1, 0, -NUM_ROWS])
+
+    empty = reader.take([])
+    assert_rows_equal(empty, columns, slice(0, 0))
+    assert empty["scene"].shape == (0, 4, 6)
+
+    for index in (NUM_ROWS, -NUM_ROWS - 1):
+        with pytest.raises(IndexError):
+            reader.take([0, index])
+
+
+@pytest.mark.parametrize("batch_size, prefetch", [(4, 2), (5, 1), (100, 2)])
+def test_iterate(dataset, batch_size, prefetch):
+    reader, columns = dataset
+    batches = list(reader.iterate(batch_size=batch_size, prefetch=prefetch, start=2))
+    assert all(len(batch["seed"]) <= batch_size for batch in batches)
+    assert_rows_equal(
+        {column: np.concatenate([batch[column] for batch in batches]) for column in columns},
+        columns, slice(2, None)
+    )
+
+
+def test_leaving_iterate_early_stops_its_thread(dataset):
+    reader, columns = dataset
+    threads = threading.active_count()
+    batches = reader.iterate(batch_size=1, prefetch=1)
+    assert_rows_equal(next(batches), columns, slice(0, 1))
+    batches.close()
+    assert threading.active_count() == threads
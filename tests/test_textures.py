@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from renderstim.latents.textures import (
+    CUBE_FACE_UV, TEXTURE_PARAMS, bake_texture, get_texture, new_texture, texture_pixels, 
+    texture_sizes, visible_floor
+)
+
+# a camera 10 units above the floor's top face looking (almost) straight down, 
+# so that a square of 2 * 10 * 16 / 35 units of the 20 x 20 face fills the image
+TOP_DOWN = dict(
+    resolution=(256, 256), 
+    camera_position=(0.0, 0.0, 10.01), 
+    camera_look_at=(0.0, 1e-6, 0.0), 
+    camera_focal_length=35.0, 
+    camera_sensor_width=32.0, 
+    floor_scale=(10.0, 10.0, 0.01), 
+    floor_position=(0.0, 0.0, 0.0)
+)
+
+
+@pytest.mark.parametrize("type", sorted(TEXTURE_PARAMS))
+def test_bake_texture_matches_texture_pixels(type):
+    texture = new_texture(get_texture(type, np.random.RandomState(0), size=16))
+    expected = np.asarray(texture_pixels(texture, x=24, y=16), dtype=np.float32).reshape(24, 16, 4)
+
+    np.testing.assert_array_equal(bake_texture(texture, x=24, y=16), expected)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 16, 40, 10**6])
+def test_bake_texture_chunks(chunk_size):
+    texture = new_texture(get_texture("MARBLE", np.random.RandomState(1), size=16))
+    expected = np.asarray(texture_pixels(texture, x=9, y=16), dtype=np.float32).reshape(9, 16, 4)
+
+    np.testing.assert_array_equal(bake_texture(texture, x=9, y=16, chunk_size=chunk_size), expected)
+
+
+def test_visible_floor_top_down():
+    image_fraction, floor_fraction = visible_floor(**TOP_DOWN)
+    side = 2 * 10 * 16 / 35
+    assert image_fraction == 1.0
+    assert floor_fraction == pytest.approx((side / 20) ** 2, rel=0.05)
+
+
+@pytest.mark.parametrize("texels_per_pixel", [0.25, 0.5, 1.0])
+def test_texture_sizes_top_down(texels_per_pixel):
+    background, objects = texture_sizes(texels_per_pixel, **TOP_DOWN)
+
+    # texels_per_pixel texels per pixel side: 256 * texels_per_pixel texels across the 
+    # part of the face in view, and the face spans CUBE_FACE_UV of the texture side
+    side = 2 * 10 * 16 / 35
+    expected = texels_per_pixel * 256 * (20 / side) / CUBE_FACE_UV
+    assert background == pytest.approx(expected, rel=0.05)
+    assert background % 16 == 0
+
+    # an object of scale 1.2 wrapped once, with pixels of side / 256 units
+    assert objects == 16 * np.ceil(texels_per_pixel * 2 * np.pi * 1.2 / (side / 256) / 16)
+
+
+def test_texture_sizes_are_clipped():
+    assert texture_sizes(100.0, **TOP_DOWN) == (4096, 4096)
+    assert texture_sizes(1e-6, **TOP_DOWN) == (16, 16)
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from renderstim.latents.utils import array_from_png_data, get_array_from_png
+
+
+def frame(dtype, channels, rng=np.random.default_rng(0)):
+    shape = (7, 5, channels)
+    if np.issubdtype(dtype, np.floating):
+        data = rng.uniform(0, 1, size=shape)
+        data[0, 0] = 0.0
+        data[-1, -1] = 1.0
+        return data.astype(dtype)
+    high = 256 if dtype == np.uint8 else 65536
+    return rng.integers(0, high, size=shape).astype(dtype)
+
+
+@pytest.mark.parametrize("channels", [1, 2, 3, 4])
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16, np.uint32, np.float32, np.float64])
+def test_array_from_png_data_matches_png_round_trip(tmp_path, dtype, channels):
+    data = frame(dtype, channels)
+    expected = get_array_from_png(data, str(tmp_path / "frame.png"))
+    result = array_from_png_data(data)
+
+    assert result.dtype == expected.dtype
+    np.testing.assert_array_equal(result, expected)
+
+
+@pytest.mark.parametrize("data", [
+    np.full((2, 2, 1), 70000, dtype=np.uint32),
+    np.full((2, 2, 1), 1.5, dtype=np.float32),
+    np.full((2, 2, 1), -1, dtype=np.int16),
+])
+def test_array_from_png_data_raises_like_png_round_trip(tmp_path, data):
+    with pytest.raises(Exception) as expected:
+        get_array_from_png(data, str(tmp_path / "frame.png"))
+    with pytest.raises(expected.type):
+        array_from_png_data(data)
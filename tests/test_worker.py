@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from renderstim.benchmarks.stub import STUB_BOUNDS, StubBlender
+from renderstim.generators import RenderWorker, asset_source, render_scene
+from renderstim.generators.render import apply_render_profile, render_settings
+from renderstim.latents.dataset import RENDER_PROFILES, latent_dataset
+
+
+@pytest.fixture
+def manifest(tmp_path, monkeypatch):
+    path = tmp_path / "KuBasic.json"
+    path.write_text(json.dumps(dict(assets={
+        asset_id: dict(kwargs=dict(bounds=bounds)) for asset_id, bounds in STUB_BOUNDS.items()
+    })))
+    monkeypatch.setenv("RENDERSTIM_KUBASIC_MANIFEST", str(path))
+    monkeypatch.chdir(tmp_path)
+    asset_source.cache_clear()
+    yield str(path)
+    asset_source.cache_clear()
+
+
+def test_second_worker_in_the_same_process(manifest, tmp_path):
+    first, second = latent_dataset(num_scenes=2, root_seed=0, texels_per_pixel=0.25)
+
+    with RenderWorker(scratch_dir=str(tmp_path / "first")) as worker:
+        source = worker.kubasic
+        worker(first)
+    assert source.is_closed
+
+    with RenderWorker(scratch_dir=str(tmp_path / "second")) as worker:
+        assert worker.kubasic is not source
+        assert worker.kubasic.manifest == manifest
+        frame, config = worker(second)
+    assert len(config["object_positions"]) == config["num_objects"]
+
+
+def test_render_scene_after_a_worker(manifest, tmp_path):
+    first, second = latent_dataset(num_scenes=2, root_seed=0, texels_per_pixel=0.25)
+
+    with RenderWorker(scratch_dir=str(tmp_path / "worker")) as worker:
+        worker(first)
+
+    frame, config = render_scene(second, threads=1)
+    assert not asset_source().is_closed
+    assert len(config["object_positions"]) == config["num_objects"]
+
+
+def test_asset_source_follows_the_manifest_variable(manifest, tmp_path, monkeypatch):
+    source = asset_source()
+    assert asset_source() is source
+    assert asset_source(manifest) is source
+
+    other = tmp_path / "other.json"
+    other.write_text(open(manifest).read())
+    monkeypatch.setenv("RENDERSTIM_KUBASIC_MANIFEST", str(other))
+    assert asset_source() is not source
+    assert asset_source().manifest == str(other)
+
+
+def test_legacy_configs_keep_the_render_settings():
+    renderer = StubBlender()
+    defaults = render_settings(renderer)
+    assert defaults == RENDER_PROFILES["quality"]
+
+    apply_render_profile(renderer, None, threads=2)
+    assert render_settings(renderer) == defaults
+    assert renderer.blender_scene.render.threads == 2
+
+    apply_render_profile(renderer, RENDER_PROFILES["fast"])
+    assert render_settings(renderer) == RENDER_PROFILES["fast"]
+
+
+def test_worker_restores_the_render_settings_for_legacy_configs(manifest, tmp_path):
+    fast, legacy = latent_dataset(num_scenes=2, root_seed=0, texels_per_pixel=0.25, render_profile="fast")
+    del legacy["render_profile"]
+
+    with RenderWorker(scratch_dir=str(tmp_path / "worker"), threads=1) as worker:
+        defaults = render_settings(worker.renderer)
+        worker(fast)
+        assert render_settings(worker.renderer) == RENDER_PROFILES["fast"]
+        worker(legacy)
+        assert render_settings(worker.renderer) == defaults